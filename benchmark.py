@@ -0,0 +1,264 @@
+import argparse
+import calendar
+import inspect
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import tracemalloc
+from argparse import Namespace
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from source.preprocessing.synthetic_data import HIST_LEN_DISTRIBUTIONS, write_ml_ratings, generate_dpg_records, \
+    write_dpg_raw, write_dpg_sample
+
+# preprocessing benchmark on synthetic data
+#
+# times & memory-profiles each stage and writes a JSON report, e.g.
+#   python benchmark.py --datasets ml-1m dpg --n_users 5000 --report bench/$(git rev-parse --short HEAD).json
+#   python benchmark.py --report new.json --compare old.json
+#   git worktree add ../baseline <commit> && python benchmark.py --repo ../baseline --report old.json
+
+DPG_TIME_THRESHOLD = "23-11-2019 23:59:59"
+
+
+class StageTimer(object):
+    """
+    Runs stages & collects wall time, peak traced memory (Python & numpy allocations) and max RSS
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.results = OrderedDict()
+
+    def run(self, name, func):
+        if self.trace_memory:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        out = func()
+        elapsed = time.perf_counter() - t0
+        stats = {'time_s': round(elapsed, 4)}
+        if self.trace_memory:
+            stats['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 2)
+            tracemalloc.stop()
+        # ru_maxrss is in KB on Linux
+        stats['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+        self.results[name] = stats
+        print("{:<36} {:>9.3f}s {}".format(name, elapsed, ' '.join('{}={}'.format(k, v) for k, v in stats.items()
+                                                                if k != 'time_s')))
+        return out
+
+
+def get_git_commit(repo):
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=str(repo),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def use_tree(repo):
+    """
+    Imports the preprocessing code of the tree at `repo` instead of this one, e.g. a git worktree of an older commit
+    """
+    names = {path.stem for path in repo.iterdir() if path.suffix == '.py' or path.joinpath('__init__.py').is_file()}
+    for name in list(sys.modules):
+        if name.split('.')[0] in names:
+            del sys.modules[name]
+    sys.path.insert(0, str(repo))
+
+
+def ml_args():
+    return Namespace(min_rating=0, min_uc=5, min_sc=0, filter_method='single_pass', split='leave_one_out',
+                     dataset_split_seed=98765, eval_set_size=None)
+
+
+def dpg_args(config):
+    return Namespace(split='time_threshold', min_hist_len=config.min_hist_len, use_article_content=True,
+                     pt_news_encoder=None, incl_time_stamp=True, len_time_vec=4, dataloader_random_seed=0.0,
+                     train_method='masked_item', time_threshold=DPG_TIME_THRESHOLD, normalise_time_stamps='standard',
+                     validation_portion=0.1, dpg_increment_path=None, dpg_prep_engine='columnar', language='dutch',
+                     min_counts_for_vocab=2, max_article_len=30, max_vocab_size=30000, dim_art_emb=300,
+                     lower_case=False, pd_vocab=None, path_pt_news_enc=None, bert_feature_method=['last_cls', '0'],
+                     pt_art_emb_path=None)
+
+
+def dpg_time_threshold():
+    # parsed here, as time_stamp2unix of older trees depends on the arrow version
+    return calendar.timegm(time.strptime(DPG_TIME_THRESHOLD, '%d-%m-%Y %H:%M:%S'))
+
+
+def sample_negatives(timer, prefix, train, val, test, user_count, item_set, sample_size, save_folder):
+    # random negatives for the test items (one list per user) & for every position of the train sequences
+    from dataloaders.negative_samplers import NEGATIVE_SAMPLERS
+
+    sampler_cls = NEGATIVE_SAMPLERS['random']
+    # older trees only have the default (python) engine
+    engines = [None, 'numpy'] if 'engine' in inspect.signature(sampler_cls.__init__).parameters else [None]
+    seq_lengths = {user: len(train[user]) for user in train}
+    for mode, stage, lengths in [('test', 'negatives', None), ('train', 'negatives_per_position', seq_lengths)]:
+        for engine in engines:
+            kwargs = {} if engine is None else {'engine': engine}
+            sampler = sampler_cls(mode, train, val, test, user_count, item_set, sample_size, 42, lengths, save_folder,
+                                  **kwargs)
+            timer.run('{}/{}{}'.format(prefix, stage, '' if engine is None else '_' + engine),
+                      sampler.generate_negative_samples)
+
+
+def generate_ml(timer, code, config):
+    from datasets import DATASETS
+
+    dataset = DATASETS[code](ml_args())
+    timer.run(code + '/generate', lambda: write_ml_ratings(dataset._get_rawdata_folder_path(), config.n_users,
+                                                           config.n_items, config.mean_hist_len, config.hist_len_dist,
+                                                           fmt=code, min_hist_len=dataset.min_uc, seed=config.seed))
+
+
+def generate_dpg(timer, config, work_dir):
+    """
+    Writes the raw DPG dump and returns the number of valid users in it
+    """
+    from datasets import DATASETS
+
+    raw_dir = DATASETS['DPG_nov19'](dpg_args(config))._get_rawdata_folder_path().joinpath('raw')
+    user_records, item_records = timer.run('dpg/generate', lambda: generate_dpg_records(
+        config.n_users, config.n_items, config.mean_hist_len, config.hist_len_dist, config.mean_text_len,
+        min_hist_len=config.min_hist_len, seed=config.seed))
+    timer.run('dpg/write_raw', lambda: write_dpg_raw(raw_dir, user_records, item_records))
+    # item ids of a previous run in the same work_dir are cached next to the raw data
+    if raw_dir.joinpath('all_item_ids.pkl').is_file():
+        raw_dir.joinpath('all_item_ids.pkl').unlink()
+    # sample all valid users of the raw dump
+    return len(write_dpg_sample(Path(work_dir).joinpath('dpg_valid'), user_records, item_records,
+                                dpg_time_threshold(), min_hist_len=config.min_hist_len)[0])
+
+
+def bench_ml(timer, code, config, work_dir):
+    from datasets import DATASETS
+
+    dataset = DATASETS[code](ml_args())
+    df = timer.run(code + '/load', dataset.load_ratings_df)
+    df = timer.run(code + '/filter', lambda: dataset.filter_triplets(dataset.make_implicit(df)))
+    df, umap, smap = timer.run(code + '/densify', lambda: dataset.densify_index(df))
+    train, val, test = timer.run(code + '/split', lambda: dataset.split_df(df, len(umap)))
+    sample_negatives(timer, code, train, val, test, len(umap), list(range(len(smap))), config.sample_size, work_dir)
+
+
+def bench_dpg(timer, config, work_dir, n_valid):
+    from datasets import DATASETS
+    from source.preprocessing.get_dpg_data_sample import get_data_n_rnd_users, save_data_to_dir
+    from source.preprocessing.utils_news_prep import preprocess_dpg_news_file
+
+    args = dpg_args(config)
+    dataset = DATASETS['DPG_nov19'](args)
+    raw_dir = dataset._get_rawdata_folder_path().joinpath('raw')
+
+    news_data, user_data, logging_dates = timer.run('dpg/sample', lambda: get_data_n_rnd_users(
+        str(raw_dir) + '/', n_valid, 30, config.min_hist_len, None, 1, work_dir, 'dpg_sample', dpg_time_threshold(),
+        True))
+    save_data_to_dir(work_dir, 'dpg_sample', news_data, user_data, logging_dates)
+
+    _, _, art_id2idx = timer.run('dpg/news', lambda: preprocess_dpg_news_file(
+        news_data, args.language, args.min_counts_for_vocab, args.max_article_len, args.max_vocab_size))
+
+    # user stage on the sampled pickles
+    dataset.sampledata_folder_path = str(Path(work_dir).joinpath('dpg_sample'))
+    train, val, test, u_id2idx = timer.run('dpg/users', lambda: dataset.prep_dpg_user_data(None, art_id2idx))
+    sample_negatives(timer, 'dpg', train, val, test, len(u_id2idx), list(range(len(art_id2idx))), config.sample_size,
+                     work_dir)
+
+
+def compare_reports(report, baseline):
+    print("\n{:<36} {:>10} {:>10} {:>8}".format('stage', 'time_s', 'baseline', 'ratio'))
+    for stage, stats in report['stages'].items():
+        if stage not in baseline['stages']:
+            # new stage or failed in the baseline
+            print("{:<36} {:>10.3f} {:>10}".format(stage, stats['time_s'], '-'))
+            continue
+        base = baseline['stages'][stage]
+        ratio = stats['time_s'] / base['time_s'] if base['time_s'] > 0 else float('nan')
+        line = "{:<36} {:>10.3f} {:>10.3f} {:>7.2f}x".format(stage, stats['time_s'], base['time_s'], ratio)
+        if 'peak_mb' in stats and 'peak_mb' in base:
+            line += "   peak {:.1f}MB vs {:.1f}MB".format(stats['peak_mb'], base['peak_mb'])
+        print(line)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Time & memory-profile the preprocessing stages on synthetic data')
+
+    parser.add_argument('--datasets', type=str, nargs='+', default=['ml-1m', 'ml-20m', 'dpg'],
+                        choices=['ml-1m', 'ml-20m', 'dpg'])
+    parser.add_argument('--n_users', type=int, default=2000)
+    parser.add_argument('--n_items', type=int, default=1000)
+    parser.add_argument('--mean_hist_len', type=int, default=50, help='mean number of interactions per user')
+    parser.add_argument('--hist_len_dist', type=str, default='lognormal', choices=HIST_LEN_DISTRIBUTIONS)
+    parser.add_argument('--min_hist_len', type=int, default=5)
+    parser.add_argument('--mean_text_len', type=int, default=200, help='mean number of words per article (DPG)')
+    parser.add_argument('--sample_size', type=int, default=100, help='number of negative samples per user')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no_memory', action='store_true', help='skip memory tracing, which slows down some stages')
+    parser.add_argument('--work_dir', type=str, default=None, help='folder for the synthetic data. Default: temporary folder')
+    parser.add_argument('--report', type=str, default='benchmark_report.json', help='path of the JSON report')
+    parser.add_argument('--compare', type=str, default=None, help='JSON report of a previous run to compare with')
+    parser.add_argument('--repo', type=str, default=None,
+                        help='tree whose preprocessing code is benchmarked, e.g. a git worktree of an older commit. '
+                             'The synthetic data is always written by this tree. Default: this tree')
+
+    config = parser.parse_args()
+
+    repo = Path(config.repo).resolve() if config.repo is not None else Path(__file__).resolve().parent
+    report_path = Path(config.report).resolve()
+    baseline_path = Path(config.compare).resolve() if config.compare is not None else None
+    work_dir = Path(config.work_dir if config.work_dir is not None else tempfile.mkdtemp(prefix='bench_')).resolve()
+    work_dir.mkdir(parents=True, exist_ok=True)
+    # raw & preprocessed data are stored relative to the working directory (see config.RAW_DATASET_ROOT_FOLDER)
+    os.chdir(str(work_dir))
+
+    timer = StageTimer(trace_memory=not config.no_memory)
+    n_valid = None
+    for code in config.datasets:
+        if 'dpg' == code:
+            n_valid = generate_dpg(timer, config, str(work_dir))
+        else:
+            generate_ml(timer, code, config)
+
+    if config.repo is not None:
+        use_tree(repo)
+    errors = {}
+    for code in config.datasets:
+        # keep the stages of the other datasets when a (older) tree fails on one of them
+        try:
+            if 'dpg' == code:
+                bench_dpg(timer, config, str(work_dir), n_valid)
+            else:
+                bench_ml(timer, code, config, str(work_dir))
+        except Exception as e:
+            traceback.print_exc()
+            errors[code] = repr(e)
+
+    report = {'commit': get_git_commit(repo),
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': sys.version.split()[0],
+              'numpy': np.__version__,
+              'platform': platform.platform(),
+              'config': {key: val for key, val in vars(config).items()
+                         if key not in ['report', 'compare', 'work_dir', 'repo']},
+              'stages': timer.results,
+              'errors': errors}
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with report_path.open('w') as fout:
+        json.dump(report, fout, indent=4)
+    print("Report saved to {}".format(report_path))
+
+    if baseline_path is not None:
+        with baseline_path.open('r') as fin:
+            compare_reports(report, json.load(fin))
@@ -1,20 +1,31 @@
 from abc import *
 import random
 
+from datasets.columnar import SPLIT_NAMES
+from datasets.idmap import as_id_map
+
 
 class AbstractDataloader(metaclass=ABCMeta):
     def __init__(self, args, dataset):
         self.args = args
 
+        # lazy bundle of artifacts, each is loaded on first access
+        data = dataset.load_dataset()
+        # the folder of an incremental dataset depends on the applied increments
         self.save_folder = dataset._get_preprocessed_folder_path()
-        dataset = dataset.load_dataset()
-        self.train = dataset['train']
-        self.val = dataset['val']
-        self.test = dataset['test']
-        self.umap = dataset['umap'] # mapping from u_id to index
-        self.smap = dataset['smap'] # mapping from item_id to index
-
-        if dataset['rnd'] is not None:
+        self.dataset_bundle = data
+        if args.user_store == 'sharded':
+            # out-of-core: only the requested user's sequence is read from a memory-mapped shard
+            self.train, self.val, self.test = [dataset.load_user_store(name, args.n_user_shards) for name in SPLIT_NAMES]
+        else:
+            self.train = data['train']
+            self.val = data['val']
+            self.test = data['test']
+        dataset = data
+        self.umap = as_id_map(dataset['umap']) # mapping from u_id to index
+        self.smap = as_id_map(dataset['smap']) # mapping from item_id to index
+
+        if dataset.get('rnd') is not None:
             # re-use Random obj
             self.rnd = dataset['rnd']
         else:
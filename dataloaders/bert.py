@@ -1,11 +1,13 @@
-import itertools
 
 from dataloaders.base import AbstractDataloader
 #from dataloaders.news import BertTrainDatasetNews, BertEvalDatasetNews
-from dataloaders.negative_samplers import negative_sampler_factory
+from dataloaders.negative_samplers import negative_sampler_factory, OnTheFlyNegatives, HardNegatives, \
+    NegativeSamples, TimeWindowNegativeSampler
+from datasets.columnar import ShardedUserStore, is_columnar, get_items_and_time_stamps, get_unique_item_ids
 from source.utils import check_all_equal, map_time_stamp_to_vector
 
 
+import numpy as np
 import torch
 import torch.utils.data as data_utils
 
@@ -27,14 +29,37 @@ class BertDataloader(AbstractDataloader):
         ####################
         # Negative Sampling
 
-        self.train_neg_sampler = self.get_negative_sampler("train",
-                                                           args.train_negative_sampler_code,
-                                                           args.train_negative_sample_size,
-                                                           args.train_negative_sampling_seed,
-                                                           self.valid_items['train'],
-                                                           self.get_seq_lengths(self.train))
+        if 'on_the_fly' == args.train_negatives:
+            # fresh negatives for the masked positions only, drawn when a training instance is generated
+            self.train_negative_samples = OnTheFlyNegatives.from_splits([self.train, self.val, self.test],
+                                                                        self.user_count,
+                                                                        self.valid_items['train'],
+                                                                        args.train_negative_sample_size,
+                                                                        args.train_negative_sampling_seed)
+        elif 'hard' == args.train_negatives:
+            # on the fly as well, partly from the nearest neighbours of the target article
+            art_embs = self.dataset_bundle.get('art_emb')
+            if art_embs is None:
+                raise ValueError("--train_negatives hard needs precomputed article embeddings (--pt_news_encoder)")
+            self.train_negative_samples = HardNegatives.from_splits([self.train, self.val, self.test],
+                                                                    self.user_count,
+                                                                    self.valid_items['train'],
+                                                                    args.train_negative_sample_size,
+                                                                    args.train_negative_sampling_seed,
+                                                                    art_embs=art_embs,
+                                                                    hard_ratio=args.hard_negative_ratio,
+                                                                    n_neighbours=args.hard_negative_neighbours,
+                                                                    n_clusters=args.hard_negative_clusters,
+                                                                    n_probe=args.hard_negative_probes)
+        else:
+            self.train_neg_sampler = self.get_negative_sampler("train",
+                                                               args.train_negative_sampler_code,
+                                                               args.train_negative_sample_size,
+                                                               args.train_negative_sampling_seed,
+                                                               self.valid_items['train'],
+                                                               self.get_seq_lengths(self.train))
 
-        self.train_negative_samples = self.train_neg_sampler.get_negative_samples()
+            self.train_negative_samples = self.train_neg_sampler.get_negative_samples()
 
         self.test_neg_sampler = self.get_negative_sampler("test",
                                                            args.test_negative_sampler_code,
@@ -57,8 +82,14 @@ class BertDataloader(AbstractDataloader):
 
     def _get_train_loader(self):
         dataset = self._get_train_dataset()
-        dataloader = data_utils.DataLoader(dataset, batch_size=self.args.train_batch_size,
-                                           shuffle=True, pin_memory=True)
+        if isinstance(self.train, ShardedUserStore):
+            # dataset index i is the i-th user of the store, see BertTrainDataset
+            sampler = ShardOrderedSampler(self.train.shard_rows(), self.rnd.getrandbits(32))
+            dataloader = data_utils.DataLoader(dataset, batch_size=self.args.train_batch_size,
+                                               sampler=sampler, pin_memory=True)
+        else:
+            dataloader = data_utils.DataLoader(dataset, batch_size=self.args.train_batch_size,
+                                               shuffle=True, pin_memory=True)
         return dataloader
 
     def _get_train_dataset(self):
@@ -87,17 +118,26 @@ class BertDataloader(AbstractDataloader):
     def get_negative_sampler(self, mode, code, neg_sample_size, seed, item_set, seq_lengths):
         # sample negative instances for each user
 
-        if False:
-            # use time-sensitive set for neg sampling
-            raise NotImplementedError()
-        else:
-            # use item set for simple neg sampling
-            negative_sampler = negative_sampler_factory(mode, code, self.train, self.val, self.test,
-                                                        self.user_count, item_set,
-                                                        neg_sample_size,
-                                                        seed,
-                                                        seq_lengths,
-                                                        self.save_folder)
+        kwargs = {}
+        if TimeWindowNegativeSampler.code() == code:
+            # time-sensitive set for neg sampling: articles published around the interaction
+            kwargs['pub_times'] = self.dataset_bundle.get('pub_times')
+            if kwargs['pub_times'] is None:
+                raise ValueError("time_window negatives need the publication times of the articles (DPG datasets)")
+            if self.args.negative_time_window is None:
+                raise ValueError("time_window negatives need --negative_time_window")
+            kwargs['window'] = self.args.negative_time_window * 3600
+
+        negative_sampler = negative_sampler_factory(mode, code, self.train, self.val, self.test,
+                                                    self.user_count, item_set,
+                                                    neg_sample_size,
+                                                    seed,
+                                                    seq_lengths,
+                                                    self.save_folder,
+                                                    engine=self.args.negative_sampler_engine,
+                                                    popularity_alpha=self.args.popularity_alpha,
+                                                    n_workers=self.args.negative_sampler_workers,
+                                                    **kwargs)
         return negative_sampler
 
     def get_valid_items(self):
@@ -106,15 +146,18 @@ class BertDataloader(AbstractDataloader):
         if self.split_method != "time_threshold":
             test = train = all_items
         else:
-            train = set(itertools.chain.from_iterable(self.train.values()))
+            train = set(get_unique_item_ids(self.train).tolist())
             test = all_items
 
         return {'train': list(train), 'test': list(test)}
 
     def get_seq_lengths(self, data_dict):
-        # determine sequence length for each entry
-        seq_lengths = list(map(len, data_dict.values()))
-        if check_all_equal(seq_lengths):
+        # determine sequence length for each user. keyed by user, as users removed by an increment leave gaps
+        if is_columnar(data_dict):
+            seq_lengths = dict(zip(data_dict.users.tolist(), data_dict.lengths().tolist()))
+        else:
+            seq_lengths = {user: len(seq) for user, seq in data_dict.items()}
+        if check_all_equal(list(seq_lengths.values())):
             return None
         else:
             return seq_lengths
@@ -128,12 +171,11 @@ class BertDataloaderNews(BertDataloader):
 
         super(BertDataloaderNews, self).__init__(args, dataset)
 
-        data = dataset.load_dataset()
-        self.vocab = data['vocab']
+        # re-use the bundle loaded by the base class. art2words is only loaded if needed, art_emb is read by the model
+        self.vocab = self.dataset_bundle['vocab']
         if self.vocab is not None:
-            args.vocab_path = dataset._get_preprocessed_dataset_path()
+            args.vocab_path = dataset._get_artifact_path('vocab')
 
-        self.art_index2word_ids = data['art2words'] # art ID -> [word IDs]
         self.max_article_len = args.max_article_len
 
         if args.fix_pt_art_emb:
@@ -145,9 +187,9 @@ class BertDataloaderNews(BertDataloader):
         if self.args.fix_pt_art_emb:
             self.art_id2word_ids = None
         else:
+            art_index2word_ids = self.dataset_bundle['art2words'] # art ID -> [word IDs]
             # create direct mapping art_id -> word_ids
-            self.art_id2word_ids = {art_idx: self.art_index2word_ids[art_id] for art_id, art_idx in self.smap.items()}
-        del self.art_index2word_ids
+            self.art_id2word_ids = {art_idx: art_index2word_ids[art_id] for art_id, art_idx in self.smap.items()}
 
     @classmethod
     def code(cls):
@@ -161,21 +203,22 @@ class BertDataloaderNews(BertDataloader):
         return dataset
 
     def _get_eval_dataset(self, mode):
+        users = None
         if 'val' == mode:
-            test_items = {}
-            u2hist = {}
+            test_items = self.val
+            u2hist = self.train
             # filter out user without validation instance
-            for u_idx, items in self.val.items():
-                if len(items) >= 1:
-                    test_items[u_idx] = items
-                    u2hist[u_idx] = self.train[u_idx]
+            if is_columnar(self.val):
+                users = self.val.users[self.val.lengths() >= 1].tolist()
+            else:
+                users = sorted(u_idx for u_idx, items in self.val.items() if len(items) >= 1)
         else:
             test_items = self.test
             u2hist = self.train
 
         # for now, we just assume to always use 'last_as_target'
         dataset = BertEvalDatasetNews(u2hist, test_items, self.art_id2word_ids, self.test_negative_samples, self.max_hist_len, self.max_article_len,
-                                      self.mask_token, self.rnd, self.w_time_stamps, self.w_u_id)
+                                      self.mask_token, self.rnd, self.w_time_stamps, self.w_u_id, users=users)
         return dataset
 
     def get_valid_items(self):
@@ -184,11 +227,7 @@ class BertDataloaderNews(BertDataloader):
         if self.split_method != "time_threshold":
             test = train = all_items
         else:
-            if self.w_time_stamps:
-                ids, ts = zip(*itertools.chain.from_iterable(self.train.values()))
-            else:
-                ids = list(itertools.chain.from_iterable(self.train.values()))
-            train = set(ids)
+            train = set(get_unique_item_ids(self.train).tolist())
             test = all_items
 
         return {'train': list(train), 'test': list(test)}
@@ -223,6 +262,32 @@ def pad_seq(seq, pad_token, max_hist_len, max_article_len=None, n=None):
     else:
         return seq
 
+def pad_time_stamps(time_stamps, max_hist_len, pad_token=0):
+    # time_stamps (np.ndarray): (L x len_time_vec) -> (max_hist_len x len_time_vec) with left-side padding
+    time_stamps = np.asarray(time_stamps)[-max_hist_len:]
+    padded = np.full((max_hist_len,) + time_stamps.shape[1:], pad_token, dtype=time_stamps.dtype)
+    padded[max_hist_len - len(time_stamps):] = time_stamps
+    return padded
+
+
+class ShardOrderedSampler(data_utils.Sampler):
+    """
+    Random order that visits one shard of a ShardedUserStore at a time: shards are shuffled and
+    users are shuffled within their shard. Keeps the working set of each epoch phase to a single
+    shard file, so reads mostly hit the page cache
+    """
+
+    def __init__(self, shard_rows, seed):
+        self.shard_rows = shard_rows
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.shard_rows)
+
+    def __iter__(self):
+        for k in self.rng.permutation(len(self.shard_rows)):
+            yield from self.rng.permutation(self.shard_rows[k]).tolist()
+
 
 class BertTrainDataset(data_utils.Dataset):
     def __init__(self, u2seq, max_hist_len, mask_prob, mask_token, num_items, rng, pad_token=0):
@@ -275,9 +340,10 @@ class BertTrainDataset(data_utils.Dataset):
 
 
 class BertEvalDataset(data_utils.Dataset):
-    def __init__(self, u2seq, u2answer, max_hist_len, mask_token, neg_samples, rnd, pad_token=0, u_idx=False):
+    def __init__(self, u2seq, u2answer, max_hist_len, mask_token, neg_samples, rnd, pad_token=0, u_idx=False, users=None):
         self.u2hist = u2seq
-        self.u_sample_ids = sorted(self.u2hist.keys())
+        # users (list, optional): subset of users to evaluate, e.g. those with a validation instance
+        self.u_sample_ids = sorted(self.u2hist.keys()) if users is None else users
         self.u2targets = u2answer
         self.neg_samples = neg_samples
 
@@ -341,30 +407,22 @@ class BertTrainDatasetNews(BertTrainDataset):
 
         # generate masked item sequence on-the-fly
         u_idx = self.users[index]
-        seq = self._getseq(u_idx)
-        neg_samples = self._get_neg_samples(u_idx)
+        seq, time_stamps = get_items_and_time_stamps(self.u2seq, u_idx, self.w_time_stamps)
 
-        if not self.w_u_idx:
-            u_idx = None
+        return self.gen_train_instance(seq, u_idx, time_stamps=time_stamps)
 
-        return self.gen_train_instance(seq, neg_samples, u_idx=u_idx)
-
-    def gen_train_instance(self, seq, neg_samples, u_idx=None):
+    def gen_train_instance(self, seq, user, time_stamps=None):
+        # seq: article indices, time_stamps: (L x len_time_vec) array of the same sequence
         hist = []
         labels = []
         mask = []
         candidates = []
-        time_stamps = []
-        n_cands = len(neg_samples[0])
+        masked = [] # (position, candidate permutation)
+        n_cands = self._get_n_neg_samples(user)
 
         pos_irrelevant_lbl = -1 # label to indicate irrelevant position to avoid confusion with other categorical labels
 
-        for idx, entry in enumerate(seq):
-            if self.w_time_stamps:
-                art_id, ts = entry
-                time_stamps.append(ts)
-            else:
-                art_id = entry
+        for idx, art_id in enumerate(seq):
 
             prob = self.rng.random()
             if prob < self.mask_prob:
@@ -390,12 +448,15 @@ class BertTrainDatasetNews(BertTrainDataset):
 
                 mask.append(m_val)
 
-                cands = neg_samples[idx] + [art_id]
-                self.rng.shuffle(cands) # shuffle candidates so model cannot trivially guess target position
+                # shuffle candidates so model cannot trivially guess target position
+                # the permutation is applied once the negatives of all masked positions are known
+                perm = list(range(n_cands + 1))
+                self.rng.shuffle(perm)
+                masked.append((idx, perm))
 
-                labels.append(cands.index(art_id))
+                labels.append(perm.index(n_cands)) # target is appended after the negatives
 
-                candidates.append([art_idx2word_ids(art, self.art2words) for art in cands])
+                candidates.append(None)
 
             else:
                 hist.append(art_idx2word_ids(art_id, self.art2words))
@@ -403,16 +464,22 @@ class BertTrainDatasetNews(BertTrainDataset):
                 mask.append(1)
 
                 if self.art2words is None:
-                    cands = [0] * (len(neg_samples[idx]) + 1)
+                    cands = [0] * (n_cands + 1)
                 else:
-                    cands = [[0] * self.max_article_len] * (len(neg_samples[idx]) + 1)
+                    cands = [[0] * self.max_article_len] * (n_cands + 1)
 
                 candidates.append(cands)
 
                 # cands = neg_samples[idx] + [art_id]
                 #candidates.append([art_idx2word_ids(art, self.art2words) for art in cands])
 
+        neg_samples = self._get_neg_samples(user, seq, [idx for idx, _ in masked])
+        for (idx, perm), negs in zip(masked, neg_samples):
+            cands = list(negs) + [seq[idx]]
+            candidates[idx] = [art_idx2word_ids(cands[i], self.art2words) for i in perm]
 
+        if not self.w_u_idx:
+            user = None
 
         # truncate sequence & apply left-side padding
         ##############################################
@@ -433,13 +500,11 @@ class BertTrainDatasetNews(BertTrainDataset):
                'cands': torch.LongTensor(candidates)}
 
         if self.w_time_stamps:
-            len_time_vec = len(time_stamps[0])
-            time_stamps = pad_seq(time_stamps, pad_token=0,
-                                  max_hist_len=self.max_hist_len, n=len_time_vec)
-            inp['ts'] = torch.LongTensor(time_stamps)
+            # int16 raw or float32 scaled time vectors. the temporal embeddings are linear layers over floats
+            inp['ts'] = torch.from_numpy(pad_time_stamps(time_stamps, self.max_hist_len)).float()
 
-        if u_idx is not None:
-            inp['u_id'] = torch.LongTensor([u_idx] * self.max_hist_len) # need tensors of equal lenght for collate function
+        if user is not None:
+            inp['u_id'] = torch.LongTensor([user] * self.max_hist_len) # need tensors of equal lenght for collate function
 
         return {'input': inp, 'lbls': torch.LongTensor(labels)}
 
@@ -456,37 +521,59 @@ class BertTrainDatasetNews(BertTrainDataset):
 #             return torch.LongTensor(hist), torch.LongTensor(mask), \
 #                    torch.LongTensor(candidates), torch.LongTensor(labels)
 
-    def _get_neg_samples(self, user):
-        return self.train_neg_samples[user]
+    def _get_neg_samples(self, user, seq, positions):
+        # negatives of the given (masked) positions
+        if isinstance(self.train_neg_samples, OnTheFlyNegatives):
+            targets = [seq[idx] for idx in positions]
+            return self.train_neg_samples.sample(user, len(positions), targets=targets).tolist()
+        if isinstance(self.train_neg_samples, NegativeSamples):
+            return self.train_neg_samples.get_arrays(user)[positions].tolist()
+        return [self.train_neg_samples[user][idx] for idx in positions]
+
+    def _get_n_neg_samples(self, user):
+        if isinstance(self.train_neg_samples, OnTheFlyNegatives):
+            return self.train_neg_samples.sample_size
+        if isinstance(self.train_neg_samples, NegativeSamples):
+            return self.train_neg_samples.get_arrays(user).shape[1]
+        return len(self.train_neg_samples[user][0])
 
 
 class BertEvalDatasetNews(BertEvalDataset):
 
     def __init__(self, u2seq, u2answer, art2words, neg_samples, max_hist_len, max_article_len, mask_token,
-                 rnd, w_time_stamps=False, u_idx=False):
-        super(BertEvalDatasetNews, self).__init__(u2seq, u2answer, max_hist_len, mask_token, neg_samples, rnd, u_idx=u_idx)
+                 rnd, w_time_stamps=False, u_idx=False, users=None):
+        super(BertEvalDatasetNews, self).__init__(u2seq, u2answer, max_hist_len, mask_token, neg_samples, rnd,
+                                                  u_idx=u_idx, users=users)
 
         self.art2words = art2words
         self.max_article_len = max_article_len # len(next(iter(art2words.values())))
         self.eval_mask = [1] * (max_hist_len-1) + [0]  # insert mask token at the end
         self.w_time_stamps = w_time_stamps
 
-    def gen_eval_instance(self, hist, test_items, negs, u_idx=None):
+    def __getitem__(self, index):
+        u_idx = self.u_sample_ids[index]
+        hist, hist_time_stamps = get_items_and_time_stamps(self.u2hist, u_idx, self.w_time_stamps)
+        test_items, test_time_stamps = get_items_and_time_stamps(self.u2targets, u_idx, self.w_time_stamps)
+
+        if len(test_items) == 0:
+            return None
+
+        if isinstance(u_idx, str):
+            negs = self.neg_samples[int(u_idx[:-1])]
+        else:
+            negs = self.neg_samples[u_idx] # get negative samples
+        if not self.w_u_id:
+            u_idx = None
+        return self.gen_eval_instance(hist, test_items, negs, u_idx, hist_time_stamps, test_time_stamps)
+
+    def gen_eval_instance(self, hist, test_items, negs, u_idx=None, hist_time_stamps=None, test_time_stamps=None):
         # hist = train + test[:-1]
         if self.w_time_stamps:
-            hist, time_stamps = zip(*hist)
-            test_items, test_time_stamps = zip(*test_items)
-            time_stamps = list(time_stamps + test_time_stamps)[-self.max_hist_len:]
-            # time vectors
-            #time_stamps = list(map(map_time_stamp_to_vector, time_stamps))
-            #args.len_time_vec
-            len_time_vec = len(time_stamps[0])
+            time_stamps = np.concatenate([hist_time_stamps, test_time_stamps])[-self.max_hist_len:]
             # padding
-            time_stamps = pad_seq(time_stamps, pad_token=0,
-                                  max_hist_len=self.max_hist_len, n=len_time_vec)
+            time_stamps = pad_time_stamps(time_stamps, self.max_hist_len)
         else:
             time_stamps = None
-            test_time_stamps = None
 
         target = [test_items[-1]]
         candidates = target + negs # candidates as article indices
@@ -520,7 +607,7 @@ class BertEvalDatasetNews(BertEvalDataset):
         inp = {'hist': torch.LongTensor(hist), 'mask': torch.LongTensor(self.eval_mask), \
                'cands': torch.LongTensor(candidates)}
         if self.w_time_stamps:
-            inp['ts'] = torch.LongTensor(time_stamps)
+            inp['ts'] = torch.from_numpy(time_stamps).float()
 
         if u_idx is not None:
             inp['u_id'] = torch.LongTensor([u_idx] * self.max_hist_len)
@@ -1,12 +1,21 @@
 from .popular import PopularNegativeSampler
+from .popular_proportional import PopularProportionalNegativeSampler
 from .random import RandomNegativeSamplerPerUser
+from .time_window import TimeWindowNegativeSampler
+from .on_the_fly import OnTheFlyNegatives
+from .hard import HardNegatives
+from .storage import NegativeSamples
 
 
 NEGATIVE_SAMPLERS = {
     PopularNegativeSampler.code(): PopularNegativeSampler,
+    PopularProportionalNegativeSampler.code(): PopularProportionalNegativeSampler,
     RandomNegativeSamplerPerUser.code(): RandomNegativeSamplerPerUser,
+    TimeWindowNegativeSampler.code(): TimeWindowNegativeSampler,
 }
 
-def negative_sampler_factory(mode, code, train, val, test, user_count, item_count, sample_size, seq_lengths, seed, save_folder):
+def negative_sampler_factory(mode, code, train, val, test, user_count, item_count, sample_size, seq_lengths, seed, save_folder,
+                             **kwargs):
     negative_sampler = NEGATIVE_SAMPLERS[code]
-    return negative_sampler(mode, train, val, test, user_count, item_count, sample_size, seq_lengths, seed, save_folder)
+    return negative_sampler(mode, train, val, test, user_count, item_count, sample_size, seq_lengths, seed, save_folder,
+                            **kwargs)
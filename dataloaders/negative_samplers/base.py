@@ -1,24 +1,32 @@
+from .parallel import sample_in_parallel
+from .storage import NegativeSamples, content_key
 from abc import *
 from pathlib import Path
-import pickle
 import random
 
+from datasets.columnar import get_item_ids
+
 
 class AbstractNegativeSampler(metaclass=ABCMeta):
-    def __init__(self, mode, train, val, test, user_count, item_set, sample_size, seed, seq_lengths, save_folder):
+    def __init__(self, mode, train, val, test, user_count, item_set, sample_size, seed, seq_lengths, save_folder,
+                 engine='python', popularity_alpha=1.0, n_workers=0):
         self.train = train
         self.val = val
         self.test = test
         self.user_count = user_count
         self.item_set = item_set
         self.sample_size = sample_size
-        self.seq_lengths = seq_lengths # indicates the sequence length for each user
+        self.seq_lengths = seq_lengths # {user: sequence length}, negatives for each position of these users
         self.seed = seed
         self.mode = mode
         assert self.seed is not None, 'Specify seed for random sampling'
         random.seed(self.seed)
 
         self.save_folder = save_folder
+        self.engine = engine # 'numpy' or 'python', for samplers with a vectorised implementation
+        self.popularity_alpha = popularity_alpha # exponent of the item counts for popularity-proportional sampling
+        self.n_workers = n_workers # > 0: sample in worker processes, with one generator per user seeded by (seed, user)
+        self._content_key = None
 
     @classmethod
     @abstractmethod
@@ -27,23 +35,64 @@ class AbstractNegativeSampler(metaclass=ABCMeta):
 
     @abstractmethod
     def generate_negative_samples(self):
+        # NegativeSamples of all users, drawn in this process
         pass
 
     def get_negative_samples(self):
         savefile_path = self._get_save_path()
-        if savefile_path.is_file():
+        if NegativeSamples.exists(savefile_path.parent, savefile_path.name):
             print('Negatives samples exist. Loading.')
-            negative_samples = pickle.load(savefile_path.open('rb'))
-            return negative_samples
+            return NegativeSamples.load(savefile_path.parent, savefile_path.name)
         print("Negative samples don't exist. Generating.")
+        if self._sample_in_parallel():
+            return sample_in_parallel(self, savefile_path.parent, savefile_path.name, self.n_workers)
         negative_samples = self.generate_negative_samples()
-        with savefile_path.open('wb') as f:
-            pickle.dump(negative_samples, f)
+        negative_samples.save(savefile_path.parent, savefile_path.name)
         return negative_samples
 
+    def supports_parallel(self):
+        # samplers that draw each user's negatives with sample_user
+        return False
+
+    def prepare_sampling(self):
+        # state shared by all users, computed once before sample_user is called
+        pass
+
+    def sample_user(self, rng, user):
+        # (n_rows x sample_size) negatives of a user, n_rows = 1 if there are no seq_lengths
+        raise NotImplementedError()
+
+    def _sample_in_parallel(self):
+        if self.n_workers is None or self.n_workers < 1:
+            return False
+        if not self.supports_parallel():
+            print('{} sampler does not support parallel sampling. Sampling in one process'.format(self.code()))
+            return False
+        return True
+
+    def get_users(self):
+        # users to draw negatives for
+        if self.seq_lengths is None:
+            return range(self.user_count)
+        return sorted(self.seq_lengths)
+
+    def get_seen_items(self, user):
+        # items of the user across all splits, w/o time stamps
+        seen = set(get_item_ids(self.train, user))
+        seen.update(get_item_ids(self.val, user))
+        seen.update(get_item_ids(self.test, user))
+        return seen
+
     def _get_save_path(self):
+        # prefix of the .npy files of the negatives, keyed on the content of the item set & splits
+        if self._content_key is None:
+            self._content_key = content_key(self.item_set, [self.train, self.val, self.test], self.seq_lengths)
         folder = Path(self.save_folder)
-        filename = '{}-sample_size{}-{}-seed{}.pkl'.format(self.code(), self.sample_size, self.mode, self.seed)
+        filename = '{}-sample_size{}-{}-seed{}-{}'.format(self.code(), self.sample_size, self.mode, self.seed,
+                                                          self._content_key)
+        if self._sample_in_parallel():
+            # per-user generators draw different samples than a single generator
+            filename += '-user_seeds'
         return folder.joinpath(filename)
 
     @abstractmethod
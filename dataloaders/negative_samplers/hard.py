@@ -0,0 +1,147 @@
+from .on_the_fly import OnTheFlyNegatives
+from .random import isin_sorted, sample_unseen_items
+
+import numpy as np
+
+
+def normalise_rows(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def top_k_by_row(sims, k):
+    # column indices of the k largest values of each row, unordered
+    if sims.shape[1] <= k:
+        return np.broadcast_to(np.arange(sims.shape[1]), sims.shape)
+    return np.argpartition(-sims, k - 1, axis=1)[:, :k]
+
+
+def spherical_kmeans(x, n_clusters, rng, n_iter=10, batch_size=8192):
+    """
+    k-means on the unit sphere (cosine similarity) for the rows of x, which are L2-normalised
+
+    :return: centroids (n_clusters x D) & cluster of each row
+    """
+    centroids = x[rng.choice(len(x), n_clusters, replace=False)]
+    for _ in range(n_iter):
+        assign = np.concatenate([np.argmax(x[start:start + batch_size] @ centroids.T, axis=1)
+                                 for start in range(0, len(x), batch_size)])
+        order = np.argsort(assign, kind='stable')
+        clusters, starts = np.unique(assign[order], return_index=True)
+        centroids = centroids.copy()
+        centroids[clusters] = normalise_rows(np.add.reduceat(x[order], starts, axis=0))
+        # re-seed empty clusters with random rows
+        empty = np.setdiff1d(np.arange(n_clusters), clusters)
+        centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    assign = np.concatenate([np.argmax(x[start:start + batch_size] @ centroids.T, axis=1)
+                             for start in range(0, len(x), batch_size)])
+    return centroids, assign
+
+
+class IVFIndex(object):
+    """
+    Inverted file index over L2-normalised embeddings: the rows are partitioned by spherical k-means and a
+    query only scans the rows of its n_probe most similar clusters
+
+    neighbours(k) returns the approximate k nearest neighbours (cosine) of every row, excluding the row itself
+    """
+
+    def __init__(self, x, n_clusters, rng, n_iter=10):
+        self.x = x
+        self.n_clusters = min(n_clusters, len(x))
+        self.centroids, self.assign = spherical_kmeans(x, self.n_clusters, rng, n_iter=n_iter)
+        order = np.argsort(self.assign, kind='stable')
+        bounds = np.searchsorted(self.assign[order], np.arange(self.n_clusters + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(self.n_clusters)]
+
+    def neighbours(self, k, n_probe, batch_size=8192):
+        n = len(self.x)
+        n_probe = min(n_probe, self.n_clusters)
+        probes = np.concatenate([top_k_by_row(self.x[start:start + batch_size] @ self.centroids.T, n_probe)
+                                 for start in range(0, n, batch_size)])
+
+        # queries of each cluster, i.e. the rows that probe it
+        order = np.argsort(probes.ravel(), kind='stable')
+        bounds = np.searchsorted(probes.ravel()[order], np.arange(self.n_clusters + 1))
+        best_sims = np.full((n, k), -np.inf, dtype='float32')
+        best_rows = np.full((n, k), -1, dtype='int64')
+        for c, members in enumerate(self.lists):
+            queries = order[bounds[c]:bounds[c + 1]] // n_probe
+            if len(queries) == 0 or len(members) == 0:
+                continue
+            sims = self.x[queries] @ self.x[members].T
+            sims[queries[:, None] == members[None, :]] = -np.inf
+
+            # merge with the best candidates of the clusters scanned so far
+            sims = np.concatenate([best_sims[queries], sims], axis=1)
+            rows = np.concatenate([best_rows[queries], np.broadcast_to(members, (len(queries), len(members)))], axis=1)
+            top = top_k_by_row(sims, k)
+            best_sims[queries] = np.take_along_axis(sims, top, axis=1)
+            best_rows[queries] = np.take_along_axis(rows, top, axis=1)
+
+        # most similar first. rows w/o enough candidates are padded with -1
+        order = np.argsort(-best_sims, axis=1, kind='stable')
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_rows[np.take_along_axis(best_sims, order, axis=1) == -np.inf] = -1
+        return best_rows
+
+
+class HardNegatives(OnTheFlyNegatives):
+    """
+    On-the-fly negatives for the masked positions that mix hard & random negatives: round(hard_ratio * sample_size)
+    are drawn from the approximate nearest neighbours of the target article, the rest uniformly from the unseen
+    articles (see OnTheFlyNegatives)
+
+    The neighbours come from an IVF index (spherical k-means partition) over the article embeddings, which are
+    fixed during training (see PrecomputedFixedEmbeddings), so the index is built once
+
+    art_embs: (n_articles x D) embedding matrix, row i belongs to article index i
+    """
+
+    def __init__(self, item_set, seen_offsets, seen_items, sample_size, seed, art_embs=None, hard_ratio=0.5,
+                 n_neighbours=50, n_clusters=None, n_probe=4):
+        super(HardNegatives, self).__init__(item_set, seen_offsets, seen_items, sample_size, seed)
+        assert art_embs is not None, 'Need article embeddings for hard negatives'
+        assert 0 <= hard_ratio <= 1, 'hard_ratio must be in [0, 1]'
+        self.n_hard = int(round(hard_ratio * sample_size))
+        self.n_neighbours = n_neighbours
+        self.n_clusters = n_clusters
+        self.n_probe = n_probe
+
+        self.neighbours = None
+        self.build_index(art_embs)
+
+    def build_index(self, art_embs):
+        # neighbours (n_articles x n_neighbours): nearest articles of item_set for every article index, -1 if none
+        art_embs = np.asarray(art_embs.numpy() if hasattr(art_embs, 'numpy') else art_embs, dtype='float32')
+        x = normalise_rows(art_embs[self.item_set])
+        n_clusters = self.n_clusters or max(1, int(np.sqrt(len(x))))
+        print('Building IVF index over {} articles with {} clusters'.format(len(x), n_clusters))
+        index = IVFIndex(x, n_clusters, np.random.default_rng(self.seed))
+        rows = index.neighbours(self.n_neighbours, self.n_probe)
+
+        self.neighbours = np.full((len(art_embs), rows.shape[1]), -1, dtype='int64')
+        self.neighbours[self.item_set] = np.where(rows >= 0, self.item_set[np.maximum(rows, 0)], -1)
+
+    def sample(self, user, n_rows, targets=None):
+        # (n_rows x sample_size) unseen items, the hard ones first. targets: article of each row
+        assert targets is not None and len(targets) == n_rows, 'Need the target article of each position'
+        rng = self.rng
+        seen = self.get_seen_items(user)
+
+        # random subset of the unseen neighbours of each target
+        neighbours = self.neighbours[np.asarray(targets, dtype='int64')]
+        valid = (neighbours >= 0) & ~isin_sorted(neighbours, seen)
+        keys = rng.random(neighbours.shape)
+        keys[~valid] = np.inf
+        pick = np.argsort(keys, axis=1)[:, :self.n_hard]
+        hard = np.take_along_axis(neighbours, pick, axis=1)
+        is_hard = np.take_along_axis(valid, pick, axis=1)
+
+        # random negatives fill up the rows, w/o repeating a hard negative
+        rand = sample_unseen_items(rng, self.item_set, seen, n_rows, self.sample_size)
+        is_rand = ~((rand[:, :, None] == hard[:, None, :]) & is_hard[:, None, :]).any(axis=2)
+        is_rand &= np.cumsum(is_rand, axis=1) <= self.sample_size - is_hard.sum(axis=1, keepdims=True)
+
+        samples = np.concatenate([hard, rand], axis=1)
+        return samples[np.concatenate([is_hard, is_rand], axis=1)].reshape(n_rows, self.sample_size)
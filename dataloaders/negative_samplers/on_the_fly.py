@@ -0,0 +1,69 @@
+from .random import sample_unseen_items
+from datasets.columnar import iter_event_chunks
+
+import numpy as np
+import torch.utils.data as data_utils
+
+
+def _unique_sorted(values):
+    values = np.sort(values, kind='stable')
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return values[keep]
+
+
+def build_seen_index(splits, user_count):
+    """
+    Items of each user across the given splits as sorted unique arrays in CSR layout
+    The splits are read chunk by chunk, see iter_event_chunks
+
+    :return: offsets (int64, user_count + 1) & items, i.e. user u has seen items[offsets[u]:offsets[u+1]]
+    """
+    # unique (user, item) pairs as user << 32 | item, i.e. sorted by user & item
+    pairs = [_unique_sorted((users << 32) | items.astype('int64'))
+             for split in splits for users, items in iter_event_chunks(split)]
+    pairs = _unique_sorted(np.concatenate(pairs)) if pairs else np.zeros(0, dtype='int64')
+    offsets = np.searchsorted(pairs >> 32, np.arange(user_count + 1)).astype('int64')
+    return offsets, (pairs & 0xffffffff).astype('int32')
+
+
+class OnTheFlyNegatives(object):
+    """
+    Draws fresh negatives for the masked positions of a training instance, instead of storing
+    sample_size negatives for every position of every user
+
+    Each DataLoader worker uses its own generator, seeded with (seed, worker seed). Torch derives
+    new worker seeds for every epoch, so every epoch sees new negatives
+    """
+
+    def __init__(self, item_set, seen_offsets, seen_items, sample_size, seed):
+        assert seed is not None, 'Specify seed for random sampling'
+        self.item_set = np.unique(np.asarray(item_set))
+        self.seen_offsets = seen_offsets
+        self.seen_items = seen_items
+        self.sample_size = sample_size
+        self.seed = seed
+
+        self._rng = None
+        self._worker_seed = None
+
+    @classmethod
+    def from_splits(cls, splits, user_count, item_set, sample_size, seed, **kwargs):
+        seen_offsets, seen_items = build_seen_index(splits, user_count)
+        return cls(item_set, seen_offsets, seen_items, sample_size, seed, **kwargs)
+
+    @property
+    def rng(self):
+        worker_info = data_utils.get_worker_info()
+        worker_seed = None if worker_info is None else worker_info.seed
+        if self._rng is None or worker_seed != self._worker_seed:
+            self._rng = np.random.default_rng(self.seed if worker_seed is None else [self.seed, worker_seed])
+            self._worker_seed = worker_seed
+        return self._rng
+
+    def get_seen_items(self, user):
+        return self.seen_items[self.seen_offsets[user]:self.seen_offsets[user + 1]]
+
+    def sample(self, user, n_rows, targets=None):
+        # (n_rows x sample_size) unseen items of the user, w/o duplicates within a row. targets are not used
+        return sample_unseen_items(self.rng, self.item_set, self.get_seen_items(user), n_rows, self.sample_size)
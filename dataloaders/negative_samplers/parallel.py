@@ -0,0 +1,87 @@
+from .storage import NegativeSamples
+
+from tqdm import tqdm
+
+import numpy as np
+import multiprocessing
+
+
+# state of a worker process, see _init_worker
+_worker = {}
+
+
+def user_rng(seed, user):
+    # generator of a single user, independent of the order in which users are sampled
+    return np.random.default_rng([seed, user])
+
+
+def sample_layout(sampler):
+    # users, number of positions per user (-1: a single list) & offsets of their negatives in the items array
+    users = np.asarray(sampler.get_users(), dtype='int64')
+    n_rows = np.full(len(users), -1, dtype='int32')
+    if sampler.seq_lengths is not None:
+        n_rows[:] = [sampler.seq_lengths[user] for user in users.tolist()]
+    offsets = np.zeros(len(users) + 1, dtype='int64')
+    np.cumsum(np.where(n_rows < 0, 1, n_rows) * sampler.sample_size, out=offsets[1:])
+    return users, n_rows, offsets
+
+
+def sample_in_order(sampler, rng):
+    """
+    Negatives of all users of the sampler as NegativeSamples, drawn one user after the other from rng
+
+    Like sample_in_parallel, each user's block is written straight into a preallocated items array
+    """
+    users, n_rows, offsets = sample_layout(sampler)
+    items = np.empty(int(offsets[-1]), dtype='int32')
+    sampler.prepare_sampling()
+    print('Sampling negative items')
+    for row, user in enumerate(tqdm(users.tolist())):
+        items[offsets[row]:offsets[row + 1]] = sampler.sample_user(rng, user).ravel()
+    return NegativeSamples(users, offsets, n_rows, items)
+
+
+def sample_in_parallel(sampler, folder, name, n_workers, users_per_task=256):
+    """
+    Negatives of all users of the sampler, drawn in n_workers processes & stored as NegativeSamples <folder>/<name>_*
+
+    Each user draws from its own generator seeded with (seed, user), so the negatives are the same for any
+    number of workers. The layout is known in advance (n_rows x sample_size per user), so the workers write
+    straight into the memory-mapped items file
+    """
+    users, n_rows, offsets = sample_layout(sampler)
+    items_path = NegativeSamples.path(folder, name, 'items')
+    items = np.lib.format.open_memmap(str(items_path), mode='w+', dtype='int32', shape=(int(offsets[-1]),))
+    del items
+
+    # shared state (item arrays, alias tables, ..) is prepared once and inherited by the workers
+    sampler.prepare_sampling()
+    tasks = [(start, min(start + users_per_task, len(users))) for start in range(0, len(users), users_per_task)]
+    print('Sampling negative items in {} processes'.format(n_workers))
+    pool = multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=(sampler, users, items_path, offsets))
+    try:
+        for _ in tqdm(pool.imap_unordered(_sample_users, tasks), total=len(tasks)):
+            pass
+    finally:
+        pool.terminate()
+        pool.join()
+
+    negative_samples = NegativeSamples(users, offsets, n_rows, np.load(items_path, mmap_mode='r'))
+    negative_samples.save_index(folder, name)
+    return negative_samples
+
+
+def _init_worker(sampler, users, items_path, offsets):
+    _worker['sampler'] = sampler
+    _worker['users'] = users
+    _worker['items'] = np.load(items_path, mmap_mode='r+')
+    _worker['offsets'] = offsets
+
+
+def _sample_users(bounds):
+    sampler, users, items, offsets = _worker['sampler'], _worker['users'], _worker['items'], _worker['offsets']
+    for row in range(*bounds):
+        user = int(users[row])
+        samples = sampler.sample_user(user_rng(sampler.seed, user), user)
+        items[offsets[row]:offsets[row + 1]] = samples.ravel()
+    items.flush()
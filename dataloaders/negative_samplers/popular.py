@@ -1,7 +1,13 @@
 from .base import AbstractNegativeSampler
+from .on_the_fly import build_seen_index
+from .random import isin_sorted
+from .storage import NegativeSamples
+from datasets.columnar import get_item_ids, iter_event_chunks
+from datasets.utils import add_bincounts
 
 from tqdm import trange
 
+import numpy as np
 from collections import Counter
 
 
@@ -11,14 +17,17 @@ class PopularNegativeSampler(AbstractNegativeSampler):
         return 'popular'
 
     def generate_negative_samples(self):
+        if 'numpy' == self.engine:
+            return self.generate_negative_samples_numpy()
+
         popular_items = self.items_by_popularity()
 
-        negative_samples = {}
+        # users that have seen (nearly) all items get fewer samples, i.e. sample_size items per user at most
+        offsets = np.zeros(self.user_count + 1, dtype='int64')
+        items = np.empty(self.user_count * self.sample_size, dtype='int32')
         print('Sampling negative items')
         for user in trange(self.user_count):
-            seen = set(self.train[user])
-            seen.update(self.val[user])
-            seen.update(self.test[user])
+            seen = self.get_seen_items(user)
 
             samples = []
             for item in popular_items:
@@ -28,15 +37,93 @@ class PopularNegativeSampler(AbstractNegativeSampler):
                     continue
                 samples.append(item)
 
-            negative_samples[user] = samples
+            offsets[user + 1] = offsets[user] + len(samples)
+            items[offsets[user]:offsets[user + 1]] = samples
 
-        return negative_samples
+        return self.to_negative_samples(offsets, items)
 
     def items_by_popularity(self):
         popularity = Counter()
         for user in range(self.user_count):
-            popularity.update(self.train[user])
-            popularity.update(self.val[user])
-            popularity.update(self.test[user])
+            popularity.update(get_item_ids(self.train, user))
+            popularity.update(get_item_ids(self.val, user))
+            popularity.update(get_item_ids(self.test, user))
         popular_items = sorted(popularity, key=popularity.get, reverse=True)
         return popular_items
+
+    def generate_negative_samples_numpy(self, batch_size=1024):
+        # same samples as the python engine: the sample_size most popular items each user has not seen
+        popular_items = self.items_by_popularity_numpy()
+        seen_offsets, seen_items = build_seen_index([self.train, self.val, self.test], self.user_count)
+        n_seen = np.diff(seen_offsets)
+        rank = np.zeros(int(max(popular_items.max(initial=-1), seen_items.max(initial=-1))) + 1, dtype='int64')
+        rank[popular_items] = np.arange(len(popular_items))
+
+        offsets = np.zeros(self.user_count + 1, dtype='int64')
+        items = np.empty(self.user_count * self.sample_size, dtype='int32')
+        print('Sampling negative items')
+        for start in trange(0, self.user_count, batch_size):
+            users = np.arange(start, min(start + batch_size, self.user_count))
+            # the first sample_size unseen items are among the sample_size + n_seen most popular items
+            width = min(len(popular_items), self.sample_size + int(n_seen[users].max()))
+            seen_rank = rank[seen_items[seen_offsets[users[0]]:seen_offsets[users[-1] + 1]]]
+            rows = np.repeat(np.arange(len(users)), n_seen[users])
+            seen = np.zeros((len(users), width), dtype=bool)
+            seen[rows[seen_rank < width], seen_rank[seen_rank < width]] = True
+
+            valid = ~seen
+            valid &= np.cumsum(valid, axis=1) <= self.sample_size
+            # row by row, i.e. a flat block of the batch. users that have seen (nearly) all items get fewer samples
+            samples = np.broadcast_to(popular_items[:width], valid.shape)[valid]
+            end = start + len(users)
+            np.cumsum(valid.sum(axis=1), out=offsets[start + 1:end + 1])
+            offsets[start + 1:end + 1] += offsets[start]
+            items[offsets[start]:offsets[end]] = samples
+
+        return self.to_negative_samples(offsets, items)
+
+    def to_negative_samples(self, offsets, items):
+        # one list of negatives per user, w/o the unused end of items
+        users = np.arange(self.user_count, dtype='int64')
+        n_rows = np.full(self.user_count, -1, dtype='int32')
+        return NegativeSamples(users, offsets, n_rows, items[:offsets[-1]])
+
+    def items_by_popularity_numpy(self):
+        # same order as items_by_popularity: by count, ties by first occurrence (user by user; train, val, test)
+        # aggregated chunk by chunk (see iter_event_chunks): counts & the first occurrence of each item per chunk,
+        # as (user, split, event index). a user's events of a split are in a single chunk
+        counts = np.zeros(0, dtype='int64')
+        firsts = []
+        for split_idx, split in enumerate([self.train, self.val, self.test]):
+            for users, items in iter_event_chunks(split):
+                in_range = (users >= 0) & (users < self.user_count)
+                users, items = users[in_range], items[in_range].astype('int64')
+                counts = add_bincounts(counts, items)
+                present, first = np.unique(items, return_index=True)
+                firsts.append((present, users[first], np.full(len(present), split_idx), first))
+        if not firsts:
+            return np.zeros(0, dtype='int64')
+
+        # earliest occurrence of each item across the chunks
+        items, users, split_idx, index = (np.concatenate(column) for column in zip(*firsts))
+        order = np.lexsort((index, split_idx, users, items))
+        items, users, split_idx, index = items[order], users[order], split_idx[order], index[order]
+        earliest = np.concatenate([[True], items[1:] != items[:-1]])
+        present, users, split_idx, index = items[earliest], users[earliest], split_idx[earliest], index[earliest]
+
+        first = np.empty(len(present), dtype='int64')
+        first[np.lexsort((index, split_idx, users))] = np.arange(len(present))
+        return present[np.lexsort((first, -counts[present]))]
+
+    def get_naive_random_samples(self, sample_size, item_set):
+        raise NotImplementedError()
+
+
+def count_items(splits, item_set):
+    # number of interactions with each item of item_set (sorted & unique) across the splits, chunk by chunk
+    counts = np.zeros(len(item_set), dtype='int64')
+    for split in splits:
+        for _, items in iter_event_chunks(split):
+            items = items[isin_sorted(items, item_set)]
+            counts += np.bincount(np.searchsorted(item_set, items), minlength=len(item_set))
+    return counts
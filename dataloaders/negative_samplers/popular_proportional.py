@@ -0,0 +1,141 @@
+from .base import AbstractNegativeSampler
+from .parallel import sample_in_order
+from .popular import count_items
+from .random import isin_sorted, mark_repeated
+
+import numpy as np
+
+
+class AliasTable(object):
+    """
+    Walker's alias method: O(1) draws from a discrete distribution over range(len(weights))
+
+    Each of the n cells holds its own index with probability prob[i] and alias[i] otherwise, i.e. a draw
+    is one uniform cell & one uniform number, vectorised over any number of draws
+    """
+
+    min_batch = 64
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype='float64')
+        assert len(weights) > 0 and (weights >= 0).all() and weights.sum() > 0, 'Invalid weights'
+        n = len(weights)
+        prob = weights * n / weights.sum()
+        alias = np.arange(n)
+
+        # Vose's construction in batches: the deficits (1 - prob) of the small cells are covered by the surplus
+        # (prob - 1) of the large cells in cumsum order. large cells that give away more than their surplus
+        # become small cells of the next round. the total deficit equals the total surplus, so every small cell
+        # is covered (up to rounding errors, hence the clipping)
+        small, large = np.flatnonzero(prob < 1), np.flatnonzero(prob >= 1)
+        while len(small) > self.min_batch and len(large):
+            donor = np.searchsorted(np.cumsum(prob[large] - 1), np.cumsum(1 - prob[small]))
+            donor = large[np.minimum(donor, len(large) - 1)]
+            alias[small] = donor
+            np.subtract.at(prob, donor, 1 - prob[small])
+            small, large = large[prob[large] < 1], large[prob[large] >= 1]
+        # few remaining cells, one by one
+        small, large = small.tolist(), large.tolist()
+        while small and large:
+            cell, donor = small.pop(), large[-1]
+            alias[cell] = donor
+            prob[donor] -= 1 - prob[cell]
+            if prob[donor] < 1:
+                small.append(large.pop())
+        # cells left over by rounding errors
+        prob[small] = 1
+        prob[large] = 1
+
+        self.prob = prob
+        self.alias = alias
+
+    def __len__(self):
+        return len(self.prob)
+
+    def draw(self, rng, size):
+        cells = rng.integers(len(self.prob), size=size)
+        return np.where(rng.random(size) < self.prob[cells], cells, self.alias[cells])
+
+
+class PopularProportionalNegativeSampler(AbstractNegativeSampler):
+    """
+    Negatives drawn with probability proportional to count^alpha, the number of interactions of an item
+    across all splits. alpha=1 samples by popularity, alpha<1 smooths the distribution towards uniform
+    """
+
+    @classmethod
+    def code(cls):
+        return 'popular_proportional'
+
+    def generate_negative_samples(self):
+        negative_samples = sample_in_order(self, np.random.default_rng(self.seed))
+
+        return negative_samples
+
+    def supports_parallel(self):
+        return True
+
+    def prepare_sampling(self):
+        self._items = np.unique(np.asarray(self.item_set))
+        counts = count_items([self.train, self.val, self.test], self._items)
+        self._weights = counts.astype('float64') ** self.popularity_alpha
+        self._table = AliasTable(self._weights)
+
+    def sample_user(self, rng, user):
+        seen = np.unique(np.fromiter(self.get_seen_items(user), dtype=self._items.dtype))
+        n_rows = 1 if self.seq_lengths is None else self.seq_lengths[user]
+        return sample_unseen_items_weighted(rng, self._table, self._weights, self._items, seen, n_rows,
+                                            self.sample_size)
+
+    def _get_save_path(self):
+        path = super(PopularProportionalNegativeSampler, self)._get_save_path()
+        return path.with_name('{}-alpha{}'.format(path.name, self.popularity_alpha))
+
+    def get_naive_random_samples(self, sample_size, item_set):
+        raise NotImplementedError()
+
+
+def sample_unseen_items_weighted(rng, table, weights, item_set, seen, n_rows, sample_size, oversample=1.5,
+                                 max_rounds=8):
+    """
+    n_rows x sample_size matrix of items from item_set drawn proportional to weights, w/o items in seen and
+    w/o duplicates within a row (i.e. successive sampling w/o replacement)
+
+    Candidates are drawn from the alias table in blocks for all rows at once. Seen items & repeated candidates
+    are rejected and rows that are still short draw another block, up to max_rounds. The remaining rows are
+    completed with rng.choice over their remaining items
+
+    table: AliasTable over the positions in item_set, weights: its (unnormalised) weights
+    item_set, seen: sorted unique arrays
+    """
+    seen_mask = np.zeros(len(item_set), dtype=bool)
+    seen_mask[np.searchsorted(item_set, seen[isin_sorted(seen, item_set)])] = True
+    n_available = int(((weights > 0) & ~seen_mask).sum())
+    if n_available < sample_size:
+        raise ValueError("Only {} unseen items to draw {} negative samples from".format(n_available, sample_size))
+
+    # draws per round, assuming no repetitions
+    unseen_mass = weights[~seen_mask].sum() / weights.sum()
+    n_draws = int(np.ceil(oversample * sample_size / unseen_mass)) + 1
+
+    samples = np.empty((n_rows, sample_size), dtype='int64')
+    pending = np.arange(n_rows)
+    cands = np.zeros((n_rows, 0), dtype='int64')
+    for _ in range(max_rounds):
+        cands = np.concatenate([cands, table.draw(rng, (len(pending), n_draws))], axis=1)
+        valid = ~mark_repeated(cands) & ~seen_mask[cands]
+        valid &= np.cumsum(valid, axis=1) <= sample_size
+        full = valid.sum(axis=1) == sample_size
+        samples[pending[full]] = cands[full][valid[full]].reshape(-1, sample_size)
+        pending, cands, valid = pending[~full], cands[~full], valid[~full]
+        if not len(pending):
+            return item_set[samples]
+
+    for row, row_cands, row_valid in zip(pending, cands, valid):
+        drawn = row_cands[row_valid]
+        remaining = np.flatnonzero(~seen_mask & (weights > 0))
+        remaining = remaining[~np.isin(remaining, drawn)]
+        p = weights[remaining] / weights[remaining].sum()
+        samples[row] = np.concatenate([drawn, rng.choice(remaining, sample_size - len(drawn), replace=False, p=p)])
+
+    return item_set[samples]
@@ -1,6 +1,8 @@
 from .base import AbstractNegativeSampler
+from .parallel import sample_in_order, sample_layout
+from .storage import NegativeSamples
 
-from tqdm import trange
+from tqdm import tqdm
 
 import numpy as np
 import random
@@ -12,38 +14,51 @@ class RandomNegativeSamplerPerUser(AbstractNegativeSampler):
         return 'random'
 
     def generate_negative_samples(self):
+        if 'numpy' == self.engine:
+            return self.generate_negative_samples_numpy()
+
         # seed is set in AbstractClass
         #random.seed(self.seed)
-        negative_samples = {}
+        users, n_rows, offsets = sample_layout(self)
+        items = np.empty(int(offsets[-1]), dtype='int32')
         print('Sampling negative items')
-        for user in trange(self.user_count):
+        for row, user in enumerate(tqdm(users.tolist())):
             # determine the items already seen by the user
-            if isinstance(self.train[user][0], tuple):
-                seen = set(x[0] for x in self.train[user])
-                seen.update(x[0] for x in self.val[user])
-                seen.update(x[0] for x in self.test[user])
-            else:
-                seen = set(self.train[user])
-                seen.update(self.val[user])
-                seen.update(self.test[user])
-
-            # sample random unseen items from the full set
+            seen = self.get_seen_items(user)
+
+            # sample random unseen items from the full set, one set of neg samples for each user
+            # or for each position in each user sequence (n_rows)
             # note: for 'time_split' need to separate into train and test intervals
-            if self.seq_lengths is None:
-                # one set of neg samples for each user
-                samples = self.get_rnd_samples_for_position(seen)
-            else:
-                # neg samples for each position in each user sequence
-                samples = []
-                for _ in range(self.seq_lengths[user]):
-                    neg_samples = self.get_rnd_samples_for_position(seen)
-                    samples.append(neg_samples)
+            start = offsets[row]
+            for _ in range(1 if n_rows[row] < 0 else n_rows[row]):
+                items[start:start + self.sample_size] = self.get_rnd_samples_for_position(seen)
+                start += self.sample_size
+
+            assert start == offsets[row + 1]
+
+        return NegativeSamples(users, offsets, n_rows, items)
 
-                assert len(samples) == self.seq_lengths[user]
+    def generate_negative_samples_numpy(self):
+        # same distribution as the python engine: uniform over the unseen items, w/o duplicates per position
+        return sample_in_order(self, np.random.default_rng(self.seed))
 
-            negative_samples[user] = samples
+    def supports_parallel(self):
+        return 'numpy' == self.engine
 
-        return negative_samples
+    def prepare_sampling(self):
+        self._items = np.unique(np.asarray(self.item_set))
+
+    def sample_user(self, rng, user):
+        seen = np.unique(np.fromiter(self.get_seen_items(user), dtype=self._items.dtype))
+        n_rows = 1 if self.seq_lengths is None else self.seq_lengths[user]
+        return sample_unseen_items(rng, self._items, seen, n_rows, self.sample_size)
+
+    def _get_save_path(self):
+        path = super(RandomNegativeSamplerPerUser, self)._get_save_path()
+        # the engines draw different samples for the same seed
+        if 'python' == self.engine:
+            return path
+        return path.with_name('{}-{}'.format(self.engine, path.name))
 
     def get_rnd_samples_for_position(self, seen):
         samples = []
@@ -63,6 +78,60 @@ class RandomNegativeSamplerPerUser(AbstractNegativeSampler):
 
         return naive_sample
 
+def isin_sorted(values, sorted_items):
+    # np.isin for a sorted & unique array of items, via binary search
+    if len(sorted_items) == 0:
+        return np.zeros(np.shape(values), dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_items, values), len(sorted_items) - 1)
+    return sorted_items[pos] == values
+
+
+def mark_repeated(cands):
+    # True for every candidate that already occurred earlier in its row
+    order = np.argsort(cands, axis=1, kind='stable')
+    sorted_cands = np.take_along_axis(cands, order, axis=1)
+    repeated = np.zeros(cands.shape, dtype=bool)
+    np.put_along_axis(repeated, order[:, 1:], sorted_cands[:, 1:] == sorted_cands[:, :-1], axis=1)
+    return repeated
+
+
+def sample_unseen_items(rng, item_set, seen, n_rows, sample_size, oversample=1.2):
+    """
+    n_rows x sample_size matrix of random items from item_set that are not in seen, w/o duplicates within a row
+
+    Draws an oversized block of candidates for all rows at once, masks out seen items & repeated
+    candidates and keeps the first sample_size valid ones per row. Only the rows that come up short
+    are topped up by sampling from their remaining items
+
+    item_set, seen: sorted unique arrays
+    """
+    # candidates are drawn as positions in item_set, seen items are marked in a mask over these positions
+    seen_mask = np.zeros(len(item_set), dtype=bool)
+    seen_mask[np.searchsorted(item_set, seen[isin_sorted(seen, item_set)])] = True
+    n_unseen = len(item_set) - int(seen_mask.sum())
+    if n_unseen < sample_size:
+        raise ValueError("Only {} unseen items to draw {} negative samples from".format(n_unseen, sample_size))
+
+    # expected number of draws to get sample_size valid candidates (w/o accounting for repetitions)
+    n_draws = int(np.ceil(oversample * sample_size * len(item_set) / n_unseen)) + 1
+    cands = rng.integers(len(item_set), size=(n_rows, n_draws))
+
+    valid = ~mark_repeated(cands) & ~seen_mask[cands]
+    valid &= np.cumsum(valid, axis=1) <= sample_size
+    n_valid = valid.sum(axis=1)
+
+    samples = np.empty((n_rows, sample_size), dtype=cands.dtype)
+    full = n_valid == sample_size
+    samples[full] = cands[full][valid[full]].reshape(-1, sample_size)
+    for row in np.flatnonzero(~full):
+        drawn = cands[row][valid[row]]
+        remaining = np.flatnonzero(~seen_mask)
+        remaining = remaining[~np.isin(remaining, drawn)]
+        samples[row] = np.concatenate([drawn, rng.choice(remaining, sample_size - len(drawn), replace=False)])
+
+    return item_set[samples]
+
+
 # class RandomNegativeSamplerPerPosition(AbstractNegativeSampler):
 #     @classmethod
 #     def code(cls):
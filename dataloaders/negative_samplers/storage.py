@@ -0,0 +1,132 @@
+from datasets.columnar import ColumnarSplit, iter_event_chunks
+
+import numpy as np
+
+import hashlib
+from collections.abc import Mapping
+from pathlib import Path
+
+
+class NegativeSamples(Mapping):
+    """
+    Read-only dict-like view {user: negatives} over flat arrays, replaces the pickled dicts of the samplers
+
+    users (int64): sorted user indices
+    offsets (int64): user i owns the negatives items[offsets[i]:offsets[i+1]]
+    n_rows (int32): number of positions of user i, whose negatives form an (n_rows x sample_size) block.
+        -1 if the user has a single list of negatives
+    items (int32): flat array of negative item indices
+
+    Indexing returns plain lists, i.e. [neg, ...] or [[neg, ...] per position], like the former dicts
+    """
+
+    FILE_SUFFIXES = {'users': 'users', 'offsets': 'offsets', 'n_rows': 'rows', 'items': 'items'}
+
+    def __init__(self, users, offsets, n_rows, items):
+        assert len(offsets) == len(users) + 1, 'Need exactly one offset per user plus the end offset'
+        self.users = users
+        self.offsets = offsets
+        self.n_rows = n_rows
+        self.items = items
+        self._dense = len(users) == 0 or (int(users[0]) == 0 and int(users[-1]) == len(users) - 1)
+
+    def __len__(self):
+        return len(self.users)
+
+    def __iter__(self):
+        return iter(self.users.tolist())
+
+    def __contains__(self, user):
+        try:
+            self._row(user)
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, user):
+        return self.get_arrays(user).tolist()
+
+    _row = ColumnarSplit._row
+
+    def get_arrays(self, user):
+        # negatives of a user as array slice: (sample_size,) or (n_rows, sample_size)
+        row = self._row(user)
+        negs = self.items[int(self.offsets[row]):int(self.offsets[row + 1])]
+        n_rows = int(self.n_rows[row])
+        if n_rows < 0:
+            return negs
+        return negs.reshape(n_rows, len(negs) // n_rows if n_rows else 0)
+
+    @classmethod
+    def from_dict(cls, negative_samples):
+        # convert {user: [neg, ...]} or {user: [[neg, ...] per position]} into flat arrays
+        users = np.array(sorted(negative_samples.keys()), dtype='int64')
+        n_rows = np.full(len(users), -1, dtype='int32')
+        blocks = []
+        for row, user in enumerate(users.tolist()):
+            negs = negative_samples[user]
+            if len(negs) and isinstance(negs[0], (list, tuple, np.ndarray)):
+                n_rows[row] = len(negs)
+                assert len(set(map(len, negs))) == 1, 'Need the same number of negatives at every position'
+                blocks.append(np.asarray(negs, dtype='int32').ravel())
+            else:
+                blocks.append(np.asarray(negs, dtype='int32'))
+
+        offsets = np.zeros(len(users) + 1, dtype='int64')
+        np.cumsum([len(block) for block in blocks], out=offsets[1:])
+        items = np.concatenate(blocks) if blocks else np.zeros(0, dtype='int32')
+        return cls(users, offsets, n_rows, items)
+
+    @classmethod
+    def path(cls, folder, name, attr):
+        return Path(folder).joinpath('{}_{}.npy'.format(name, cls.FILE_SUFFIXES[attr]))
+
+    def save(self, folder, name):
+        np.save(self.path(folder, name, 'items'), np.asarray(self.items))
+        self.save_index(folder, name)
+
+    def save_index(self, folder, name):
+        # users are written last and mark the negatives as complete
+        for attr in ['n_rows', 'offsets', 'users']:
+            np.save(self.path(folder, name, attr), np.asarray(getattr(self, attr)))
+
+    @classmethod
+    def load(cls, folder, name, mmap_mode='r'):
+        return cls(**{attr: np.load(cls.path(folder, name, attr), mmap_mode=mmap_mode) for attr in cls.FILE_SUFFIXES})
+
+    @classmethod
+    def exists(cls, folder, name):
+        return all(cls.path(folder, name, attr).is_file() for attr in cls.FILE_SUFFIXES)
+
+
+def content_key(item_set, splits, seq_lengths=None):
+    """
+    Hash of everything the negatives are drawn from: the item set, the (user, item) events of the splits
+    and the number of positions per user. Changes whenever the dataset is preprocessed differently
+
+    The events are hashed chunk by chunk, i.e. shard by shard for a ShardedUserStore, which gives the same
+    key as the ColumnarSplit of the same data
+    """
+    digest = hashlib.sha1()
+
+    def update(arr):
+        # lengths keep the boundaries between the arrays apart
+        digest.update(np.int64(len(arr)).tobytes())
+        digest.update(np.ascontiguousarray(arr, dtype='int64').tobytes())
+
+    if item_set is not None:
+        update(np.asarray(item_set))
+    for split in splits:
+        n_events, user_digest, item_digest = 0, hashlib.sha1(), hashlib.sha1()
+        for users, items in iter_event_chunks(split):
+            n_events += len(items)
+            user_digest.update(np.ascontiguousarray(users, dtype='int64').tobytes())
+            item_digest.update(np.ascontiguousarray(items, dtype='int64').tobytes())
+        digest.update(np.int64(n_events).tobytes())
+        digest.update(user_digest.digest())
+        digest.update(item_digest.digest())
+    if seq_lengths is not None:
+        # list indexed by user or dict {user: length}
+        lengths = sorted(seq_lengths.items()) if isinstance(seq_lengths, Mapping) else list(seq_lengths)
+        update(np.array(lengths, dtype='int64').ravel())
+    return digest.hexdigest()[:16]
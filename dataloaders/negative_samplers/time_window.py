@@ -0,0 +1,120 @@
+from .base import AbstractNegativeSampler
+from .parallel import sample_in_order
+from .random import isin_sorted, mark_repeated
+from datasets.columnar import get_item_ids
+
+import numpy as np
+
+
+class TimeWindowNegativeSampler(AbstractNegativeSampler):
+    """
+    Time-sensitive negatives for news: only articles that were live around the interaction, i.e. published
+    within +/- window seconds of the clicked article, are drawn. The publication time of the clicked article
+    stands in for the interaction time, which is not kept in the splits
+
+    Articles are sorted by publication time, so the live window of every position is one searchsorted range.
+    Negatives are drawn uniformly from these ranges for all positions of a user at once
+
+    pub_times (np.ndarray): unix publication time per article index, -1 if unknown. Articles w/o publication
+        time are never drawn. Positions whose window has too few unseen articles use all articles
+    window (float): half width of the live window in seconds
+    """
+
+    def __init__(self, *args, pub_times=None, window=None, **kwargs):
+        super(TimeWindowNegativeSampler, self).__init__(*args, **kwargs)
+        assert pub_times is not None and window is not None, 'Need publication times and window size'
+        self.pub_times = np.asarray(pub_times)
+        self.window = window
+
+    @classmethod
+    def code(cls):
+        return 'time_window'
+
+    def generate_negative_samples(self):
+        negative_samples = sample_in_order(self, np.random.default_rng(self.seed))
+        if self._n_fallback:
+            print('{} positions drew negatives from all articles'.format(self._n_fallback))
+        return negative_samples
+
+    def supports_parallel(self):
+        return True
+
+    def prepare_sampling(self):
+        item_set = np.unique(np.asarray(self.item_set))
+        item_set = item_set[self.pub_times[item_set] >= 0]
+        if len(item_set) < self.sample_size:
+            raise ValueError("Only {} articles with publication time to draw {} negative samples from"
+                             .format(len(item_set), self.sample_size))
+        # articles & their rank by publication time
+        self._by_time = item_set[np.argsort(self.pub_times[item_set], kind='stable')]
+        self._times = self.pub_times[self._by_time]
+        self._rank = np.full(len(self.pub_times), -1, dtype='int64')
+        self._rank[self._by_time] = np.arange(len(self._by_time))
+        self._n_fallback = 0
+
+    def sample_user(self, rng, user):
+        n_articles = len(self._by_time)
+        seen_rank = self._rank[np.fromiter(self.get_seen_items(user), dtype='int64')]
+        seen_rank = np.unique(seen_rank[seen_rank >= 0])
+        if n_articles - len(seen_rank) < self.sample_size:
+            raise ValueError("User {} has seen all but {} articles, need {} negative samples"
+                             .format(user, n_articles - len(seen_rank), self.sample_size))
+
+        # positions refer to the train sequence, a single list of negatives to the test items
+        if self.seq_lengths is not None:
+            centers = self.pub_times[np.asarray(get_item_ids(self.train, user), dtype='int64')][:, None]
+        else:
+            ref_split = self.test if 'test' == self.mode else self.train
+            centers = self.pub_times[np.asarray(get_item_ids(ref_split, user), dtype='int64')][None, :]
+        # live window of each row: [earliest - window, latest + window]
+        known = centers >= 0
+        lo = np.searchsorted(self._times, np.where(known, centers, np.inf).min(axis=1, initial=np.inf) - self.window)
+        hi = np.searchsorted(self._times, np.where(known, centers, -np.inf).max(axis=1, initial=-np.inf) + self.window,
+                             side='right')
+
+        # unknown publication time or too few unseen articles in the window: all articles
+        n_unseen = (hi - lo) - (np.searchsorted(seen_rank, hi) - np.searchsorted(seen_rank, lo))
+        fallback = ~known.any(axis=1) | (n_unseen < self.sample_size)
+        lo[fallback], hi[fallback] = 0, n_articles
+        self._n_fallback += int(fallback.sum())
+
+        return self._by_time[sample_unseen_ranges(rng, lo, hi, seen_rank, self.sample_size)]
+
+    def _get_save_path(self):
+        path = super(TimeWindowNegativeSampler, self)._get_save_path()
+        return path.with_name('{}-window{}s'.format(path.name, self.window))
+
+    def get_naive_random_samples(self, sample_size, item_set):
+        raise NotImplementedError()
+
+
+def sample_unseen_ranges(rng, lo, hi, seen, sample_size, oversample=1.2):
+    """
+    One row of sample_size distinct values from range(lo[i], hi[i]) for each row i, w/o values in seen
+
+    Draws a block of candidates for all rows at once & keeps the first sample_size valid ones per row
+    (see sample_unseen_items). Rows that come up short are topped up from their remaining values
+
+    seen: sorted unique array. every range needs at least sample_size values not in seen
+    """
+    if len(lo) == 0:
+        return np.zeros((0, sample_size), dtype='int64')
+    size = hi - lo
+    n_unseen = size - (np.searchsorted(seen, hi) - np.searchsorted(seen, lo))
+    n_draws = int(np.ceil(oversample * sample_size * np.median(size / np.maximum(n_unseen, 1)))) + 1
+    cands = lo[:, None] + (rng.random((len(lo), n_draws)) * size[:, None]).astype('int64')
+
+    valid = ~mark_repeated(cands) & ~isin_sorted(cands, seen)
+    valid &= np.cumsum(valid, axis=1) <= sample_size
+    n_valid = valid.sum(axis=1)
+
+    samples = np.empty((len(lo), sample_size), dtype='int64')
+    full = n_valid == sample_size
+    samples[full] = cands[full][valid[full]].reshape(-1, sample_size)
+    for row in np.flatnonzero(~full):
+        drawn = cands[row][valid[row]]
+        remaining = np.arange(lo[row], hi[row])
+        remaining = remaining[~isin_sorted(remaining, seen) & ~np.isin(remaining, drawn)]
+        samples[row] = np.concatenate([drawn, rng.choice(remaining, sample_size - len(drawn), replace=False)])
+
+    return samples
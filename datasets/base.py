@@ -1,4 +1,8 @@
 from .utils import *
+from .bundle import DatasetBundle
+from .columnar import SPLIT_NAMES, ColumnarSplit, ShardedUserStore, save_splits
+from .idmap import factorize_ids
+from .stages import StageCache, stage_key
 from config import RAW_DATASET_ROOT_FOLDER
 
 import numpy as np
@@ -12,6 +16,18 @@ import os
 import tempfile
 import shutil
 import pickle
+from functools import partial
+
+
+# key of dataset.pkl listing the separately stored artifacts
+ARTIFACTS_KEY = '__artifacts__'
+# artifact with the key of the last preprocessing stage, i.e. of the raw data & args the dataset was built from
+STAGE_KEY_ARTIFACT = 'stage_key'
+
+
+def load_pickle(path):
+    with Path(path).open('rb') as f:
+        return pickle.load(f)
 
 
 class AbstractDataset(metaclass=ABCMeta):
@@ -19,6 +35,7 @@ class AbstractDataset(metaclass=ABCMeta):
 
         self.args = args
         self.split = args.split
+        self._bundle = None # (dataset path, DatasetBundle) of the last loaded dataset
 
     @classmethod
     @abstractmethod
@@ -61,6 +78,45 @@ class AbstractDataset(metaclass=ABCMeta):
         root = self._get_rawdata_root_path()
         return root.joinpath('preprocessed')
 
+    def _get_stage_cache(self):
+        # intermediate artifacts of all preprocessing stages, addressed by the hash of their inputs
+        return StageCache(self._get_preprocessed_root_path().joinpath('stages'))
+
+    @abstractmethod
+    def _get_stage_params(self):
+        # {stage: args that influence its output} in order of execution
+        pass
+
+    @abstractmethod
+    def _get_stage_keys(self):
+        # {stage: key} in order of execution. the last key identifies the final dataset
+        pass
+
+    @abstractmethod
+    def _raw_data_exists(self):
+        pass
+
+    def _get_params_key(self):
+        # args of all stages, independent of the raw data. part of the preprocessed folder name
+        return stage_key('params', self._get_stage_params())
+
+    def _get_dataset_key(self):
+        return list(self._get_stage_keys().values())[-1]
+
+    def _is_preprocessed(self, dataset_path):
+        # an existing dataset is re-used as is, unless its raw data is present and has changed since
+        if not dataset_path.is_file():
+            return False
+        if self._raw_data_exists():
+            stored_key = self._load_preprocessed_dataset(dataset_path, cache=False).get(STAGE_KEY_ARTIFACT)
+            if stored_key is not None and stored_key != self._get_dataset_key():
+                print('Raw data changed since preprocessing. Preprocess again')
+                # dataset.pkl marks the preprocessing as complete
+                dataset_path.unlink()
+                return False
+        print('Already preprocessed. Skip preprocessing')
+        return True
+
     @abstractmethod
     def _get_preprocessed_folder_path(self):
         preprocessed_root = self._get_preprocessed_root_path()
@@ -72,15 +128,77 @@ class AbstractDataset(metaclass=ABCMeta):
         folder = self._get_preprocessed_folder_path()
         return folder.joinpath('dataset.pkl')
 
+    def _get_artifact_path(self, name, folder=None):
+        # every artifact of a preprocessed dataset (except the splits) is pickled separately
+        folder = self._get_preprocessed_folder_path() if folder is None else folder
+        return folder.joinpath('{}.pkl'.format(name))
+
+    def _save_dataset(self, dataset, dataset_path=None):
+        # store train/val/test as memory-mappable arrays and pickle each remaining artifact separately
+        # dataset.pkl only lists the artifacts. it is written last and marks the preprocessing as complete
+        dataset_path = self._get_preprocessed_dataset_path() if dataset_path is None else dataset_path
+        self._bundle = None
+        # sharded copies of the previous splits, see load_user_store
+        ShardedUserStore.remove_all(dataset_path.parent)
+        save_splits(dataset_path.parent, {name: dataset[name] for name in SPLIT_NAMES})
+        self._save_artifacts(dataset_path, {key: val for key, val in dataset.items() if key not in SPLIT_NAMES})
+
+    def _save_artifacts(self, dataset_path, artifacts):
+        for name, artifact in artifacts.items():
+            with self._get_artifact_path(name, dataset_path.parent).open('wb') as f:
+                pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with dataset_path.open('wb') as f:
+            pickle.dump({ARTIFACTS_KEY: list(artifacts.keys())}, f)
+
+    def _load_preprocessed_dataset(self, dataset_path=None, cache=True):
+        # lazy bundle: artifacts are only unpickled on first access. repeated calls return the same bundle
+        dataset_path = self._get_preprocessed_dataset_path() if dataset_path is None else dataset_path
+        if cache and self._bundle is not None and self._bundle[0] == dataset_path:
+            return self._bundle[1]
+
+        with dataset_path.open('rb') as f:
+            meta = pickle.load(f)
+        if ARTIFACTS_KEY not in meta:
+            # dataset of an older version with all artifacts in one pickle: store them separately once
+            print('Converting preprocessed dataset to separately stored artifacts')
+            if all(name in meta for name in SPLIT_NAMES):
+                save_splits(dataset_path.parent, {name: meta.pop(name) for name in SPLIT_NAMES})
+            self._save_artifacts(dataset_path, meta)
+            meta = {ARTIFACTS_KEY: list(meta.keys())}
+
+        loaders = {name: partial(ColumnarSplit.load, dataset_path.parent, name) for name in SPLIT_NAMES}
+        loaders.update({name: partial(load_pickle, self._get_artifact_path(name, dataset_path.parent))
+                        for name in meta[ARTIFACTS_KEY]})
+        bundle = DatasetBundle(loaders)
+        if cache:
+            self._bundle = (dataset_path, bundle)
+        return bundle
+
+    def load_user_store(self, name, n_shards):
+        # sharded on-disk copy of a split for out-of-core training, created from the preprocessed split on first use
+        folder = self._get_preprocessed_dataset_path().parent
+        if not ShardedUserStore.exists(folder, name, n_shards):
+            print('Writing {} split into {} shards'.format(name, n_shards))
+            return ShardedUserStore.write(folder, name, ColumnarSplit.load(folder, name), n_shards)
+        return ShardedUserStore.load(folder, name, n_shards)
+
 
 
 class AbstractDatasetML(AbstractDataset):
+    # compact dtypes for the raw ratings; subclasses may narrow them further
+    ratings_dtypes = {'uid': 'int32', 'sid': 'int32', 'rating': 'float32', 'timestamp': 'int32'}
+    ratings_chunk_size = 1000000
+
     def __init__(self, args):
         super(AbstractDatasetML, self).__init__(args)
 
         self.min_rating = args.min_rating
         self.min_uc = args.min_uc
         self.min_sc = args.min_sc
+        self.filter_method = args.filter_method
+
+        # interaction counts per raw user & item id, collected while streaming the ratings file
+        self.ratings_counts = None
 
         assert self.min_uc >= 2, 'Need at least 2 ratings per user for validation and test'
 
@@ -116,35 +234,61 @@ class AbstractDatasetML(AbstractDataset):
 
     def load_dataset(self):
         self.preprocess()
-        dataset_path = self._get_preprocessed_dataset_path()
-        dataset = pickle.load(dataset_path.open('rb'))
-        return dataset
+        return self._load_preprocessed_dataset()
 
     def preprocess(self):
         dataset_path = self._get_preprocessed_dataset_path()
-        if dataset_path.is_file():
-            print('Already preprocessed. Skip preprocessing')
+        if self._is_preprocessed(dataset_path):
             return
         if not dataset_path.parent.is_dir():
             dataset_path.parent.mkdir(parents=True)
+        # raw files are part of the stage keys, so they need to be present first
         self.maybe_download_raw_dataset()
-        df = self.load_ratings_df()
-        df = self.make_implicit(df)
-        df = self.filter_triplets(df)
-        df, umap, smap = self.densify_index(df)
-        train, val, test = self.split_df(df, len(umap))
+
+        # each stage only runs if its inputs changed, otherwise its artifact is loaded
+        stages = self._get_stage_cache()
+        keys = self._get_stage_keys()
+
+        def filtered_df():
+            return stages.run('filter', keys['filter'],
+                              lambda: self.filter_triplets(self.make_implicit(self.load_ratings_df())))
+
+        df, umap, smap = stages.run('densify', keys['densify'], lambda: self.densify_index(filtered_df()))
+        train, val, test = stages.run('split', keys['split'], lambda: self.split_df(df, len(umap)))
         dataset = {'train': train,
                    'val': val,
                    'test': test,
                    'umap': umap,
-                   'smap': smap}
-        with dataset_path.open('wb') as f:
-            pickle.dump(dataset, f)
+                   'smap': smap,
+                   STAGE_KEY_ARTIFACT: keys['split']}
+        self._save_dataset(dataset)
+
+    def _get_stage_params(self):
+        return {'load': {'code': self.code(), 'min_rating': self.min_rating, 'dtypes': self.ratings_dtypes},
+                'filter': {'min_uc': self.min_uc, 'min_sc': self.min_sc, 'filter_method': self.filter_method},
+                'densify': {'method': 'factorize'},
+                'split': {'split': self.split, 'dataset_split_seed': self.args.dataset_split_seed,
+                          'eval_set_size': self.args.eval_set_size}}
+
+    def _get_stage_keys(self):
+        folder_path = self._get_rawdata_folder_path()
+        # each stage depends on the one before, the first on the raw files
+        inputs = self._get_stage_cache().fingerprint([folder_path.joinpath(name)
+                                                      for name in self.all_raw_file_names()], folder_path)
+        keys = {}
+        for stage, params in self._get_stage_params().items():
+            keys[stage] = stage_key(stage, params, inputs)
+            inputs = [keys[stage]]
+        return keys
+
+    def _raw_data_exists(self):
+        folder_path = self._get_rawdata_folder_path()
+        return folder_path.is_dir() and \
+            all(folder_path.joinpath(filename).is_file() for filename in self.all_raw_file_names())
 
     def maybe_download_raw_dataset(self):
         folder_path = self._get_rawdata_folder_path()
-        if folder_path.is_dir() and\
-           all(folder_path.joinpath(filename).is_file() for filename in self.all_raw_file_names()):
+        if self._raw_data_exists():
             print('Raw data already exists. Skip downloading')
             return
         print("Raw file doesn't exist. Downloading...")
@@ -168,6 +312,45 @@ class AbstractDatasetML(AbstractDataset):
             shutil.rmtree(tmproot)
             print()
 
+    def stream_ratings(self, file_path, **read_csv_kwargs):
+        # read the ratings file chunk-wise with compact dtypes, turn each chunk into implicit feedback
+        # and count interactions per user & item on the fly. the result is cached as binary file
+        cache_path = self._get_ratings_cache_path()
+        if cache_path.is_file():
+            print('Found cached ratings. Skip parsing {}'.format(file_path.name))
+            return self._load_ratings_cache(cache_path)
+
+        print('Streaming ratings from {}'.format(file_path.name))
+        columns = {col: [] for col in self.ratings_dtypes}
+        counts = {'uid': np.zeros(0, dtype='int64'), 'sid': np.zeros(0, dtype='int64')}
+
+        reader = pd.read_csv(file_path, names=list(self.ratings_dtypes), dtype=self.ratings_dtypes,
+                             chunksize=self.ratings_chunk_size, **read_csv_kwargs)
+        for chunk in tqdm(reader):
+            chunk = chunk[chunk['rating'] >= self.min_rating]
+            for col in columns:
+                columns[col].append(chunk[col].values)
+            for col in counts:
+                counts[col] = add_bincounts(counts[col], chunk[col].values)
+
+        columns = {col: np.concatenate(chunks).astype(self.ratings_dtypes[col], copy=False)
+                   for col, chunks in columns.items()}
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(cache_path, **columns, uid_counts=counts['uid'], sid_counts=counts['sid'])
+
+        self.ratings_counts = dict(counts, n_rows=len(columns['uid']))
+        return pd.DataFrame(columns)
+
+    def _load_ratings_cache(self, cache_path):
+        with np.load(cache_path) as data:
+            df = pd.DataFrame({col: data[col] for col in self.ratings_dtypes})
+            self.ratings_counts = {'uid': data['uid_counts'], 'sid': data['sid_counts'], 'n_rows': len(df)}
+        return df
+
+    def _get_ratings_cache_path(self):
+        # artifact of the 'load' stage
+        return self._get_stage_cache().path('load', self._get_stage_keys()['load'], suffix='.npz')
+
     def make_implicit(self, df):
         print('Turning into implicit ratings')
         df = df[df['rating'] >= self.min_rating]
@@ -176,38 +359,41 @@ class AbstractDatasetML(AbstractDataset):
 
     def filter_triplets(self, df):
         print('Filtering triplets')
+        if 'kcore' == self.filter_method:
+            keep = kcore_filter(df['uid'].values, df['sid'].values, self.min_uc, self.min_sc, iterative=True)
+            return df[keep]
+
         if self.min_sc > 0:
-            item_sizes = df.groupby('sid').size()
-            good_items = item_sizes.index[item_sizes >= self.min_sc]
+            item_sizes = self._count_interactions(df, 'sid')
+            good_items = np.flatnonzero(item_sizes >= self.min_sc)
             df = df[df['sid'].isin(good_items)]
 
         if self.min_uc > 0:
-            user_sizes = df.groupby('uid').size()
-            good_users = user_sizes.index[user_sizes >= self.min_uc]
+            user_sizes = self._count_interactions(df, 'uid')
+            good_users = np.flatnonzero(user_sizes >= self.min_uc)
             df = df[df['uid'].isin(good_users)]
 
         return df
 
+    def _count_interactions(self, df, col):
+        # re-use the counts from streaming ingestion as long as no rows have been removed since
+        if self.ratings_counts is not None and self.ratings_counts['n_rows'] == len(df):
+            return self.ratings_counts[col]
+        return np.bincount(df[col].values)
+
     def densify_index(self, df):
         # map user_ids to indices
         print('Densifying index')
-        umap = {u: i for i, u in enumerate(set(df['uid']))}
-        smap = {s: i for i, s in enumerate(set(df['sid']))}
-        df['uid'] = df['uid'].map(umap)
-        df['sid'] = df['sid'].map(smap)
+        # codes follow the sorted raw ids, i.e. are deterministic. umap/smap are IdMaps instead of dicts
+        df['uid'], umap = factorize_ids(df['uid'].values)
+        df['sid'], smap = factorize_ids(df['sid'].values)
         return df, umap, smap
 
     def split_df(self, df, user_count):
         if self.args.split == 'leave_one_out':
             # preserve the last two items for validation and testing respectively. remainder for training
             print('Splitting')
-            user_group = df.groupby('uid')
-            user2items = user_group.progress_apply(lambda d: list(d.sort_values(by='timestamp')['sid']))
-            train, val, test = {}, {}, {}
-            for user in range(user_count):
-                items = user2items[user]
-                train[user], val[user], test[user] = items[:-2], items[-2:-1], items[-1:]
-            return train, val, test
+            return leave_one_out_split(df['uid'].values, df['sid'].values, df['timestamp'].values)
         elif self.args.split == 'holdout':
             print('Splitting')
             np.random.seed(self.args.dataset_split_seed)
@@ -219,15 +405,9 @@ class AbstractDatasetML(AbstractDataset):
             val_user_index   = permuted_index[-2*eval_set_size:  -eval_set_size]
             test_user_index  = permuted_index[  -eval_set_size:                ]
 
-            # Split DataFrames
-            train_df = df.loc[df['uid'].isin(train_user_index)]
-            val_df   = df.loc[df['uid'].isin(val_user_index)]
-            test_df  = df.loc[df['uid'].isin(test_user_index)]
-
-            # DataFrame to dict => {uid : list of sid's}
-            train = dict(train_df.groupby('uid').progress_apply(lambda d: list(d['sid'])))
-            val   = dict(val_df.groupby('uid').progress_apply(lambda d: list(d['sid'])))
-            test  = dict(test_df.groupby('uid').progress_apply(lambda d: list(d['sid'])))
+            # {uid : list of sid's} for each set of users
+            train, val, test = holdout_split(df['uid'].values, df['sid'].values,
+                                             [train_user_index, val_user_index, test_user_index])
             return train, val, test
 
         else:
@@ -248,6 +428,11 @@ class AbstractDatasetML(AbstractDataset):
         preprocessed_root = self._get_preprocessed_root_path()
         folder_name = '{}_min_rating{}-min_uc{}-min_sc{}-split{}' \
             .format(self.code(), self.min_rating, self.min_uc, self.min_sc, self.split)
+        if 'kcore' == self.filter_method and self.min_sc > 0:
+            # without an item constraint, k-core and single pass filtering give the same result
+            folder_name += '-kcore'
+        # args of all stages. the raw data is checked against the stage key stored in the dataset
+        folder_name += '-{}'.format(self._get_params_key()[:8])
         return preprocessed_root.joinpath(folder_name)
 
     def _get_preprocessed_dataset_path(self):
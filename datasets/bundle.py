@@ -0,0 +1,44 @@
+from collections.abc import MutableMapping
+
+
+class DatasetBundle(MutableMapping):
+    """
+    Dict-like view on a preprocessed dataset whose artifacts (splits, umap, smap, vocab, art2words, art_emb, rnd, ..)
+    are stored separately. Each artifact is loaded on first access and cached afterwards,
+    i.e. consumers only pay for the artifacts they actually use
+
+    loaders (dict): {name: function without arguments that loads the artifact}
+    """
+
+    def __init__(self, loaders):
+        self._loaders = dict(loaders)
+        self._cache = {}
+
+    def __getitem__(self, name):
+        if name not in self._cache:
+            if name not in self._loaders:
+                raise KeyError(name)
+            self._cache[name] = self._loaders[name]()
+        return self._cache[name]
+
+    def __setitem__(self, name, value):
+        self._cache[name] = value
+
+    def __delitem__(self, name):
+        if name not in self._cache and name not in self._loaders:
+            raise KeyError(name)
+        self._cache.pop(name, None)
+        self._loaders.pop(name, None)
+
+    def __iter__(self):
+        yield from self._loaders
+        yield from (name for name in self._cache if name not in self._loaders)
+
+    def __len__(self):
+        return len(set(self._loaders) | set(self._cache))
+
+    def __contains__(self, name):
+        return name in self._cache or name in self._loaders
+
+    def is_loaded(self, name):
+        return name in self._cache
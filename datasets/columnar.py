@@ -0,0 +1,402 @@
+import numpy as np
+
+import shutil
+from collections.abc import Mapping
+from pathlib import Path
+
+
+SPLIT_NAMES = ('train', 'val', 'test')
+
+
+class ColumnarSplit(Mapping):
+    """
+    Read-only dict-like view {user: sequence} over CSR-style arrays
+
+    users (int64): sorted user indices present in this split
+    offsets (int64): user i owns the events items[offsets[i]:offsets[i+1]]
+    items (int32): flat array of item indices
+    time_stamps (optional): one time vector per event, e.g. [weekday, hour, minute, second]
+
+    Indexing returns plain lists, i.e. [item_1, ..., item_L] or [(item_1, ts_1), ..., (item_L, ts_L)]
+    when time stamps are present, so existing consumers work on it like on the former dicts
+    """
+
+    FILE_SUFFIXES = {'users': 'users', 'offsets': 'offsets', 'items': 'items', 'time_stamps': 'time'}
+
+    def __init__(self, users, offsets, items, time_stamps=None):
+        assert len(offsets) == len(users) + 1, 'Need exactly one offset per user plus the end offset'
+        self.users = users
+        self.offsets = offsets
+        self.items = items
+        self.time_stamps = time_stamps
+        # users are usually dense indices [0, N) which allows direct row lookups
+        self._dense = len(users) == 0 or (int(users[0]) == 0 and int(users[-1]) == len(users) - 1)
+
+    def __len__(self):
+        return len(self.users)
+
+    def __iter__(self):
+        return iter(self.users.tolist())
+
+    def __contains__(self, user):
+        try:
+            self._row(user)
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, user):
+        row = self._row(user)
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        items = self.items[start:end].tolist()
+        if self.time_stamps is None:
+            return items
+        return list(zip(items, self.time_stamps[start:end].tolist()))
+
+    def _row(self, user):
+        if not isinstance(user, (int, np.integer)):
+            raise KeyError(user)
+        if self._dense:
+            if 0 <= user < len(self.users):
+                return int(user)
+            raise KeyError(user)
+        row = int(np.searchsorted(self.users, user))
+        if row < len(self.users) and self.users[row] == user:
+            return row
+        raise KeyError(user)
+
+    @property
+    def w_time_stamps(self):
+        return self.time_stamps is not None
+
+    def get_arrays(self, user):
+        # zip-free access to a user's sequence: (items, time stamps or None) as array slices
+        row = self._row(user)
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        time_stamps = None if self.time_stamps is None else self.time_stamps[start:end]
+        return self.items[start:end], time_stamps
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def update(self, u2seq, drop=()):
+        """
+        New split with the sequences of the users in u2seq replaced (or added) and the users in drop removed
+
+        Only the changed users are converted (see from_dict). The events of all other users are gathered from
+        the existing arrays, which may be memory-mapped, i.e. their sequences are never turned into lists
+        """
+        block = u2seq if isinstance(u2seq, ColumnarSplit) else ColumnarSplit.from_dict(u2seq)
+        n_old = len(self.items)
+        keep = ~np.isin(self.users, np.concatenate([block.users, np.asarray(list(drop), dtype='int64')]))
+
+        # rows in user order. the events of the new block follow those of this split
+        users = np.concatenate([np.asarray(self.users)[keep], block.users])
+        starts = np.concatenate([np.asarray(self.offsets[:-1])[keep], block.offsets[:-1] + n_old])
+        lengths = np.concatenate([self.lengths()[keep], block.lengths()])
+        order = np.argsort(users, kind='stable')
+        users, starts, lengths = users[order], starts[order], lengths[order]
+        offsets = np.zeros(len(users) + 1, dtype='int64')
+        np.cumsum(lengths, out=offsets[1:])
+        # position of each event in the concatenation of both event arrays
+        events = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+        items = _gather(self.items, block.items, events)
+        time_stamps = None
+        if self.time_stamps is not None or block.time_stamps is not None:
+            # a split w/o time stamps only has empty sequences
+            old_time_stamps, new_time_stamps = self.time_stamps, block.time_stamps
+            if old_time_stamps is None:
+                assert n_old == 0, 'Cannot add time stamps to a split with events w/o time stamps'
+                old_time_stamps = np.zeros((0,) + new_time_stamps.shape[1:], dtype=new_time_stamps.dtype)
+            if new_time_stamps is None:
+                assert len(block.items) == 0, 'Cannot add events w/o time stamps to a split with time stamps'
+                new_time_stamps = np.zeros((0,) + old_time_stamps.shape[1:], dtype=old_time_stamps.dtype)
+            time_stamps = _gather(old_time_stamps, new_time_stamps, events)
+        return ColumnarSplit(users, offsets, items, time_stamps)
+
+    @classmethod
+    def from_dict(cls, u2seq):
+        # convert {user: [item, ...]} or {user: [(item, ts_vec), ...]} into flat arrays
+        users = np.array(sorted(u2seq.keys()), dtype='int64')
+        lengths = np.fromiter((len(u2seq[u]) for u in users.tolist()), dtype='int64', count=len(users))
+        offsets = np.zeros(len(users) + 1, dtype='int64')
+        np.cumsum(lengths, out=offsets[1:])
+
+        first = next((seq[0] for seq in u2seq.values() if len(seq)), None)
+        if isinstance(first, tuple):
+            items, time_stamps = [], []
+            for u in users.tolist():
+                for item, ts in u2seq[u]:
+                    items.append(item)
+                    time_stamps.append(ts)
+            time_stamps = np.array(time_stamps)
+            if np.issubdtype(time_stamps.dtype, np.integer):
+                # raw time vectors, e.g. [weekday, hour, minute, second], fit into 16 bit
+                time_stamps = time_stamps.astype('int16')
+            else:
+                time_stamps = time_stamps.astype('float32')
+            items = np.array(items, dtype='int32')
+        else:
+            items = np.fromiter((item for u in users.tolist() for item in u2seq[u]), dtype='int32',
+                                count=int(offsets[-1]))
+            time_stamps = None
+
+        return cls(users, offsets, items, time_stamps)
+
+    def save(self, folder, name):
+        folder = Path(folder)
+        for attr, suffix in self.FILE_SUFFIXES.items():
+            arr = getattr(self, attr)
+            if arr is not None:
+                np.save(folder.joinpath('{}_{}.npy'.format(name, suffix)), np.asarray(arr))
+
+    @classmethod
+    def load(cls, folder, name, mmap_mode='r'):
+        folder = Path(folder)
+        arrays = {}
+        for attr, suffix in cls.FILE_SUFFIXES.items():
+            path = folder.joinpath('{}_{}.npy'.format(name, suffix))
+            arrays[attr] = np.load(path, mmap_mode=mmap_mode) if path.is_file() else None
+        return cls(**arrays)
+
+    @classmethod
+    def exists(cls, folder, name):
+        folder = Path(folder)
+        return all(folder.joinpath('{}_{}.npy'.format(name, cls.FILE_SUFFIXES[attr])).is_file()
+                   for attr in ['users', 'offsets', 'items'])
+
+
+def _gather(old, new, events):
+    # values of the concatenation [old, new] at the given positions, w/o concatenating both arrays
+    out = np.empty((len(events),) + old.shape[1:], dtype=old.dtype)
+    from_old = events < len(old)
+    out[from_old] = old[events[from_old]]
+    out[~from_old] = new[events[~from_old] - len(old)]
+    return out
+
+
+def save_splits(folder, splits):
+    # splits (dict): {'train': {user: seq}, 'val': ..., 'test': ...} as dicts or ColumnarSplit
+    for name, split in splits.items():
+        if not isinstance(split, ColumnarSplit):
+            split = ColumnarSplit.from_dict(split)
+        split.save(folder, name)
+
+
+def load_splits(folder, mmap_mode='r'):
+    return {name: ColumnarSplit.load(folder, name, mmap_mode=mmap_mode) for name in SPLIT_NAMES}
+
+
+class ShardedUserStore(Mapping):
+    """
+    Out-of-core variant of ColumnarSplit: the events are spread over n_shards files and only the
+    requested user's slice is read from the memory-mapped shard
+
+    users (int64): sorted user indices
+    shard (int16), offset (int64), length (int32): user i owns shards[shard[i]].items[offset[i]:offset[i] + length[i]]
+    shards: list of (items, time_stamps or None) arrays, one per shard file
+
+    Users are assigned to shards in contiguous ranges of roughly equal event counts, i.e. iterating
+    users in index order (or shard by shard, see shard_rows) reads each shard sequentially
+    """
+
+    INDEX_FIELDS = ('users', 'shard', 'offset', 'length')
+
+    def __init__(self, users, shard, offset, length, shards):
+        self.users = users
+        self.shard = shard
+        self.offset = offset
+        self.length = length
+        self.shards = shards
+        self._dense = len(users) == 0 or (int(users[0]) == 0 and int(users[-1]) == len(users) - 1)
+
+    def __len__(self):
+        return len(self.users)
+
+    def __iter__(self):
+        return iter(self.users.tolist())
+
+    def __contains__(self, user):
+        try:
+            self._row(user)
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, user):
+        items, time_stamps = self.get_arrays(user)
+        if time_stamps is None:
+            return items.tolist()
+        return list(zip(items.tolist(), time_stamps.tolist()))
+
+    _row = ColumnarSplit._row
+
+    @property
+    def n_shards(self):
+        return len(self.shards)
+
+    @property
+    def w_time_stamps(self):
+        return len(self.shards) > 0 and self.shards[0][1] is not None
+
+    def get_arrays(self, user):
+        row = self._row(user)
+        items, time_stamps = self.shards[int(self.shard[row])]
+        start = int(self.offset[row])
+        end = start + int(self.length[row])
+        return items[start:end], (None if time_stamps is None else time_stamps[start:end])
+
+    def lengths(self):
+        return np.asarray(self.length, dtype='int64')
+
+    def shard_rows(self):
+        # rows (positions in users) of each shard
+        bounds = np.searchsorted(self.shard, np.arange(self.n_shards + 1))
+        return [np.arange(bounds[k], bounds[k + 1]) for k in range(self.n_shards)]
+
+    @staticmethod
+    def _folder(folder, name, n_shards):
+        return Path(folder).joinpath('{}_{}shards'.format(name, n_shards))
+
+    @classmethod
+    def write(cls, folder, name, split, n_shards):
+        """
+        Store a split (ColumnarSplit or dict) as n_shards shard files + index in <folder>/<name>_<n>shards/
+        Shards are written one after another from contiguous slices, i.e. a memory-mapped
+        split is never fully loaded
+        """
+        if not isinstance(split, ColumnarSplit):
+            split = ColumnarSplit.from_dict(split)
+        store_folder = cls._folder(folder, name, n_shards)
+        store_folder.mkdir(parents=True, exist_ok=True)
+
+        offsets = np.asarray(split.offsets)
+        n_users = len(split.users)
+        # contiguous user ranges with roughly the same number of events
+        targets = np.arange(1, n_shards) * (offsets[-1] / n_shards)
+        cuts = np.concatenate([[0], np.searchsorted(offsets[1:], targets, side='left') + 1, [n_users]])
+        cuts = np.minimum(np.maximum.accumulate(cuts), n_users)
+
+        shard = np.zeros(n_users, dtype='int16')
+        offset = np.zeros(n_users, dtype='int64')
+        for k in range(n_shards):
+            lo, hi = int(cuts[k]), int(cuts[k + 1])
+            start, end = int(offsets[lo]), int(offsets[hi])
+            shard[lo:hi] = k
+            offset[lo:hi] = offsets[lo:hi] - start
+            np.save(store_folder.joinpath('shard{}_items.npy'.format(k)), np.asarray(split.items[start:end]))
+            if split.time_stamps is not None:
+                np.save(store_folder.joinpath('shard{}_time.npy'.format(k)), np.asarray(split.time_stamps[start:end]))
+
+        index = {'users': np.asarray(split.users), 'shard': shard, 'offset': offset,
+                 'length': np.diff(offsets).astype('int32')}
+        # the index is written last and marks the store as complete
+        for field in cls.INDEX_FIELDS:
+            np.save(store_folder.joinpath('index_{}.npy'.format(field)), index[field])
+        return cls.load(folder, name, n_shards)
+
+    @classmethod
+    def load(cls, folder, name, n_shards, mmap_mode='r'):
+        store_folder = cls._folder(folder, name, n_shards)
+        index = {field: np.load(store_folder.joinpath('index_{}.npy'.format(field)), mmap_mode=mmap_mode)
+                 for field in cls.INDEX_FIELDS}
+        shards = []
+        for k in range(n_shards):
+            time_path = store_folder.joinpath('shard{}_time.npy'.format(k))
+            shards.append((np.load(store_folder.joinpath('shard{}_items.npy'.format(k)), mmap_mode=mmap_mode),
+                           np.load(time_path, mmap_mode=mmap_mode) if time_path.is_file() else None))
+        return cls(shards=shards, **index)
+
+    @classmethod
+    def remove_all(cls, folder):
+        # stores of all splits & shard counts in folder, which are stale once the splits are rewritten
+        for store_folder in Path(folder).glob('*_*shards'):
+            if store_folder.is_dir() and store_folder.name.split('_')[0] in SPLIT_NAMES:
+                shutil.rmtree(str(store_folder))
+
+    @classmethod
+    def exists(cls, folder, name, n_shards):
+        store_folder = cls._folder(folder, name, n_shards)
+        return all(store_folder.joinpath('index_{}.npy'.format(field)).is_file() for field in cls.INDEX_FIELDS)
+
+
+def is_columnar(u2seq):
+    return isinstance(u2seq, (ColumnarSplit, ShardedUserStore))
+
+
+def get_items_and_time_stamps(u2seq, user, w_time_stamps=False):
+    """
+    Item indices (list) & time vectors (np.ndarray or None) of a user's sequence
+    u2seq is a ColumnarSplit, ShardedUserStore or a dict {user: [item, ...]} / {user: [(item, ts_vec), ...]}
+    """
+    if is_columnar(u2seq):
+        items, time_stamps = u2seq.get_arrays(user)
+        return items.tolist(), (time_stamps if w_time_stamps else None)
+
+    seq = u2seq[user]
+    if len(seq) > 0 and isinstance(seq[0], tuple):
+        items, time_stamps = zip(*seq)
+        return list(items), (np.array(time_stamps) if w_time_stamps else None)
+    return list(seq), None
+
+
+def get_item_ids(u2seq, user):
+    # item indices of a user's sequence, w/o time stamps. users without sequence have no items
+    if user not in u2seq:
+        return []
+    return get_items_and_time_stamps(u2seq, user)[0]
+
+
+def iter_event_chunks(u2seq):
+    """
+    (user indices, item indices) of all events of a split as arrays, in user order. A ShardedUserStore
+    yields one chunk per shard, i.e. only one shard is read at a time, other splits a single chunk
+
+    Consumers that aggregate chunk by chunk (counts, uniques, hashes) never hold a sharded split in memory
+    """
+    if isinstance(u2seq, ShardedUserStore):
+        for k, rows in enumerate(u2seq.shard_rows()):
+            if len(rows) == 0:
+                continue
+            lengths = np.asarray(u2seq.length[rows], dtype='int64')
+            ends = np.cumsum(lengths)
+            # position of each event in the shard
+            events = np.repeat(np.asarray(u2seq.offset[rows]) - (ends - lengths), lengths) + np.arange(ends[-1])
+            yield np.repeat(np.asarray(u2seq.users[rows], dtype='int64'), lengths), \
+                np.asarray(u2seq.shards[k][0][events])
+    elif isinstance(u2seq, ColumnarSplit):
+        yield np.repeat(np.asarray(u2seq.users, dtype='int64'), u2seq.lengths()), np.asarray(u2seq.items)
+    else:
+        users, items = [], []
+        for user in u2seq:
+            user_items = get_item_ids(u2seq, user)
+            users.extend([user] * len(user_items))
+            items.extend(user_items)
+        yield np.array(users, dtype='int64'), np.array(items, dtype='int64')
+
+
+def get_all_item_ids(u2seq):
+    # flat array of all item indices in a split. materialises sharded splits, see iter_event_chunks
+    if isinstance(u2seq, ColumnarSplit):
+        return np.asarray(u2seq.items)
+    chunks = [items for _, items in iter_event_chunks(u2seq)]
+    if len(chunks) == 1:
+        return chunks[0]
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype='int32')
+
+
+def get_all_user_ids(u2seq):
+    # user index of each entry of get_all_item_ids
+    chunks = [users for users, _ in iter_event_chunks(u2seq)]
+    if len(chunks) == 1:
+        return chunks[0]
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype='int64')
+
+
+def get_unique_item_ids(u2seq):
+    # sorted unique item indices of a split, one chunk at a time
+    unique = np.zeros(0, dtype='int64')
+    for _, items in iter_event_chunks(u2seq):
+        unique = np.union1d(unique, np.unique(items))
+    return unique
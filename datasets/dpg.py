@@ -3,16 +3,23 @@ import arrow
 import pickle
 import random
 import numpy as np
+import torch
 from pathlib import Path
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from abc import *
-from sklearn.preprocessing import StandardScaler
 
-from .base import AbstractDataset
-from source.preprocessing.utils_news_prep import precompute_dpg_art_emb, preprocess_dpg_news_file, prep_dpg_user_file
+from .base import AbstractDataset, STAGE_KEY_ARTIFACT
+from .columnar import SPLIT_NAMES, ColumnarSplit
+from .utils import StreamingStandardScaler
+from .stages import stage_key
+from source.preprocessing.utils_news_prep import precompute_dpg_art_emb, preprocess_dpg_news_file, prep_dpg_user_file, \
+    encode_dpg_news_with_vocab
 from source.preprocessing.get_dpg_data_sample import get_data_n_rnd_users
-from source.utils import map_time_stamp_to_vector
+from source.utils import map_time_stamp_to_vector, timestamps_to_vectors, time_vector_fields
 
+# bump if the output format of the news or user stage changes, so cached artifacts are not re-used
+NEWS_STAGE_VERSION = 2
+USER_STAGE_VERSION = 2
 
 
 class AbstractDatasetDPG(AbstractDataset):
@@ -24,6 +31,7 @@ class AbstractDatasetDPG(AbstractDataset):
         self.use_content = args.use_article_content
         self.pt_news_encoder = args.pt_news_encoder
         self.w_time_stamp = args.incl_time_stamp
+        self.len_time_vec = args.len_time_vec
 
         seed = args.dataloader_random_seed
         self.rnd = random.Random(seed)
@@ -31,6 +39,9 @@ class AbstractDatasetDPG(AbstractDataset):
         self.vocab = None
         self.art_idx2word_ids = None
         self.art_embs = None
+        self.ts_scaler = None
+
+        self._increments = None # [(folder, key)] of args.dpg_increment_path, see _get_increments
 
     @property
     def sample_method(self):
@@ -43,17 +54,73 @@ class AbstractDatasetDPG(AbstractDataset):
     def _get_all_precomputed_art_emb_path(self):
         return Path(self.args.pt_art_emb_path)
 
-    def _get_preprocessed_folder_path(self):
+    def _get_preprocessed_folder_path(self, increment_keys=None):
         preprocessed_root = self._get_preprocessed_root_path()
-        folder_name = '{}-min_len{}-{}-nenc_{}-time{}' \
-            .format(self.code(), self.min_hist_len, self.split, self.pt_news_encoder, int(self.w_time_stamp))
+        folder_name = '{}-min_len{}-{}-nenc_{}-time{}-{}' \
+            .format(self.code(), self.min_hist_len, self.split, self.pt_news_encoder, int(self.w_time_stamp),
+                    self._get_params_key()[:8])
+        if increment_keys is None:
+            increment_keys = [key for _, key in self._get_increments()]
+        if increment_keys:
+            # the base dataset extended by these increments, in this order
+            folder_name += '-inc{}'.format(stage_key('increments', {}, increment_keys)[:8])
         return preprocessed_root.joinpath(folder_name)
 
+    def _get_preprocessed_dataset_path(self, increment_keys=None):
+        return self._get_preprocessed_folder_path(increment_keys).joinpath('dataset.pkl')
+
+    def _get_increments(self):
+        # folders of args.dpg_increment_path & the hash of their content, in order of application
+        if self._increments is None:
+            folders = self.args.dpg_increment_path or []
+            folders = [folders] if isinstance(folders, str) else folders
+            stages = self._get_stage_cache()
+            self._increments = []
+            for folder in map(Path, folders):
+                files = stages.fingerprint([folder.joinpath(name) for name in ['user_data.pkl', 'news_data.pkl']],
+                                           folder)
+                self._increments.append((folder, stage_key('increment', {}, files)))
+        return self._increments
+
+    def _get_stage_params(self):
+        args = self.args
+        # tokenisation & vocab or article embeddings
+        news = {'version': NEWS_STAGE_VERSION,
+                'use_content': self.use_content, 'pt_news_encoder': self.pt_news_encoder,
+                'language': args.language, 'min_counts_for_vocab': args.min_counts_for_vocab,
+                'max_article_len': args.max_article_len, 'max_vocab_size': args.max_vocab_size,
+                'dim_art_emb': args.dim_art_emb, 'lower_case': args.lower_case,
+                'pd_vocab': args.pd_vocab, 'path_pt_news_enc': args.path_pt_news_enc,
+                'bert_feature_method': args.bert_feature_method}
+        # filtering, index & split of user histories
+        users = {'version': USER_STAGE_VERSION,
+                 'min_hist_len': self.min_hist_len, 'train_method': args.train_method,
+                 'split': self.split, 'time_threshold': args.time_threshold,
+                 'incl_time_stamp': self.w_time_stamp, 'len_time_vec': self.len_time_vec,
+                 'normalise_time_stamps': args.normalise_time_stamps,
+                 'validation_portion': args.validation_portion,
+                 'dataloader_random_seed': args.dataloader_random_seed}
+        return {'news': news, 'users': users}
+
+    def _get_stage_keys(self):
+        folder_path = self._get_sampledata_folder_path()
+        stages = self._get_stage_cache()
+        params = self._get_stage_params()
+
+        keys = {}
+        keys['news'] = stage_key('news', params['news'],
+                                 stages.fingerprint(folder_path.joinpath('news_data.pkl'), folder_path))
+        user_files = stages.fingerprint(folder_path.joinpath('user_data.pkl'), folder_path)
+        keys['users'] = stage_key('users', params['users'], [keys['news']] + user_files)
+        return keys
+
+    def _raw_data_exists(self):
+        folder_path = self._get_sampledata_folder_path()
+        return all(folder_path.joinpath(name).is_file() for name in ['user_data.pkl', 'news_data.pkl'])
+
     def load_dataset(self):
         self.preprocess()
-        dataset_path = self._get_preprocessed_dataset_path()
-        dataset = pickle.load(dataset_path.open('rb'))
-        return dataset
+        return self._load_preprocessed_dataset()
 
     def load_pc_art_embs(self):
         pt_art_emb_path = self._get_precomputed_art_emb_path()
@@ -64,45 +131,89 @@ class AbstractDatasetDPG(AbstractDataset):
 
     def preprocess(self):
         dataset_path = self._get_preprocessed_dataset_path()
-        if dataset_path.is_file():
-            print('Already preprocessed. Skip preprocessing')
+        if self._is_preprocessed(dataset_path):
+            return
+        if self._get_increments():
+            self.preprocess_incremental(self._get_increments())
             return
         if not dataset_path.parent.is_dir():
             dataset_path.parent.mkdir(parents=True)
+        self._preprocess_base(dataset_path)
 
-        pt_art_emb_path = self._get_precomputed_art_emb_path()
-        if pt_art_emb_path.is_file():
-            print("Found pre-computed article embeddings for this setting. Skip re-computing")
-            with pt_art_emb_path.open('rb') as fin:
-                self.art_embs = pickle.load(fin) # matrix containing article embeddings
-
+    def _preprocess_base(self, dataset_path):
         ###################
         # Preprocess data
-        news_data, art_id2idx = self.prep_dpg_news_data()
+        # each stage only runs if its inputs changed, otherwise its artifact is loaded
+        stages = self._get_stage_cache()
+        keys = self._get_stage_keys()
 
-        train, val, test, u_id2idx = self.prep_dpg_user_data(news_data, art_id2idx)
+        news = stages.run('news', keys['news'], self._run_news_stage)
+        users = stages.run('users', keys['users'], lambda: self._run_user_stage(news['smap']))
 
         #train, val, test = self.split_data(user_data, len(u_id2idx))
 
         # train (dict): {user_idx: [art_idx_1, ..., art_idx_L_u] } ## w/o time
         # train (dict): {user_idx: [(art_idx_1, time_stamp_1), ..., (art_idx_L_u, time_stamp_L_u)] } ## w/ time
 
-        dataset = {'train': train,
-                   'val': val,
-                   'test': test,
-                   'umap': u_id2idx,
-                   'smap': art_id2idx,
-                   'vocab': self.vocab,
-                   'art2words': self.art_idx2word_ids,
-                   'art_emb': self.art_embs, # article emb matrix
-                   'rnd': self.rnd}
+        dataset = dict(news, **users)
+        dataset[STAGE_KEY_ARTIFACT] = keys['users']
 
         # save
-        with dataset_path.open('wb') as fout:
-            pickle.dump(dataset, fout)
+        self._save_dataset(dataset, dataset_path)
+
+    def _run_news_stage(self):
+        news_data, art_id2idx = self.prep_dpg_news_data()
+        return {'smap': art_id2idx,
+                'vocab': self.vocab,
+                'art2words': self.art_idx2word_ids,
+                'art_emb': self.art_embs, # article emb matrix
+                'pub_times': get_pub_times(news_data['all'], art_id2idx)} # for time-sensitive negative sampling
+
+    def _run_user_stage(self, art_id2idx):
+        # the raw news data is not needed to prepare the user histories
+        train, val, test, u_id2idx = self.prep_dpg_user_data(None, art_id2idx)
+        return {'train': train,
+                'val': val,
+                'test': test,
+                'umap': u_id2idx,
+                'ts_scaler': self.ts_scaler,
+                'rnd': self.rnd}
+
+    def preprocess_incremental(self, increments):
+        # append the last slice of interactions & articles (user_data.pkl, news_data.pkl) to the dataset of the
+        # preceding increments, or the base dataset. each is built first if it does not exist yet
+        # only the affected users and the new articles are processed. the raw sample is left untouched
+        keys = [key for _, key in increments]
+        prev_path = self._get_preprocessed_dataset_path(keys[:-1])
+        if not self._is_preprocessed(prev_path):
+            if len(increments) > 1:
+                self.preprocess_incremental(increments[:-1])
+            else:
+                prev_path.parent.mkdir(parents=True, exist_ok=True)
+                self._preprocess_base(prev_path)
+
+        increment_folder = increments[-1][0]
+        print("> Applying increment {} ..".format(increment_folder))
+        # fresh bundle, as the artifacts are modified in place
+        dataset = self._load_preprocessed_dataset(prev_path, cache=False)
+        new_user_data = pickle.load(increment_folder.joinpath('user_data.pkl').open('rb'))
+        new_news_data = pickle.load(increment_folder.joinpath('news_data.pkl').open('rb'))
+        self.rnd = dataset['rnd'] # continue with the same random state
+
+        self.prep_dpg_news_increment(new_news_data, dataset)
+
+        # full reading histories of the affected users, i.e. including the preceding increments
+        user_data = self.load_raw_read_histories()
+        for folder, _ in increments[:-1]:
+            merge_raw_read_histories(user_data, pickle.load(folder.joinpath('user_data.pkl').open('rb')))
+        affected_users = merge_raw_read_histories(user_data, new_user_data)
+        self.prep_dpg_user_increment(user_data, affected_users, dataset)
 
-        with pt_art_emb_path.open('wb') as fout:
-            pickle.dump(self.art_embs, fout)
+        dataset['increments'] = keys
+        dataset['rnd'] = self.rnd
+        dataset_path = self._get_preprocessed_dataset_path(keys)
+        dataset_path.parent.mkdir(parents=True, exist_ok=True)
+        self._save_dataset(dataset, dataset_path)
 
 
     def split_data(self, user_data, user_count):
@@ -156,8 +267,14 @@ class AbstractDatasetDPG(AbstractDataset):
         return news_data
 
     def _get_precomputed_art_emb_path(self):
-        folder = self._get_preprocessed_folder_path()
-        return folder.joinpath('pt_art_embs.pkl')
+        return self._get_artifact_path('art_emb')
+
+    def _get_artifact_path(self, name, folder=None):
+        if 'art_emb' == name:
+            # the article embedding matrix is read directly by the model, see args.rel_pc_art_emb_path
+            folder = self._get_preprocessed_folder_path() if folder is None else folder
+            return folder.joinpath('pt_art_embs.pkl')
+        return super(AbstractDatasetDPG, self)._get_artifact_path(name, folder)
 
     @abstractmethod
     def prep_dpg_user_data(self):
@@ -209,120 +326,272 @@ class DPG_Nov19Dataset(AbstractDatasetDPG):
         #     return train, val, test
 
         train, val, test = defaultdict(list), defaultdict(list), defaultdict(list)
-        all_ts = defaultdict(list)
         print("> Prepping user data ..")
-        for u_id in user_data.keys():
-
-            if 'masked_item' == self.args.train_method:
-
-                if 'time_threshold' == self.args.split:
-                    # split user interactions according to certain threshold timestamp
-                    # e.g. first 3 weeks for training, last week for testing
-                    try:
-                        threshold_date = arrow.get(self.args.time_threshold, "DD-MM-YYYY HH:mm:ss").timestamp
-                        #1574639999
-                    except:
-                        raise ValueError("Threshold date must string of format: 'DD-MM-YYYY HH:mm:ss'")
-
-                    # check if data has already been separated into train & test
-                    if 'articles_train' in user_data[u_id].keys():
-                        train_items = [(art_id2idx[art_id], map_time_stamp_to_vector(ts)) for art_id, ts
-                                       in sorted(user_data[u_id]['articles_train'], key=lambda tup: tup[1])
-                                       if art_id in art_id2idx]
-
-                        test_items = [(art_id2idx[art_id], map_time_stamp_to_vector(ts)) for art_id, ts
-                                      in sorted(user_data[u_id]['articles_test'], key=lambda tup: tup[1])
-                                      if art_id in art_id2idx]
-
-
-                        if len(test_items) < 1 or len(train_items) < 2:
-                            continue
-
-                        # confirm time intervals
-                        # if train_items[-1][1] <= threshold_date and test_items[0][1] >= threshold_date:
-                        #     pass
-                        # else:
-                        #     raise ValueError("Split into time intervals incorrect. check preprocessing!")
-
-                        u_id2idx[u_id] = u_idx = len(u_id2idx)  # create mapping from u_id to index
-
-                        if self.w_time_stamp:
-                            train[u_idx] = train_items
-                            test[u_idx] = test_items
-                            all_ts['train'].extend([*list(zip(*train_items))[1]]) # ts: [DD, HH, mm, ss]
-                            all_ts['test'].extend([*list(zip(*test_items))[1]])
-                        else:
-                            train[u_idx] = [*list(zip(*train_items))[0]]
-                            test[u_idx] = [*list(zip(*test_items))[0]]
+        if 'columnar' == self.args.dpg_prep_engine and 'masked_item' == self.args.train_method \
+                and 'time_threshold' == self.args.split:
+            train, val, test, u_id2idx = self.prep_time_split_users_columnar(user_data, art_id2idx)
+        else:
+            for u_id in user_data.keys():
 
+                if 'masked_item' == self.args.train_method:
 
-                        # add to validation sample
-                        val[u_idx] = self.select_rnd_item_for_validation(test[u_idx])
+                    if 'time_threshold' == self.args.split:
+                        # split user interactions according to certain threshold timestamp
+                        # e.g. first 3 weeks for training, last week for testing
+                        threshold_date = self.get_threshold_date()
 
-                    else:
-                        # split user history according to time stamps. usually this is done in sampling process earlier
-                        full_hist = [(art_id2idx[art_id], time_stamp) for art_id, time_stamp
-                                      in sorted(user_data[u_id]['articles_read'], key=lambda tup: tup[1])]
-                        tmp_test = []
-                        for i, (item, ts) in enumerate(full_hist):
-                            if ts < threshold_date:
-                                train[u_idx].append((item, map_time_stamp_to_vector(ts)) if self.w_time_stamp else item)
-                            else:
-                                if self.w_time_stamp:
-                                    tmp_test = [(item, map_time_stamp_to_vector(ts)) for item, ts in full_hist[i:]]
+                        # check if data has already been separated into train & test
+                        if 'articles_train' in user_data[u_id].keys():
+                            items = self.prep_time_split_user(user_data[u_id], art_id2idx)
+                            if items is None:
+                                continue
+
+                            u_id2idx[u_id] = u_idx = len(u_id2idx)  # create mapping from u_id to index
+                            train[u_idx], test[u_idx] = items
+
+                            # add to validation sample
+                            val[u_idx] = self.select_rnd_item_for_validation(test[u_idx])
+
+                        else:
+                            # split user history according to time stamps. usually this is done in sampling process earlier
+                            full_hist = [(art_id2idx[art_id], time_stamp) for art_id, time_stamp
+                                          in sorted(user_data[u_id]['articles_read'], key=lambda tup: tup[1])]
+                            tmp_test = []
+                            for i, (item, ts) in enumerate(full_hist):
+                                if ts < threshold_date:
+                                    train[u_idx].append((item, map_time_stamp_to_vector(ts, self.len_time_vec)) if self.w_time_stamp else item)
                                 else:
-                                    tmp_test = [*list(zip(*full_hist[i:]))[0]]
-                                break
+                                    if self.w_time_stamp:
+                                        tmp_test = [(item, map_time_stamp_to_vector(ts, self.len_time_vec)) for item, ts in full_hist[i:]]
+                                    else:
+                                        tmp_test = [*list(zip(*full_hist[i:]))[0]]
+                                    break
 
-                        test[u_idx] = tmp_test
+                            test[u_idx] = tmp_test
 
-                        # add validation sample
-                        val[u_idx] = self.select_rnd_item_for_validation(test[u_idx])
-                else:
-                    raise NotImplementedError()
+                            # add validation sample
+                            val[u_idx] = self.select_rnd_item_for_validation(test[u_idx])
+                    else:
+                        raise NotImplementedError()
 
-            elif 'wu' == self.args.train_method:
-                # create instance for each train impression
-                # create instance for each test impression
-                #
+                elif 'wu' == self.args.train_method:
+                    # create instance for each train impression
+                    # create instance for each test impression
+                    #
 
 
-                raise NotImplementedError()
-            elif 'pos_cut_off' == self.args.train_method:
-                raise NotImplementedError()
-            else:
-                raise NotImplementedError()
+                    raise NotImplementedError()
+                elif 'pos_cut_off' == self.args.train_method:
+                    raise NotImplementedError()
+                else:
+                    raise NotImplementedError()
 
         if self.w_time_stamp:
-            ## map & transform all time stamps
+            # store time vectors as one concatenated array per split, see ColumnarSplit
+            train, val, test = (ColumnarSplit.from_dict(split) for split in (train, val, test))
 
             if self.args.normalise_time_stamps is not None:
                 # fit scaler
                 if 'standard' == self.args.normalise_time_stamps:
-
-                    scaler = StandardScaler()
                     print("> Fitting scaler ..")
-                    scaler.fit(np.array(all_ts['train']))
+                    self.ts_scaler = StreamingStandardScaler().fit(train.time_stamps)
                 else:
                     raise NotImplementedError()
 
                 # transform data
                 print("> Scaling time stamps ..")
-                for u_id, seq in train.items():
-                    articles, ts = zip(*seq)
-                    train[u_id] = list(zip(articles, scaler.transform(np.array(ts)).tolist()))
+                train, val, test = (scale_split_time_stamps(split, self.ts_scaler) for split in (train, val, test))
 
-                for u_id, seq in test.items():
-                    articles, ts = zip(*seq)
-                    train[u_id] = list(zip(articles, scaler.transform(np.array(ts)).tolist()))
+        return train, val, test, u_id2idx
 
-                for u_id, seq in val.items():
-                    if len(seq) > 0:
-                        articles, ts = zip(*seq)
-                        train[u_id] = list(zip(articles, scaler.transform(np.array(ts)).tolist()))
+    def prep_time_split_users_columnar(self, user_data, art_id2idx):
+        # vectorised equivalent of the per-user loop for the 'time_threshold' split:
+        # flatten all events into arrays, map article ids & sort by time in one go
+        u_ids = list(user_data.keys())
+        parts = ['articles_train', 'articles_test', 'articles_read'] # 0: train, 1: test, 2: split by threshold
+
+        # number of events per (user, part). users with a given train/test split ignore 'articles_read'
+        lengths = np.zeros((len(u_ids), len(parts)), dtype='int64')
+        events = []
+        for row, u_id in enumerate(u_ids):
+            entry = user_data[u_id]
+            for col in ([0, 1] if 'articles_train' in entry else [2]):
+                part_events = entry.get(parts[col], [])
+                lengths[row, col] = len(part_events)
+                events.extend(part_events)
+
+        user_rows = np.repeat(np.repeat(np.arange(len(u_ids)), len(parts)), lengths.ravel())
+        part = np.repeat(np.tile(np.arange(len(parts)), len(u_ids)), lengths.ravel())
+        art_ids = np.array([art_id for art_id, _ in events])
+        time_stamps = np.array([ts for _, ts in events], dtype='int64')
+        del events
+
+        if (part == 2).any():
+            is_test = (part == 1) | ((part == 2) & (time_stamps >= self.get_threshold_date()))
+        else:
+            is_test = part == 1
+
+        # map article ids to indices, dropping unknown articles
+        known_ids = np.array(list(art_id2idx.keys()))
+        known_idx = np.array(list(art_id2idx.values()), dtype='int64')
+        order = np.argsort(known_ids)
+        known_ids, known_idx = known_ids[order], known_idx[order]
+        pos = np.minimum(np.searchsorted(known_ids, art_ids), max(len(known_ids) - 1, 0))
+        valid = known_ids[pos] == art_ids if len(known_ids) else np.zeros(len(art_ids), dtype=bool)
+
+        # one block per (user, train|test), events in a block sorted by time (stable like sorted())
+        block = 2 * user_rows[valid] + is_test[valid]
+        art_idx, time_stamps = known_idx[pos[valid]], time_stamps[valid]
+        order = np.lexsort((time_stamps, block))
+        block, art_idx, time_stamps = block[order], art_idx[order], time_stamps[order]
+
+        counts = np.bincount(block, minlength=2 * len(u_ids)).reshape(-1, 2)
+        keep = (counts[:, 1] >= 1) & (counts[:, 0] >= 2)
+        offsets = np.concatenate(([0], np.cumsum(counts.ravel())))
+
+        items = art_idx.tolist()
+        if self.w_time_stamp:
+            time_vectors = timestamps_to_vectors(time_stamps, fields=time_vector_fields(self.len_time_vec))
+            items = list(zip(items, time_vectors.tolist()))
+
+        train, val, test = defaultdict(list), defaultdict(list), defaultdict(list)
+        u_id2idx = {}
+        for row in np.flatnonzero(keep).tolist():
+            u_id2idx[u_ids[row]] = u_idx = len(u_id2idx)  # create mapping from u_id to index
+            train[u_idx] = items[offsets[2 * row]:offsets[2 * row + 1]]
+            test[u_idx] = items[offsets[2 * row + 1]:offsets[2 * row + 2]]
+            # add to validation sample
+            val[u_idx] = self.select_rnd_item_for_validation(test[u_idx])
 
         return train, val, test, u_id2idx
 
+    def get_threshold_date(self):
+        try:
+            # float_timestamp is a property in all arrow versions, timestamp became a method in arrow 1.0
+            return int(arrow.get(self.args.time_threshold, "DD-MM-YYYY HH:mm:ss").float_timestamp)
+        except:
+            raise ValueError("Threshold date must string of format: 'DD-MM-YYYY HH:mm:ss'")
+
+    def prep_time_split_user(self, user_entry, art_id2idx):
+        # map a reading history to article indices (and time vectors), split into train & test
+        # histories that are not split yet ('articles_read' only) are split at the threshold date
+        # returns None if the user has not enough valid interactions
+        if 'articles_train' in user_entry:
+            train_events, test_events = user_entry['articles_train'], user_entry.get('articles_test', [])
+        elif 'articles_read' in user_entry:
+            threshold_date = self.get_threshold_date()
+            train_events = [(art_id, ts) for art_id, ts in user_entry['articles_read'] if ts < threshold_date]
+            test_events = [(art_id, ts) for art_id, ts in user_entry['articles_read'] if ts >= threshold_date]
+        else:
+            raise ValueError("Reading history needs 'articles_train' & 'articles_test' or 'articles_read', got: {}"
+                             .format(sorted(user_entry.keys())))
+
+        train_items = [(art_id2idx[art_id], map_time_stamp_to_vector(ts, self.len_time_vec)) for art_id, ts
+                       in sorted(train_events, key=lambda tup: tup[1])
+                       if art_id in art_id2idx]
+
+        test_items = [(art_id2idx[art_id], map_time_stamp_to_vector(ts, self.len_time_vec)) for art_id, ts
+                      in sorted(test_events, key=lambda tup: tup[1])
+                      if art_id in art_id2idx]
+
+        if len(test_items) < 1 or len(train_items) < 2:
+            return None
+
+        # confirm time intervals
+        # if train_items[-1][1] <= threshold_date and test_items[0][1] >= threshold_date:
+        #     pass
+        # else:
+        #     raise ValueError("Split into time intervals incorrect. check preprocessing!")
+
+        if self.w_time_stamp:
+            return train_items, test_items
+        else:
+            return [*list(zip(*train_items))[0]], [*list(zip(*test_items))[0]]
+
+    def prep_dpg_user_increment(self, user_data, affected_users, dataset):
+        # re-compute train/val/test only for the affected users. new users are appended to the index
+        # users w/o enough valid interactions (anymore) are removed from the splits, but keep their index
+        if 'masked_item' != self.args.train_method or 'time_threshold' != self.args.split:
+            raise NotImplementedError("Incremental preprocessing requires 'masked_item' with 'time_threshold' split")
+
+        scaler = dataset.get('ts_scaler')
+        if self.w_time_stamp and self.args.normalise_time_stamps is not None and scaler is None:
+            raise ValueError("Existing dataset has no fitted time stamp scaler. Please rebuild it from scratch")
+
+        train, val, test = {}, {}, {}
+        dropped = []
+        u_id2idx, art_id2idx = dataset['umap'], dataset['smap']
+        n_new, n_updated = 0, 0
+
+        for u_id in affected_users:
+            items = self.prep_time_split_user(user_data[u_id], art_id2idx)
+            if items is None:
+                if u_id in u_id2idx:
+                    dropped.append(u_id2idx[u_id])
+                continue
+
+            if u_id in u_id2idx:
+                u_idx = u_id2idx[u_id]
+                n_updated += 1
+            else:
+                u_id2idx[u_id] = u_idx = len(u_id2idx)
+                n_new += 1
+
+            train_items, test_items = items
+            val_items = self.select_rnd_item_for_validation(test_items)
+
+            if self.w_time_stamp and scaler is not None:
+                train_items, test_items, val_items = (scale_time_stamps(seq, scaler)
+                                                      for seq in (train_items, test_items, val_items))
+
+            train[u_idx], val[u_idx], test[u_idx] = train_items, val_items, test_items
+
+        print("> Updated {} users, added {} new users, removed {} users".format(n_updated, n_new, len(dropped)))
+        # only the rows of the affected users are rebuilt, see ColumnarSplit.update
+        for name, updates in zip(SPLIT_NAMES, (train, val, test)):
+            split = dataset[name]
+            if not isinstance(split, ColumnarSplit):
+                split = ColumnarSplit.from_dict(split)
+            dataset[name] = split.update(updates, drop=dropped)
+        dataset['umap'] = u_id2idx
+
+    def prep_dpg_news_increment(self, new_news_data, dataset):
+        # extend the article index with unseen articles and encode only those
+        art_id2idx = dataset['smap']
+        new_articles = OrderedDict((art_id, art) for art_id, art in new_news_data['all'].items()
+                                   if art_id not in art_id2idx)
+        print("> Adding {} new articles".format(len(new_articles)))
+        if len(new_articles) == 0:
+            return
+
+        if self.use_content and self.args.pt_news_encoder is None:
+            # encode with the existing vocabulary, so word indices stay valid
+            news_as_word_ids = encode_dpg_news_with_vocab({'all': new_articles}, vocab=dataset['vocab'],
+                                                          language=self.args.language,
+                                                          max_article_len=self.args.max_article_len)
+            dataset['art2words'].update(news_as_word_ids)
+            new_art_ids = list(new_articles.keys())
+
+        elif self.use_content:
+            new_id2idx, new_art_embs = precompute_dpg_art_emb(news_data={'all': new_articles},
+                                                              news_encoder_code=self.args.pt_news_encoder,
+                                                              max_article_len=self.args.max_article_len,
+                                                              art_emb_dim=self.args.dim_art_emb,
+                                                              lower_case=self.args.lower_case,
+                                                              pd_vocab=self.args.pd_vocab,
+                                                              path_to_pt_model=self.args.path_pt_news_enc,
+                                                              feature_method=self.args.bert_feature_method)
+            dataset['art_emb'] = torch.cat([dataset['art_emb'], new_art_embs], dim=0)
+            new_art_ids = sorted(new_id2idx, key=new_id2idx.get)
+        else:
+            new_art_ids = list(new_articles.keys())
+
+        for art_id in new_art_ids:
+            art_id2idx[art_id] = len(art_id2idx)
+        if 'pub_times' in dataset:
+            new_pub_times = get_pub_times(new_articles, {art_id: idx for idx, art_id in enumerate(new_art_ids)})
+            dataset['pub_times'] = np.concatenate([dataset['pub_times'], new_pub_times])
+
     def select_rnd_item_for_validation(self, test_items):
         # select random portion of test items as subset for validation
         # exclude possibility to use last test interaction for validation because it's reserved for testing
@@ -373,6 +642,54 @@ class DPG_Nov19Dataset(AbstractDatasetDPG):
         return news_data, art_id2idx
 
 
+def get_pub_times(articles, art_id2idx):
+    # unix publication time of each article index, 'first_pub_date' if available. -1 if unknown
+    pub_times = np.full(len(art_id2idx), -1, dtype='int64')
+    for art_id, art_idx in art_id2idx.items():
+        article = articles.get(art_id, {})
+        pub_date = article.get('first_pub_date') or article.get('pub_date')
+        if pub_date is None:
+            continue
+        try:
+            pub_times[art_idx] = int(arrow.get(pub_date).float_timestamp)
+        except (ValueError, TypeError):
+            pass
+    return pub_times
+
+
+def merge_raw_read_histories(user_data, new_user_data):
+    # append new interactions to the raw reading histories. returns the ids of all affected users
+    for u_id, new_entry in new_user_data.items():
+        if u_id not in user_data:
+            user_data[u_id] = new_entry
+            continue
+
+        entry = user_data[u_id]
+        for key in ['articles_read', 'articles_train', 'articles_test']:
+            if key in new_entry:
+                known = set(map(tuple, entry.get(key, [])))
+                entry.setdefault(key, []).extend(e for e in new_entry[key] if tuple(e) not in known)
+        if 'articles_read' in entry:
+            entry['n_arts_read'] = len(entry['articles_read'])
+
+    return list(new_user_data.keys())
+
+
+def scale_time_stamps(seq, scaler):
+    # seq: [(art_idx, time_vector), ...]
+    if len(seq) == 0:
+        return seq
+    articles, ts = zip(*seq)
+    return list(zip(articles, scaler.transform(np.array(ts)).tolist()))
+
+
+def scale_split_time_stamps(split, scaler):
+    # transform the concatenated time vectors of all users at once
+    if split.time_stamps is None:
+        return split
+    return ColumnarSplit(split.users, split.offsets, split.items, scaler.transform(split.time_stamps))
+
+
 # class DPG_Dec19Dataset(AbstractDatasetDPG):
 #     def __init__(self, args):
 #         super(DPG_Dec19Dataset, self).__init__(args)
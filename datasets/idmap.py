@@ -0,0 +1,104 @@
+import numpy as np
+
+from collections.abc import Mapping
+
+
+def factorize_ids(ids):
+    """
+    Deterministic dense codes for raw ids
+
+    :param ids: (np.ndarray) raw user or item ids
+    :return: codes (int32) with the same shape as ids & IdMap {raw id: code}, codes follow the sorted order of the ids
+    """
+    keys, codes = np.unique(np.asarray(ids), return_inverse=True)
+    return codes.astype('int32'), IdMap(keys)
+
+
+class IdMap(Mapping):
+    """
+    Read-only dict-like mapping {raw id: index} backed by numpy arrays
+
+    ids: sorted raw ids, looked up with np.searchsorted
+    codes (int32, optional): index of each id. None if the index is the position of the id (see factorize_ids)
+
+    Replaces the umap/smap dicts without keeping millions of Python objects alive
+    """
+
+    def __init__(self, ids, codes=None):
+        self.ids = np.asarray(ids)
+        self.codes = None if codes is None else np.asarray(codes, dtype='int32')
+        self._code_order = None
+
+    @classmethod
+    def from_dict(cls, mapping):
+        keys = np.array(list(mapping.keys()))
+        codes = np.fromiter(mapping.values(), dtype='int32', count=len(mapping))
+        order = np.argsort(keys, kind='stable')
+        return cls(keys[order], codes[order])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _ordered(self):
+        # positions of the ids in the order of their codes
+        if self.codes is None:
+            return np.arange(len(self.ids))
+        if self._code_order is None:
+            self._code_order = np.argsort(self.codes, kind='stable')
+        return self._code_order
+
+    def __iter__(self):
+        # same order as a dict that was built with increasing indices
+        return iter(self.ids[self._ordered()].tolist())
+
+    def _position(self, key):
+        try:
+            pos = int(np.searchsorted(self.ids, key))
+        except TypeError:
+            return None
+        if pos < len(self.ids) and self.ids[pos] == key:
+            return pos
+        return None
+
+    def __getitem__(self, key):
+        pos = self._position(key)
+        if pos is None:
+            raise KeyError(key)
+        return pos if self.codes is None else int(self.codes[pos])
+
+    def __contains__(self, key):
+        return self._position(key) is not None
+
+    def keys(self):
+        return self.ids[self._ordered()].tolist()
+
+    def values(self):
+        if self.codes is None:
+            return list(range(len(self.ids)))
+        return self.codes[self._ordered()].tolist()
+
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+
+    def lookup(self, ids, default=-1):
+        # vectorised __getitem__. unknown ids are mapped to default
+        ids = np.asarray(ids)
+        if len(self.ids) == 0:
+            return np.full(ids.shape, default, dtype='int32')
+        pos = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        found = self.ids[pos] == ids
+        codes = pos if self.codes is None else self.codes[pos]
+        return np.where(found, codes, default).astype('int32')
+
+    def reverse(self, codes):
+        # raw ids of the given indices
+        codes = np.asarray(codes)
+        if self.codes is None:
+            return self.ids[codes]
+        order = self._ordered()
+        return self.ids[order[np.searchsorted(self.codes[order], codes)]]
+
+
+def as_id_map(mapping):
+    # accept dict-based maps of older preprocessed datasets
+    return mapping if isinstance(mapping, IdMap) else IdMap.from_dict(mapping)
@@ -6,6 +6,8 @@ from datetime import date
 
 
 class ML1MDatasetML(AbstractDatasetML):
+    ratings_dtypes = {'uid': 'int32', 'sid': 'int32', 'rating': 'uint8', 'timestamp': 'int32'}
+
     @classmethod
     def code(cls):
         return 'ml-1m'
@@ -28,8 +30,7 @@ class ML1MDatasetML(AbstractDatasetML):
     def load_ratings_df(self):
         folder_path = self._get_rawdata_folder_path()
         file_path = folder_path.joinpath('ratings.dat')
-        df = pd.read_csv(file_path, sep='::', header=None)
-        df.columns = ['uid', 'sid', 'rating', 'timestamp']
-        return df
+        # splitting '::' on ':' leaves empty columns in between but allows the fast C parser
+        return self.stream_ratings(file_path, sep=':', header=None, usecols=[0, 2, 4, 6])
 
 
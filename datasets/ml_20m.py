@@ -31,8 +31,6 @@ class ML20MDatasetML(AbstractDatasetML):
     def load_ratings_df(self):
         folder_path = self._get_rawdata_folder_path()
         file_path = folder_path.joinpath('ratings.csv')
-        df = pd.read_csv(file_path)
-        df.columns = ['uid', 'sid', 'rating', 'timestamp']
-        return df
+        return self.stream_ratings(file_path, header=0)
 
 
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+
+
+def file_digest(path, memo=None, chunk_size=1 << 20):
+    """
+    sha1 of a file's content
+
+    :param memo: (dict) {path: [size, mtime_ns, digest]} of earlier calls. Files whose size and modification
+        time did not change are not read again. The mtime only decides whether to re-hash, it is never part of a key
+    """
+    stat = path.stat()
+    entry = None if memo is None else memo.get(str(path))
+    if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return entry[2]
+
+    digest = hashlib.sha1()
+    with path.open('rb') as fin:
+        for chunk in iter(lambda: fin.read(chunk_size), b''):
+            digest.update(chunk)
+    if memo is not None:
+        memo[str(path)] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return digest.hexdigest()
+
+
+def fingerprint(paths, root, memo_path=None):
+    """
+    Identity of raw input files by content: their path relative to root and the sha1 of their content,
+    i.e. touching, copying or moving the files (with their root) keeps the fingerprint
+    Folders are expanded to all files they contain
+
+    :param memo_path: json file that remembers the digests of files across runs, see file_digest
+    """
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+    root = Path(root)
+
+    memo = {}
+    if memo_path is not None and Path(memo_path).is_file():
+        with Path(memo_path).open() as fin:
+            memo = json.load(fin)
+    known = dict(memo)
+
+    entries = []
+    for path in map(Path, paths):
+        files = sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path]
+        for file in files:
+            rel_path = os.path.relpath(str(file), str(root))
+            entries.append([rel_path, file_digest(file, memo) if file.is_file() else None])
+
+    if memo_path is not None and memo != known:
+        memo_path = Path(memo_path)
+        memo_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = memo_path.with_suffix('.tmp')
+        with tmp_path.open('w') as fout:
+            json.dump(memo, fout)
+        os.replace(str(tmp_path), str(memo_path))
+    return entries
+
+
+def stage_key(stage, params, inputs=()):
+    """
+    Content address of a preprocessing stage
+
+    :param stage: (str) name of the stage
+    :param params: (dict) arguments that influence the output of this stage
+    :param inputs: keys of upstream stages and/or fingerprints of raw files, see fingerprint
+    :return: (str) hex digest
+    """
+    payload = json.dumps([stage, params, list(inputs)], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class StageCache(object):
+    """
+    Stores the artifact of each preprocessing stage as <folder>/<stage>-<key><suffix>
+    A stage is only recomputed if no artifact exists for its key, i.e. if its inputs or args changed
+    """
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+
+    def fingerprint(self, paths, root):
+        # digests of the raw files are remembered next to the stage artifacts
+        return fingerprint(paths, root, memo_path=self.folder.joinpath('digests.json'))
+
+    def path(self, stage, key, suffix='.pkl'):
+        return self.folder.joinpath('{}-{}{}'.format(stage, key, suffix))
+
+    def run(self, stage, key, compute):
+        path = self.path(stage, key)
+        if path.is_file():
+            print('Stage "{}" is up to date. Loading {}'.format(stage, path.name))
+            with path.open('rb') as fin:
+                return pickle.load(fin)
+
+        print('Running stage "{}"'.format(stage))
+        result = compute()
+
+        self.folder.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with tmp_path.open('wb') as fout:
+            pickle.dump(result, fout, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(str(tmp_path), str(path))
+        return result
@@ -7,6 +7,8 @@ from pathlib import Path
 import zipfile
 import sys
 
+from .columnar import ColumnarSplit
+
 
 def download(url, savepath):
     wget.download(url, str(savepath))
@@ -18,25 +20,170 @@ def unzip(zippath, savepath):
     zip.close()
 
 
+def add_bincounts(counts, ids):
+    # accumulate occurrences of non-negative integer ids into a growing count array
+    chunk_counts = np.bincount(ids)
+    if len(chunk_counts) > len(counts):
+        chunk_counts[:len(counts)] += counts
+        return chunk_counts
+    counts = counts.copy()
+    counts[:len(chunk_counts)] += chunk_counts
+    return counts
+
+
 def get_count(tp, id):
     groups = tp[[id]].groupby(id, as_index=False)
     count = groups.size()
     return count
 
 
-def filter_triplets(tp, min_uc=5, min_sc=0):
+def filter_triplets(tp, min_uc=5, min_sc=0, iterative=False):
     # Only keep the triplets for items which were clicked on by at least min_sc users.
-    if min_sc > 0:
-        itemcount = get_count(tp, 'movieId')
-        tp = tp[tp['movieId'].isin(itemcount.index[itemcount >= min_sc])]
-
     # Only keep the triplets for users who clicked on at least min_uc items
-    # After doing this, some of the items will have less than min_uc users, but should only be a small proportion
-    if min_uc > 0:
-        usercount = get_count(tp, 'userId')
-        tp = tp[tp['userId'].isin(usercount.index[usercount >= min_uc])]
+    # After doing this once, some of the items will have less than min_sc users. With 'iterative',
+    # both filters are repeated until all users and items fulfill the constraints (k-core)
+    keep = kcore_filter(tp['userId'].values, tp['movieId'].values, min_uc, min_sc, iterative=iterative)
+    tp = tp[keep]
 
     # Update both usercount and itemcount after filtering
     usercount, itemcount = get_count(tp, 'userId'), get_count(tp, 'movieId')
     return tp, usercount, itemcount
 
+
+def kcore_filter(uids, sids, min_uc, min_sc, iterative=True):
+    """
+    Filter interactions such that each item has at least min_sc and each user at least min_uc interactions.
+    Works on factorised integer codes with np.bincount. One pass filters items first, then users.
+
+    :param iterative: repeat passes until a fixed point is reached (k-core). Otherwise, stop after one pass
+    :return: boolean mask over the interactions to keep
+    """
+    u_codes, u_uniques = pd.factorize(uids)
+    s_codes, s_uniques = pd.factorize(sids)
+    keep = np.ones(len(u_codes), dtype=bool)
+
+    while True:
+        n_kept = keep.sum()
+        if min_sc > 0:
+            item_counts = np.bincount(s_codes[keep], minlength=len(s_uniques))
+            keep &= item_counts[s_codes] >= min_sc
+        if min_uc > 0:
+            user_counts = np.bincount(u_codes[keep], minlength=len(u_uniques))
+            keep &= user_counts[u_codes] >= min_uc
+
+        if not iterative or keep.sum() == n_kept:
+            break
+
+    return keep
+
+
+def _offsets_from_lengths(lengths):
+    offsets = np.zeros(len(lengths) + 1, dtype='int64')
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def _user_block_starts(sorted_uids):
+    # start position of each user's block in an array sorted by user
+    if len(sorted_uids) == 0:
+        return np.zeros(0, dtype='int64')
+    return np.concatenate(([0], np.flatnonzero(np.diff(sorted_uids)) + 1))
+
+
+def leave_one_out_split(uids, sids, timestamps):
+    """
+    Vectorised leave-one-out split. Sorts all interactions once by (uid, timestamp) and keeps the last
+    two items of each user for validation and testing respectively. Ties in the time stamp keep the row order.
+
+    :return: train, val, test as ColumnarSplit {uid: [sid, ...]}, each containing all users
+    """
+    order = np.lexsort((timestamps, uids))
+    uids, sids = uids[order], sids[order].astype('int32')
+
+    starts = _user_block_starts(uids)
+    users = uids[starts].astype('int64')
+    lengths = np.diff(np.append(starts, len(uids)))
+    # position of each interaction counted from the end of the user's sequence (0 = last)
+    pos_from_end = np.repeat(starts + lengths, lengths) - np.arange(len(uids)) - 1
+
+    train_len = np.maximum(lengths - 2, 0)
+    val_len = np.minimum(np.maximum(lengths - 1, 0), 1)
+    test_len = np.minimum(lengths, 1)
+
+    train = ColumnarSplit(users, _offsets_from_lengths(train_len), sids[pos_from_end >= 2])
+    val = ColumnarSplit(users, _offsets_from_lengths(val_len), sids[pos_from_end == 1])
+    test = ColumnarSplit(users, _offsets_from_lengths(test_len), sids[pos_from_end == 0])
+    return train, val, test
+
+
+def holdout_split(uids, sids, split_user_indices):
+    """
+    Vectorised user-based holdout split. Each user's interactions keep their original row order.
+
+    :param split_user_indices: list of user index arrays, one per split, e.g. [train_users, val_users, test_users]
+    :return: one ColumnarSplit per entry in split_user_indices containing only the respective users
+    """
+    order = np.argsort(uids, kind='stable')
+    uids, sids = uids[order], sids[order].astype('int32')
+
+    splits = []
+    for user_index in split_user_indices:
+        mask = np.isin(uids, user_index)
+        split_uids = uids[mask]
+        starts = _user_block_starts(split_uids)
+        lengths = np.diff(np.append(starts, len(split_uids)))
+        splits.append(ColumnarSplit(split_uids[starts].astype('int64'), _offsets_from_lengths(lengths),
+                                    sids[mask]))
+    return splits
+
+
+class StreamingStandardScaler(object):
+    """
+    Standardises features to zero mean & unit variance, like sklearn's StandardScaler,
+    but fits with streaming mean/variance accumulators (Chan et al.), i.e. chunk by chunk
+    """
+
+    def __init__(self, dtype='float32'):
+        self.dtype = dtype
+        self.n_samples_seen_ = 0
+        self.mean_ = None
+        self._m2 = None # sum of squared deviations from the mean
+
+    def partial_fit(self, X):
+        X = np.asarray(X, dtype='float64')
+        if len(X) == 0:
+            return self
+        n_b = len(X)
+        mean_b = X.mean(axis=0)
+        m2_b = ((X - mean_b) ** 2).sum(axis=0)
+
+        if self.mean_ is None:
+            self.n_samples_seen_, self.mean_, self._m2 = n_b, mean_b, m2_b
+        else:
+            n_a = self.n_samples_seen_
+            n = n_a + n_b
+            delta = mean_b - self.mean_
+            self.mean_ = self.mean_ + delta * n_b / n
+            self._m2 = self._m2 + m2_b + delta ** 2 * n_a * n_b / n
+            self.n_samples_seen_ = n
+        return self
+
+    def fit(self, X, chunk_size=1000000):
+        for start in range(0, len(X), chunk_size):
+            self.partial_fit(X[start:start + chunk_size])
+        return self
+
+    @property
+    def var_(self):
+        return self._m2 / self.n_samples_seen_
+
+    @property
+    def scale_(self):
+        # constant features are not scaled
+        scale = np.sqrt(self.var_)
+        scale[scale == 0] = 1.
+        return scale
+
+    def transform(self, X):
+        X = np.asarray(X, dtype='float64')
+        return ((X - self.mean_) / self.scale_).astype(self.dtype)
@@ -31,6 +31,8 @@ parser.add_argument('--dataset_code', type=str, default='DPG_nov19', choices=DAT
 parser.add_argument('--min_rating', type=int, default=None, help='Only keep ratings greater than equal to this value')
 parser.add_argument('--min_uc', type=int, default=None, help='Only keep users with more than min_uc ratings')
 parser.add_argument('--min_sc', type=int, default=None, help='Only keep items with more than min_sc ratings')
+parser.add_argument('--filter_method', type=str, default='single_pass', choices=['single_pass', 'kcore'],
+                    help='Filter items & users only once or repeat until both constraints hold (kcore)')
 parser.add_argument('--split', type=str, default='leave_one_out', help='How to split the datasets')
 parser.add_argument('--dataset_split_seed', type=int, default=None)
 parser.add_argument('--eval_set_size', type=int, default=None,
@@ -51,6 +53,12 @@ parser.add_argument('--incl_time_stamp', type=bool, default=False, help="Time st
 parser.add_argument('--incl_u_id', type=bool, default=False, help="User ID passed to model")
 parser.add_argument('--time_threshold', type=str, default="23-11-2019 23:59:59", help='date for splitting train/test. format: "DD-MM-YYYY HH:mm:ss"')
 
+parser.add_argument('--dpg_increment_path', type=str, nargs='+', default=None,
+                    help='Folders with user_data.pkl & news_data.pkl of new interactions to append to the preprocessed dataset, in this order')
+
+parser.add_argument('--dpg_prep_engine', type=str, default='columnar', choices=['columnar', 'loop'],
+                    help='Prepare DPG user histories with vectorised array operations or the per-user loop')
+
 parser.add_argument('--train_method', type=str, default='masked_item', choices=['masked_interest', 'wu', 'pos_cut_off'])
 parser.add_argument('--n_articles', type=int, help="Number of articles in the dataset")
 parser.add_argument('--n_users', type=int, help="Number of users in the dataset")
@@ -69,19 +77,37 @@ parser.add_argument('--train_batch_size', type=int, default=64)
 parser.add_argument('--val_batch_size', type=int, default=64)
 parser.add_argument('--test_batch_size', type=int, default=64)
 parser.add_argument('--eval_method', type=str, choices=['last_as_target', 'random_as_target'])
+parser.add_argument('--user_store', type=str, default='columnar', choices=['columnar', 'sharded'],
+                    help='Read user sequences from the memory-mapped splits or from sharded per-user stores (out-of-core)')
+parser.add_argument('--n_user_shards', type=int, default=16, help='Number of shard files per split for --user_store sharded')
 
 
 ################
 # NegativeSampler
 ################
-parser.add_argument('--train_negative_sampler_code', type=str, default='random', choices=['popular', 'random'],
+parser.add_argument('--train_negative_sampler_code', type=str, default='random', choices=['popular', 'popular_proportional', 'random', 'time_window'],
                     help='Method to sample negative items for training. Not used in bert')
 parser.add_argument('--train_negative_sample_size', type=int, default=100)
 parser.add_argument('--train_negative_sampling_seed', type=int, default=None)
-parser.add_argument('--test_negative_sampler_code', type=str, default='random', choices=['popular', 'random'],
+parser.add_argument('--test_negative_sampler_code', type=str, default='random', choices=['popular', 'popular_proportional', 'random', 'time_window'],
                     help='Method to sample negative items for evaluation')
 parser.add_argument('--test_negative_sample_size', type=int, default=100)
 parser.add_argument('--test_negative_sampling_seed', type=int, default=None)
+parser.add_argument('--train_negatives', type=str, default='precomputed', choices=['precomputed', 'on_the_fly', 'hard'],
+                    help='Store negatives for every position of every user or draw fresh ones for the masked positions of each instance (bert_news). '
+                         'hard: partly from the nearest neighbours of the target article')
+parser.add_argument('--hard_negative_ratio', type=float, default=0.5, help='Share of hard negatives per masked position')
+parser.add_argument('--hard_negative_neighbours', type=int, default=50, help='Nearest neighbours per article to draw hard negatives from')
+parser.add_argument('--hard_negative_clusters', type=int, default=None, help='Number of k-means clusters of the IVF index. Default: sqrt(#articles)')
+parser.add_argument('--hard_negative_probes', type=int, default=4, help='Clusters scanned per query of the IVF index')
+parser.add_argument('--negative_sampler_engine', type=str, default='python', choices=['python', 'numpy'],
+                    help='Draw random negatives one by one or in vectorised blocks per user. The engines draw different samples for the same seed, i.e. numpy changes the evaluation negatives of existing configs')
+parser.add_argument('--negative_sampler_workers', type=int, default=0,
+                    help='Sample negatives in this many processes. Users get generators seeded by (seed, user), i.e. the samples do not depend on the number of workers')
+parser.add_argument('--negative_time_window', type=float, default=None,
+                    help='time_window negatives: draw among the articles published within this many hours of the clicked article (news)')
+parser.add_argument('--popularity_alpha', type=float, default=1.0,
+                    help='Exponent of the item counts for popular_proportional negatives, e.g. 0.75 to smooth towards uniform')
 
 ################
 # Trainer
@@ -140,7 +166,7 @@ parser.add_argument('--pt_news_encoder', type=str, default=None, choices=["BERTj
 parser.add_argument('--path_pt_news_enc', type=str, default=None, help="Path to pre-trained News Encoder")
 parser.add_argument('--fix_pt_art_emb', type=bool, default=None, help='fix pre-computed article embeddings')
 parser.add_argument('--pd_vocab', type=bool, default=None, help='use pre-defined vocabulary')
-parser.add_argument('--vocab_path', type=str, default=None, help='Path to vocab with relevant words')
+parser.add_argument('--vocab_path', type=str, default=None, help='Path to pickled vocab with relevant words')
 
 # end-to-end
 parser.add_argument('--news_encoder', type=str, default=None, choices=["wucnn"], help='Model to use as News Encoder')
@@ -151,7 +177,7 @@ parser.add_argument('--pos_embs', type=str, default=None, choices=['tpe', 'lpe']
 
 # Temporal Embeddings #
 parser.add_argument('--normalise_time_stamps', type=str, default='standard', help="specify scaler for time stamps")
-parser.add_argument('--len_time_vec', type=int, default=4, help='Which information to include from UNIX timestamp')
+parser.add_argument('--len_time_vec', type=int, default=4, choices=[4, 5, 6, 7], help='Which information to include from UNIX timestamp, see source.utils.time_vector_fields')
 parser.add_argument('--temp_embs', type=str, default=None, choices=['lte', 'nte', 'tte'], help='Type of temporal embedding')
 parser.add_argument('--temp_embs_hidden_units', type=int, default=[256, 768], nargs='*', help='Hidden units for neural temporal embedding')
 parser.add_argument('--temp_embs_act_func', type=str, default=None, choices=['relu', 'gelu', 'tanh'], help='Activation function for neural temporal embedding')
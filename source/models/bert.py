@@ -43,8 +43,10 @@ def make_bert4news_model(args):
         # compute article embs end-to-end using vocab + Word Embs + News Encoder
         # load vocab
         with Path(args.vocab_path).open('rb') as fin:
-            data = pickle.load(fin)
-            vocab = data['vocab']
+            vocab = pickle.load(fin)
+        if isinstance(vocab.get('vocab'), dict):
+            # whole dataset pickle of older versions: {'vocab': {word: index}, ..}
+            vocab = vocab['vocab']
 
         # load pre-trained Word Embs, if exists
         pt_word_emb = get_word_embs_from_pretrained_ft(vocab, args.pt_word_emb_path, args.dim_word_emb)
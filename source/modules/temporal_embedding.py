@@ -40,6 +40,9 @@ class LinearProject(nn.Module):
     def forward(self, t):
         # project single-value time stamps to temporal embedding
         # (B x L_hist) -> (B x L_hist x D_e)
+        if isinstance(t, np.ndarray):
+            # e.g. compact time vectors from source.utils.timestamps_to_vectors
+            t = torch.from_numpy(t)
         t = t.float()
         if len(t.shape) < 3:
             t_out = self.lin(t.unsqueeze(2))
@@ -79,6 +82,8 @@ class NeuralFunc(nn.Module):
         return 'nte'
 
     def forward(self, x_in):
+        if isinstance(x_in, np.ndarray):
+            x_in = torch.from_numpy(x_in)
         if len(x_in.shape) < 3:
             x = x_in.unsqueeze(2).float()
         else:
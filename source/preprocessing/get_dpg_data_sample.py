@@ -5,7 +5,6 @@ import gzip
 import os
 import pickle
 from pathlib import Path
-import smart_open
 import random
 
 import datetime
@@ -13,6 +12,9 @@ import datetime
 from collections import OrderedDict, defaultdict, Counter
 from tqdm import tqdm
 
+from source.preprocessing.jsonl_reader import stream_jsonl
+from source.preprocessing.raw_index import RawDataIndex, parse_read_entry, time_stamp2unix
+
 import sys
 sys.path.append("..")
 
@@ -20,12 +22,9 @@ DATA_SIZES = {'dev': [10e3, 2e3], 'medium': [45e3, 10e3], 'large': [250e3, 50e3]
 
 USER_ITEM_RATIO = 10
 
-def data_stream_generator(data_dir):
-    files = [file for file in Path(data_dir).iterdir() if
-             file.is_file() and file.name[0] not in '_.']
-    for file in files:
-        with smart_open.open(file) as rf:
-            yield from (json.loads(line) for line in rf.read().splitlines() if line)
+def data_stream_generator(data_dir, n_workers=0, json_decoder=None):
+    # stream records line by line. with n_workers > 0, files (or byte ranges of large files) are parsed in parallel
+    yield from stream_jsonl(data_dir, n_workers=n_workers, decoder=json_decoder)
 
 def get_text_snippet(text, len_snippet, tokenizer=None):
     if tokenizer is None:
@@ -93,7 +92,59 @@ def update_logging_dates(articles_read, logging_dates):
     return (first, last)
 
 
-def subsample_users(n_users, article_data, data_dir, min_hist_len, max_hist_len=None, min_test_len=1, remove_unk_arts=True, test_time_thresh=None):
+def prep_user_record(user, valid_item_ids, min_hist_len, max_hist_len, min_test_len=1, remove_unk_arts=True,
+                     test_time_thresh=None, unk_arts=None):
+    """
+    Filter & split the reading history of a single raw user record
+
+    Returns the prepped user (with 'articles_train' & 'articles_test' if a time threshold is given)
+    or None if the user does not fulfill the length conditions
+    """
+    # quick preliminary eval
+    if len(user['articles_read']) < min_hist_len or len(user['articles_read']) > max_hist_len:
+        return None
+
+    # remove unknown articles from reading history
+    if remove_unk_arts:
+        history = []
+        if test_time_thresh is not None:
+            user['articles_train'] = []
+            user['articles_test'] = []
+        # check if article ID is present in our set of valid IDs
+        for entry in user['articles_read']:
+            art_id, time_stamp = parse_read_entry(entry)
+
+            if art_id not in valid_item_ids:
+                if unk_arts is not None:
+                    unk_arts[art_id] += 1
+            else:
+                if test_time_thresh is not None:
+                    if time_stamp < test_time_thresh:
+                        user['articles_train'].append([art_id, time_stamp])
+                    else:
+                        user['articles_test'].append([art_id, time_stamp])
+
+                history.append([art_id, time_stamp])
+
+        user['articles_read'] = history
+
+    # evaluate length reading history
+    # exclude very high frequency users (potentially bots) and very low ones (too little interaction for proper modelling)
+    if len(user['articles_read']) < min_hist_len or len(user['articles_read']) > max_hist_len:
+        return None
+    if test_time_thresh is not None \
+            and (len(user['articles_test']) < min_test_len or len(user['articles_train']) < min_hist_len):
+        return None
+
+    # item.keys() = dict_keys(['user_id', 'articles_read', 'opened_pushes', 'articles_pushed'])
+    user['articles_read'] = sorted(user['articles_read'], key=lambda entry: entry[1])  # sort by time_stamp
+    user['n_arts_read'] = len(user['articles_read'])
+
+    return user
+
+def subsample_users(n_users, article_data, data_dir, min_hist_len, max_hist_len=None, min_test_len=1, remove_unk_arts=True, test_time_thresh=None,
+                    n_workers=0, json_decoder=None, user_stream=None):
+    # user_stream: optional iterable of raw user records, e.g. pre-selected via RawDataIndex. Default: scan all users
 
     if isinstance(article_data, dict):
         # use a given item sub sample
@@ -103,9 +154,6 @@ def subsample_users(n_users, article_data, data_dir, min_hist_len, max_hist_len=
         valid_item_ids = article_data
         article_data = {}
 
-    c_articles_raw = Counter() # without threshold
-    c_articles_thresh = Counter() # count only those from 'valid' histories
-
     if test_time_thresh is not None:
         article_data['train'] = set()
         article_data['test'] = set()
@@ -119,75 +167,25 @@ def subsample_users(n_users, article_data, data_dir, min_hist_len, max_hist_len=
     if max_hist_len is None:
         max_hist_len = 1000
 
-    for i, user in tqdm(enumerate(data_stream_generator(data_dir + "users"))):
-        # quick preliminary eval
-        if len(user['articles_read']) >= min_hist_len and len(user['articles_read']) <= max_hist_len:
-            # remove unknown articles from reading history
-            if remove_unk_arts:
-                history = []
-                # check if article ID is present in our set of valid IDs
-                for entry in user['articles_read']:
-                    if len(entry) == 3: ## december 19 data has 3 fields for each interaction
-                        _, art_id, time_stamp = entry
-
-                    elif len(entry) == 5: ## november 19 data has 5
-                        art_id, ts = entry[-2:]
-                        # convert time_stamp to UNIX
-                        time_stamp = time_stamp2unix(ts)
-
-
-                    if art_id not in valid_item_ids:
-                        unk_arts[art_id] += 1
-
-                        # if replace_with_unk:
-                        #     entry[1] = unk_art_id
-                        #     history.append(entry)
-                    else:
-                        if test_time_thresh is not None:
-                            if 'articles_train' not in user.keys():
-                                user['articles_train'] = []
-                                user['articles_test'] = []
-
-                            if time_stamp < test_time_thresh:
-                                user['articles_train'].append([art_id, time_stamp])
-                            else:
-                                user['articles_test'].append([art_id, time_stamp])
-
-                        history.append([art_id, time_stamp])
-                        c_articles_raw.update([art_id])
-
-                user['articles_read'] = history
-
-            # evaluate length reading history
-            if len(user['articles_read']) >= min_hist_len \
-                    and len(user['articles_read']) <= max_hist_len\
-                    and len(user['articles_test']) >= min_test_len:
-                # add valid user that fulfills condition
-                # exclude very high frequency users (potentially bots) and very low ones (too little interaction for proper modelling)
-                # item.keys() = dict_keys(['user_id', 'articles_read', 'opened_pushes', 'articles_pushed'])
-                user['articles_read'] = sorted(user['articles_read'], key=lambda entry: entry[1])  # sort by time_stamp
-
-                if test_time_thresh is not None:
-                    if len(user['articles_train']) >= min_hist_len:
-                        #
-                        art_train = [art_id for art_id, _ in user['articles_train']]
-                        article_data['train'].update(art_train)
-                        c_articles_thresh.update(art_train)
-
-                        art_test = [art_id for art_id, _ in user['articles_test']]
-                        article_data['test'].update(art_test)
-                        c_articles_thresh.update(art_test)
-                    else:
-                        continue
-
-                user['n_arts_read'] = len(user['articles_read'])
-                user_dict[user['user_id']] = {key: val for (key, val) in user.items() if key != 'user_id'}
-                #
-                logging_dates = update_logging_dates(user['articles_read'], logging_dates)
-            else:
-                removed_users += 1
-                if removed_users % 1e4 == 0:
-                    print("{} \t {}".format(len(user_dict), removed_users))
+    if user_stream is None:
+        user_stream = data_stream_generator(data_dir + "users", n_workers, json_decoder)
+
+    for i, user in tqdm(enumerate(user_stream)):
+        user = prep_user_record(user, valid_item_ids, min_hist_len, max_hist_len, min_test_len,
+                                remove_unk_arts=remove_unk_arts, test_time_thresh=test_time_thresh, unk_arts=unk_arts)
+        if user is not None:
+            # add valid user that fulfills condition
+            if test_time_thresh is not None:
+                article_data['train'].update(art_id for art_id, _ in user['articles_train'])
+                article_data['test'].update(art_id for art_id, _ in user['articles_test'])
+
+            user_dict[user['user_id']] = {key: val for (key, val) in user.items() if key != 'user_id'}
+            #
+            logging_dates = update_logging_dates(user['articles_read'], logging_dates)
+        else:
+            removed_users += 1
+            if removed_users % 1e4 == 0:
+                print("{} \t {}".format(len(user_dict), removed_users))
 
         # break condition
         if len(user_dict) == n_users or i == n_users * 200: #200
@@ -197,7 +195,73 @@ def subsample_users(n_users, article_data, data_dir, min_hist_len, max_hist_len=
 
     return user_dict, article_data, logging_dates
 
-def count_article_interactions(data_dir, n_users=None):
+def reservoir_sample_users(n_users, valid_item_ids, data_dir, min_hist_len, max_hist_len=None, min_test_len=1, test_time_thresh=None,
+                           seed=42, n_workers=0, json_decoder=None, user_stream=None):
+    """
+    Uniform random sample of n_users valid users in a single pass over the raw user data (reservoir sampling)
+
+    Memory is bounded by the reservoir. The item subset (article ids in train & test interactions)
+    is maintained alongside via reference counts, so no further pass over the users is needed
+    Returns the same as subsample_users
+    """
+    rnd = random.Random(seed)
+
+    if max_hist_len is None:
+        max_hist_len = 1000
+
+    if user_stream is None:
+        user_stream = data_stream_generator(data_dir + "users", n_workers, json_decoder)
+
+    reservoir = [] # (position in stream, user)
+    c_items = {'train': defaultdict(int), 'test': defaultdict(int)} # article references of users in the reservoir
+    n_valid = 0
+
+    def update_item_refs(user, sign):
+        if test_time_thresh is None:
+            return
+        for key, refs in c_items.items():
+            for art_id, _ in user['articles_' + key]:
+                refs[art_id] += sign
+                if refs[art_id] == 0:
+                    del refs[art_id]
+
+    for i, user in tqdm(enumerate(user_stream)):
+        user = prep_user_record(user, valid_item_ids, min_hist_len, max_hist_len, min_test_len,
+                                test_time_thresh=test_time_thresh)
+        if user is None:
+            continue
+
+        n_valid += 1
+        if len(reservoir) < n_users:
+            reservoir.append((i, user))
+            update_item_refs(user, 1)
+        else:
+            # replace a random element with probability n_users / n_valid
+            j = rnd.randrange(n_valid)
+            if j < n_users:
+                update_item_refs(reservoir[j][1], -1)
+                reservoir[j] = (i, user)
+                update_item_refs(user, 1)
+
+    print("Sampled {} out of {} valid users".format(len(reservoir), n_valid))
+
+    # keep the order of the raw data
+    user_dict = OrderedDict()
+    article_data = {}
+    logging_dates = (None, None)
+    for _, user in sorted(reservoir, key=lambda entry: entry[0]):
+        user_dict[user['user_id']] = {key: val for (key, val) in user.items() if key != 'user_id'}
+        logging_dates = update_logging_dates(user['articles_read'], logging_dates)
+
+    if test_time_thresh is not None:
+        article_data['train'] = set(c_items['train'].keys())
+        article_data['test'] = set(c_items['test'].keys())
+
+    print("\n Start logging date: {} \t End: {}".format(*logging_dates))
+
+    return user_dict, article_data, logging_dates
+
+def count_article_interactions(data_dir, n_users=None, n_workers=0, json_decoder=None):
 
     c_art_ids = Counter()
 
@@ -207,7 +271,7 @@ def count_article_interactions(data_dir, n_users=None):
         limit = -1
 
     print("Determine most common articles based on user interaction ...")
-    for i, user in tqdm(enumerate(data_stream_generator(data_dir + "users"))):
+    for i, user in tqdm(enumerate(data_stream_generator(data_dir + "users", n_workers, json_decoder))):
         if len(user['articles_read'][0]) == 3:
             _, art_ids, _ = zip(*user['articles_read'])
         elif len(user['articles_read'][0]) == 5:
@@ -223,7 +287,9 @@ def count_article_interactions(data_dir, n_users=None):
 
     return c_art_ids
 
-def subsample_items_from_id(data_dir: str, valid_ids: set, news_len: int, n_news: int, add_items=False, keys_to_exclude = ["short_id", "url"], test_time_thresh=None):
+def subsample_items_from_id(data_dir: str, valid_ids: set, news_len: int, n_news: int, add_items=False, keys_to_exclude = ["short_id", "url"], test_time_thresh=None,
+                            n_workers=0, json_decoder=None, item_stream=None):
+    # item_stream: optional iterable of raw item records, e.g. pre-selected via RawDataIndex. Default: scan all items
     article_dict = OrderedDict()
     article_dict['all'] = {}
     removed_article = set()
@@ -233,7 +299,10 @@ def subsample_items_from_id(data_dir: str, valid_ids: set, news_len: int, n_news
     else:
         additional_items = 0
 
-    for i, item in enumerate(data_stream_generator(data_dir + "items")):
+    if item_stream is None:
+        item_stream = data_stream_generator(data_dir + "items", n_workers, json_decoder)
+
+    for i, item in enumerate(item_stream):
         # item.keys() = dict_keys(['text', 'pub_date', 'author', 'url', 'short_id'])
         if item['short_id'] in valid_ids or additional_items:
 
@@ -287,7 +356,9 @@ def save_data_to_dir(save_path, sample_name, news_data, user_data, logging_dates
 
 
 def get_data_common_interactions(data_dir, n_news, n_users, news_len=30, min_hist_len=5, max_hist_len=None, min_test_len=1,
-                                 sample_name=None, save_path=None, test_time_thresh=None, overwrite_existing=False):
+                                 sample_name=None, save_path=None, test_time_thresh=None, overwrite_existing=False,
+                                 n_workers=0, json_decoder=None, raw_index=None):
+    # raw_index (RawDataIndex): if given, counts come from the index and only pre-selected records are read
     try:
         os.listdir(data_dir)
     except:
@@ -310,11 +381,13 @@ def get_data_common_interactions(data_dir, n_news, n_users, news_len=30, min_his
     # subsample items
     if "most_common" == config.item_sample_method:
 
-        if (save_path / "counter_article_ids.pkl").exists():
+        if raw_index is not None:
+            c_art_ids = Counter(raw_index.get_item_counts())
+        elif (save_path / "counter_article_ids.pkl").exists():
             with open((save_path / "counter_article_ids.pkl"), 'rb') as fin:
                 c_art_ids = pickle.load(fin)
         else:
-            c_art_ids = count_article_interactions(data_dir)
+            c_art_ids = count_article_interactions(data_dir, n_workers=n_workers, json_decoder=json_decoder)
             with open(save_path / "counter_article_ids.pkl", 'wb') as fout:
                 pickle.dump(c_art_ids, fout)
 
@@ -322,19 +395,29 @@ def get_data_common_interactions(data_dir, n_news, n_users, news_len=30, min_his
 
         # get all valid items
         add_items = (True if len(valid_article_ids) < n_news else False) # flag to indicate whether to add random articles. only applies if most common is insufficient
-        news_data = subsample_items_from_id(data_dir, valid_article_ids, n_news=n_news, news_len=news_len, add_items=add_items, test_time_thresh=test_time_thresh)
+        item_stream = None
+        if raw_index is not None and not add_items:
+            item_stream = raw_index.iter_records('items', raw_index.select_items(valid_article_ids))
+        news_data = subsample_items_from_id(data_dir, valid_article_ids, n_news=n_news, news_len=news_len, add_items=add_items, test_time_thresh=test_time_thresh,
+                                            n_workers=n_workers, json_decoder=json_decoder, item_stream=item_stream)
 
     elif "random" == config.item_sample_method:
-        news_data = subsample_items_from_id(data_dir, set(), n_news=n_news, news_len=news_len, add_items=True, test_time_thresh=test_time_thresh)
+        news_data = subsample_items_from_id(data_dir, set(), n_news=n_news, news_len=news_len, add_items=True, test_time_thresh=test_time_thresh,
+                                            n_workers=n_workers, json_decoder=json_decoder)
     else:
         raise NotImplementedError()
 
     # subsample users
     print("Sample users ...")
+    user_stream = None
+    if raw_index is not None:
+        user_stream = raw_index.iter_records('users', raw_index.select_users(min_hist_len, max_hist_len, test_time_thresh, min_test_len))
     user_data, news_data, logging_dates = subsample_users(n_users, news_data, data_dir, min_hist_len,
                                                max_hist_len=max_hist_len,
                                                min_test_len=min_test_len,
-                                               test_time_thresh=test_time_thresh)
+                                               test_time_thresh=test_time_thresh,
+                                               n_workers=n_workers, json_decoder=json_decoder,
+                                               user_stream=user_stream)
 
     logging_dates = {'start': logging_dates[0], 'end': logging_dates[1]}
 
@@ -343,24 +426,10 @@ def get_data_common_interactions(data_dir, n_news, n_users, news_len=30, min_his
 
     return news_data, user_data, logging_dates
 
-def time_stamp2unix(time_stamp, format=None):
-    if format is None:
-        try:
-            t_unix = arrow.get(time_stamp).timestamp
-            #t_unix = int(datetime.datetime.strptime(time_stamp, '%d-%m-%Y-%H-%M-%S').strftime("%s"))
-
-        except:
-            print("Error in converting a timestamp! Please specify format")
-            t_unix = -1
-    else:
-        t_unix = arrow.get(time_stamp, format).timestamp
-
-    return t_unix
-
-def get_all_item_ids(data_dir):
+def get_all_item_ids(data_dir, n_workers=0, json_decoder=None):
     item_ids = set()
 
-    for i, item in enumerate(data_stream_generator(data_dir + "items")):
+    for i, item in enumerate(data_stream_generator(data_dir + "items", n_workers, json_decoder)):
         # item.keys() = dict_keys(['text', 'pub_date', 'author', 'url', 'short_id'])
         if item['text'] is not None:
             item_ids.add(item['short_id'])
@@ -371,7 +440,9 @@ def get_all_item_ids(data_dir):
 
 
 def get_data_n_rnd_users(data_dir, n_users, news_len, min_hist_len, max_hist_len, min_test_len, save_path, sample_name,
-                         test_time_thresh, overwrite_existing):
+                         test_time_thresh, overwrite_existing, n_workers=0, json_decoder=None, raw_index=None,
+                         sampling='reservoir', seed=42):
+    # sampling: 'reservoir' draws uniformly random users in one pass, 'first' takes the first n_users valid users
     try:
         os.listdir(data_dir)
     except:
@@ -388,24 +459,44 @@ def get_data_n_rnd_users(data_dir, n_users, news_len, min_hist_len, max_hist_len
 
     #read in all valid item ids
     f_name_all_item_ids = "all_item_ids.pkl"
-    try:
-        with open(data_dir + "/" + f_name_all_item_ids, 'rb') as fin:
-            all_item_ids = pickle.load(fin)
-    except:
-        print("Did not find {} in {}. Continue to create this first".format(f_name_all_item_ids, data_dir))
+    if raw_index is not None:
+        all_item_ids = set(raw_index['items']['id'][raw_index['items']['has_text']].tolist())
+    else:
+        try:
+            with open(data_dir + "/" + f_name_all_item_ids, 'rb') as fin:
+                all_item_ids = pickle.load(fin)
+        except:
+            print("Did not find {} in {}. Continue to create this first".format(f_name_all_item_ids, data_dir))
 
-        all_item_ids = get_all_item_ids(data_dir)
+            all_item_ids = get_all_item_ids(data_dir, n_workers=n_workers, json_decoder=json_decoder)
 
-        with open(data_dir + "/" + f_name_all_item_ids, 'wb') as fout:
-            pickle.dump(all_item_ids, fout)
+            with open(data_dir + "/" + f_name_all_item_ids, 'wb') as fout:
+                pickle.dump(all_item_ids, fout)
 
     #sample n_users and their item interactions
     print("Sample users ...")
-    user_data, news_data, logging_dates = subsample_users(n_users, all_item_ids, data_dir,
+    user_stream = None
+    if raw_index is not None:
+        user_stream = raw_index.iter_records('users', raw_index.select_users(min_hist_len, max_hist_len, test_time_thresh, min_test_len))
+    if 'reservoir' == sampling:
+        user_data, news_data, logging_dates = reservoir_sample_users(n_users, all_item_ids, data_dir,
                                                min_hist_len=min_hist_len,
                                                max_hist_len=max_hist_len,
                                                min_test_len=min_test_len,
-                                               test_time_thresh=test_time_thresh)
+                                               test_time_thresh=test_time_thresh,
+                                               seed=seed,
+                                               n_workers=n_workers, json_decoder=json_decoder,
+                                               user_stream=user_stream)
+    elif 'first' == sampling:
+        user_data, news_data, logging_dates = subsample_users(n_users, all_item_ids, data_dir,
+                                               min_hist_len=min_hist_len,
+                                               max_hist_len=max_hist_len,
+                                               min_test_len=min_test_len,
+                                               test_time_thresh=test_time_thresh,
+                                               n_workers=n_workers, json_decoder=json_decoder,
+                                               user_stream=user_stream)
+    else:
+        raise NotImplementedError()
 
     #specify logging dates
     logging_dates = {'start': logging_dates[0], 'end': logging_dates[1]}
@@ -417,9 +508,14 @@ def get_data_n_rnd_users(data_dir, n_users, news_len, min_hist_len, max_hist_len
     #sample item data for those items
     valid_article_ids = set(news_data['train']).union(set(news_data['test']))
 
+    item_stream = None
+    if raw_index is not None:
+        item_stream = raw_index.iter_records('items', raw_index.select_items(valid_article_ids))
     article_data = subsample_items_from_id(data_dir, valid_article_ids,
                                         n_news=-1, news_len=news_len,
-                                        test_time_thresh=test_time_thresh)
+                                        test_time_thresh=test_time_thresh,
+                                        n_workers=n_workers, json_decoder=json_decoder,
+                                        item_stream=item_stream)
     news_data['all'] = article_data['all']
 
     if len(news_data['all']) != len(valid_article_ids):
@@ -455,6 +551,15 @@ if __name__ == "__main__":
     parser.add_argument('--max_hist_len', type=int, default=300, help='max number of articles in reading history')
     parser.add_argument('--min_test_len', type=int, default=1, help='minimum number of articles in test interval')
 
+    parser.add_argument('--n_workers', type=int, default=0, help='number of processes to parse the raw JSONL files. 0: parse in main process')
+    parser.add_argument('--user_sampling', type=str, default='reservoir', choices=['reservoir', 'first'],
+                        help="'n_rnd_users': draw random users in a single pass (reservoir) or take the first valid ones")
+    parser.add_argument('--sample_seed', type=int, default=42, help='random seed for user sampling')
+    parser.add_argument('--use_raw_index', action='store_true',
+                        help='build (once) & use a byte-offset index of the raw data to only read selected records')
+    parser.add_argument('--json_decoder', type=str, default=None, choices=['orjson', 'ujson', 'json'],
+                        help='JSON decoder for raw data. Default: fastest installed one')
+
 
     config = parser.parse_args()
 
@@ -477,6 +582,10 @@ if __name__ == "__main__":
 
     #threshold_date = int(datetime.datetime.strptime(config.time_threshold, '%d-%m-%Y-%H-%M-%S').strftime("%s")) #1577228399
 
+    raw_index = None
+    if config.use_raw_index:
+        raw_index = RawDataIndex(config.data_dir, n_workers=config.n_workers, json_decoder=config.json_decoder).load()
+
     if "n_rnd_users" == config.item_sample_method:
         news_data, user_data, logging_dates = get_data_n_rnd_users(config.data_dir, n_users,
                                                                    news_len=config.news_len,
@@ -485,7 +594,10 @@ if __name__ == "__main__":
                                                                    min_test_len=config.min_test_len,
                                                                    save_path=config.save_path, sample_name=sample_name,
                                                                    test_time_thresh=threshold_time,
-                                                                   overwrite_existing=config.overwrite_existing)
+                                                                   overwrite_existing=config.overwrite_existing,
+                                                                   n_workers=config.n_workers, json_decoder=config.json_decoder,
+                                                                   raw_index=raw_index,
+                                                                   sampling=config.user_sampling, seed=config.sample_seed)
     else:
         news_data, user_data, logging_dates = get_data_common_interactions(config.data_dir, n_news, n_users,
                                                                            news_len=config.news_len,
@@ -493,7 +605,9 @@ if __name__ == "__main__":
                                                                            max_hist_len=config.max_hist_len,
                                                                            save_path=config.save_path, sample_name=sample_name,
                                                                            test_time_thresh=threshold_time,
-                                                                           overwrite_existing=config.overwrite_existing)
+                                                                           overwrite_existing=config.overwrite_existing,
+                                                                           n_workers=config.n_workers, json_decoder=config.json_decoder,
+                                                                           raw_index=raw_index)
 
     save_data_to_dir(config.save_path, sample_name, news_data, user_data, logging_dates)
 
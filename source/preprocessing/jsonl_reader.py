@@ -0,0 +1,208 @@
+import json
+import multiprocessing
+import os
+from collections import deque
+from pathlib import Path
+
+import smart_open
+
+# files larger than this are split into byte ranges that can be indexed in parallel, see split_into_tasks
+DEFAULT_CHUNK_SIZE = 64 * 1024 ** 2
+
+# compressed files can't be split into byte ranges and are always indexed as a whole
+COMPRESSED_SUFFIXES = ('.gz', '.bz2', '.xz', '.zst')
+
+
+def get_json_decoder(name=None):
+    """
+    Returns a function to parse a single JSON line (bytes)
+
+    :param name: 'orjson', 'ujson', 'json' or None to pick the fastest installed decoder
+    """
+    if name is None:
+        for candidate in ['orjson', 'ujson']:
+            try:
+                return get_json_decoder(candidate)
+            except ImportError:
+                continue
+        return json.loads
+
+    if 'orjson' == name:
+        import orjson
+        return orjson.loads
+    elif 'ujson' == name:
+        import ujson
+        return ujson.loads
+    elif 'json' == name:
+        return json.loads
+    else:
+        raise NotImplementedError("Unknown JSON decoder '{}'".format(name))
+
+
+def list_data_files(data_dir):
+    # all raw data files of a directory, ignoring hidden & meta files such as '_SUCCESS'
+    return sorted(file for file in Path(data_dir).iterdir() if file.is_file() and file.name[0] not in '_.')
+
+
+def is_splittable(file):
+    return Path(file).suffix not in COMPRESSED_SUFFIXES
+
+
+def iter_lines(file, start=0, end=None):
+    """
+    Stream the (non-empty) lines of a file as bytes without reading the whole file into memory
+
+    For byte ranges, a line belongs to the range in which it starts, i.e. consecutive
+    ranges [0, a), [a, b), .. yield each line exactly once
+    """
+    if start == 0 and end is None:
+        with smart_open.open(str(file), 'rb') as fin:
+            for line in fin:
+                if line.strip():
+                    yield line
+        return
+
+    with open(str(file), 'rb') as fin:
+        if start > 0:
+            # skip the line that started in the previous range
+            fin.seek(start - 1)
+            fin.readline()
+        while end is None or fin.tell() < end:
+            line = fin.readline()
+            if not line:
+                break
+            if line.strip():
+                yield line
+
+
+def iter_line_offsets(file, start=0, end=None):
+    """
+    Like iter_lines but also yields the byte offset of each line, i.e. (offset, line)
+    For compressed files, offsets refer to the decompressed stream
+    """
+    if start == 0 and end is None:
+        offset = 0
+        with smart_open.open(str(file), 'rb') as fin:
+            for line in fin:
+                if line.strip():
+                    yield offset, line
+                offset += len(line)
+        return
+
+    with open(str(file), 'rb') as fin:
+        if start > 0:
+            fin.seek(start - 1)
+            fin.readline()
+        while end is None or fin.tell() < end:
+            offset = fin.tell()
+            line = fin.readline()
+            if not line:
+                break
+            if line.strip():
+                yield offset, line
+
+
+def read_line_at(fin, offset, length):
+    # read a single record from an open file (binary mode) given its byte offset & length
+    fin.seek(offset)
+    return fin.read(length)
+
+
+def read_lines_forward(fin, offsets, lengths, skip_size=1024 ** 2):
+    """
+    Records at increasing byte offsets, read in a single forward pass w/o seeking
+    For compressed streams, where a seek backwards decompresses the file from its start again
+    """
+    pos = 0
+    for offset, length in zip(offsets, lengths):
+        while pos < offset:
+            skipped = fin.read(min(offset - pos, skip_size))
+            if not skipped:
+                raise EOFError("Offset {} beyond the end of the file".format(offset))
+            pos += len(skipped)
+        line = fin.read(length)
+        pos += len(line)
+        yield line
+
+
+def split_into_tasks(files, chunk_size=DEFAULT_CHUNK_SIZE):
+    # (file, start, end) for each byte range. compressed or small files make up a single task
+    tasks = []
+    for file in files:
+        size = os.path.getsize(str(file))
+        if chunk_size is None or not is_splittable(file) or size <= chunk_size:
+            tasks.append((str(file), 0, None))
+        else:
+            tasks.extend((str(file), start, min(start + chunk_size, size)) for start in range(0, size, chunk_size))
+    return tasks
+
+
+def iter_line_batches(files, batch_size):
+    # the (non-empty) lines of all files as bytes, in lists of batch_size lines
+    batch = []
+    for file in files:
+        for line in iter_lines(file):
+            batch.append(line)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _parse_lines(task):
+    # worker: parse a batch of lines
+    lines, decoder_name = task
+    loads = get_json_decoder(decoder_name)
+    return [loads(line) for line in lines]
+
+
+def stream_jsonl_batches(data_dir, n_workers=0, batch_size=10000, decoder=None, max_buffered=None):
+    """
+    Yields the records of all JSONL files in data_dir as lists of batch_size records, in file order
+
+    :param n_workers: number of processes to parse the lines in parallel. Lines are read in this process
+        (also from compressed files) and sent to the workers in batches, so a worker never holds more than
+        batch_size records
+    :param decoder: name of JSON decoder, see get_json_decoder
+    :param max_buffered: max. number of records parsed ahead of the consumer in parallel mode.
+        Default: 2 batches per worker
+    """
+    files = list_data_files(data_dir)
+
+    if n_workers is None or n_workers < 1:
+        loads = get_json_decoder(decoder)
+        for lines in iter_line_batches(files, batch_size):
+            yield [loads(line) for line in lines]
+        return
+
+    max_in_flight = max(1, max_buffered // batch_size) if max_buffered is not None else None
+    tasks = ((lines, decoder) for lines in iter_line_batches(files, batch_size))
+    yield from map_tasks_in_order(_parse_lines, tasks, n_workers, max_in_flight)
+
+
+def map_tasks_in_order(func, tasks, n_workers, max_in_flight=None):
+    """
+    Apply func to tasks in a process pool and yield the results in task order
+    At most max_in_flight results are buffered, which bounds memory if the consumer is slower than the workers
+    """
+    max_in_flight = max_in_flight or 2 * n_workers
+    pool = multiprocessing.Pool(n_workers)
+    pending = deque()
+    try:
+        for task in tasks:
+            pending.append(pool.apply_async(func, (task,)))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        # also reached if the consumer stops early
+        pool.terminate()
+        pool.join()
+
+
+def stream_jsonl(data_dir, n_workers=0, **kwargs):
+    # record-wise view on stream_jsonl_batches
+    for batch in stream_jsonl_batches(data_dir, n_workers=n_workers, **kwargs):
+        yield from batch
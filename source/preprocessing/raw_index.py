@@ -0,0 +1,265 @@
+import json
+import pickle
+from collections import defaultdict
+from pathlib import Path
+
+import arrow
+import numpy as np
+import smart_open
+
+from source.preprocessing.jsonl_reader import get_json_decoder, list_data_files, split_into_tasks, \
+    iter_line_offsets, read_line_at, read_lines_forward, is_splittable, map_tasks_in_order
+
+INDEX_VERSION = 2
+
+
+def time_stamp2unix(time_stamp, format=None):
+    # float_timestamp is a property in all arrow versions, timestamp became a method in arrow 1.0
+    if format is None:
+        try:
+            t_unix = int(arrow.get(time_stamp).float_timestamp)
+            #t_unix = int(datetime.datetime.strptime(time_stamp, '%d-%m-%Y-%H-%M-%S').strftime("%s"))
+
+        except:
+            print("Error in converting a timestamp! Please specify format")
+            t_unix = -1
+    else:
+        t_unix = int(arrow.get(time_stamp, format).float_timestamp)
+
+    return t_unix
+
+
+def parse_read_entry(entry):
+    # (art_id, UNIX time stamp) of a single interaction in 'articles_read', -1 if the time stamp can't be parsed
+    if len(entry) == 3:  ## december 19 data has 3 fields for each interaction
+        _, art_id, time_stamp = entry
+    elif len(entry) == 5:  ## november 19 data has 5
+        art_id, ts = entry[-2:]
+        time_stamp = time_stamp2unix(ts)
+    else:
+        raise NotImplementedError("Unknown format of 'articles_read'")
+    return art_id, time_stamp
+
+
+def _files_state(files):
+    return [[str(file), file.stat().st_size, file.stat().st_mtime_ns] for file in files]
+
+
+def _index_user_task(task):
+    # worker: offsets, lengths & interaction stats of all users in a file or byte range
+    file_idx, file, start, end, decoder = task
+    loads = get_json_decoder(decoder)
+
+    ids, offsets, lengths, n_inter, first_ts, last_ts = [], [], [], [], [], []
+    item_counts = defaultdict(int)
+    item_first, item_last = {}, {}
+
+    for offset, line in iter_line_offsets(file, start, end):
+        user = loads(line)
+        time_stamps = []
+        for entry in user['articles_read']:
+            art_id, time_stamp = parse_read_entry(entry)
+            time_stamps.append(time_stamp)
+            item_counts[art_id] += 1
+            if art_id not in item_first or time_stamp < item_first[art_id]:
+                item_first[art_id] = time_stamp
+            if art_id not in item_last or time_stamp > item_last[art_id]:
+                item_last[art_id] = time_stamp
+
+        ids.append(user['user_id'])
+        offsets.append(offset)
+        lengths.append(len(line))
+        n_inter.append(len(time_stamps))
+        first_ts.append(min(time_stamps) if time_stamps else -1)
+        last_ts.append(max(time_stamps) if time_stamps else -1)
+
+    users = {'id': ids, 'file': [file_idx] * len(ids), 'offset': offsets, 'length': lengths,
+             'n_interactions': n_inter, 'first_ts': first_ts, 'last_ts': last_ts}
+    return users, (item_counts, item_first, item_last)
+
+
+def _index_item_task(task):
+    # worker: offsets & lengths of all items in a file or byte range
+    file_idx, file, start, end, decoder = task
+    loads = get_json_decoder(decoder)
+
+    ids, offsets, lengths, has_text = [], [], [], []
+    for offset, line in iter_line_offsets(file, start, end):
+        item = loads(line)
+        ids.append(item['short_id'])
+        offsets.append(offset)
+        lengths.append(len(line))
+        has_text.append(item['text'] is not None)
+
+    return {'id': ids, 'file': [file_idx] * len(ids), 'offset': offsets, 'length': lengths, 'has_text': has_text}
+
+
+class RawDataIndex(object):
+    """
+    Byte-offset index over the raw DPG dump (directories 'users' and 'items' in data_dir), built in a single pass
+
+    users: id, file, offset, length, n_interactions, first_ts, last_ts
+    items: id, file, offset, length, has_text, n_interactions, first_ts, last_ts (based on user interactions)
+    reads: id, n_interactions of all articles read by users, including those missing from items
+
+    Each table is a dict of numpy arrays and stored in <data_dir>/raw_index/
+    The index is rebuilt if the raw files changed (size or modification time)
+    """
+
+    TABLES = ['users', 'items']
+    STATS_TABLES = ['reads']
+
+    def __init__(self, data_dir, index_dir=None, n_workers=0, json_decoder=None):
+        self.data_dir = Path(data_dir)
+        self.index_dir = Path(index_dir) if index_dir is not None else self.data_dir.joinpath('raw_index')
+        self.n_workers = n_workers
+        self.json_decoder = json_decoder
+
+        self.files = {table: list_data_files(self.data_dir.joinpath(table)) for table in self.TABLES}
+        self.tables = {}
+
+    def _meta_path(self):
+        return self.index_dir.joinpath('meta.json')
+
+    def _table_path(self, table):
+        return self.index_dir.joinpath(table + '.pkl')
+
+    def is_up_to_date(self):
+        if not self._meta_path().is_file():
+            return False
+        with self._meta_path().open('r') as fin:
+            meta = json.load(fin)
+        return meta.get('version') == INDEX_VERSION \
+               and meta.get('files') == {table: _files_state(files) for table, files in self.files.items()}
+
+    def load(self):
+        if not self.is_up_to_date():
+            self.build()
+        else:
+            for table in self.TABLES + self.STATS_TABLES:
+                with self._table_path(table).open('rb') as fin:
+                    self.tables[table] = pickle.load(fin)
+        return self
+
+    def _map(self, func, table):
+        tasks = [(self.files[table].index(Path(file)), file, start, end, self.json_decoder)
+                 for file, start, end in split_into_tasks(self.files[table])]
+        if self.n_workers is None or self.n_workers < 1:
+            return map(func, tasks)
+        return map_tasks_in_order(func, tasks, self.n_workers)
+
+    def build(self):
+        print("Indexing raw data in {} ..".format(self.data_dir))
+
+        # users & interaction statistics of items
+        users = defaultdict(list)
+        item_counts = defaultdict(int)
+        item_first, item_last = {}, {}
+        for part, (counts, first, last) in self._map(_index_user_task, 'users'):
+            for key, val in part.items():
+                users[key].extend(val)
+            for art_id, n in counts.items():
+                item_counts[art_id] += n
+                if art_id not in item_first or first[art_id] < item_first[art_id]:
+                    item_first[art_id] = first[art_id]
+                if art_id not in item_last or last[art_id] > item_last[art_id]:
+                    item_last[art_id] = last[art_id]
+
+        items = defaultdict(list)
+        for part in self._map(_index_item_task, 'items'):
+            for key, val in part.items():
+                items[key].extend(val)
+        items['n_interactions'] = [item_counts.get(art_id, 0) for art_id in items['id']]
+        items['first_ts'] = [item_first.get(art_id, -1) for art_id in items['id']]
+        items['last_ts'] = [item_last.get(art_id, -1) for art_id in items['id']]
+
+        dtypes = {'file': 'int16', 'offset': 'int64', 'length': 'int32', 'n_interactions': 'int32',
+                  'first_ts': 'int64', 'last_ts': 'int64', 'has_text': 'bool'}
+        for table, columns in zip(self.TABLES, [users, items]):
+            self.tables[table] = {key: (np.array(val, dtype=dtypes[key]) if key in dtypes else np.array(val))
+                                  for key, val in columns.items()}
+        # in order of first occurrence, like the Counter of count_article_interactions
+        self.tables['reads'] = {'id': np.array(list(item_counts.keys())),
+                                'n_interactions': np.array(list(item_counts.values()), dtype='int32')}
+
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        for table in self.TABLES + self.STATS_TABLES:
+            with self._table_path(table).open('wb') as fout:
+                pickle.dump(self.tables[table], fout, protocol=pickle.HIGHEST_PROTOCOL)
+        # meta is written last and marks the index as complete
+        with self._meta_path().open('w') as fout:
+            json.dump({'version': INDEX_VERSION,
+                       'files': {table: _files_state(files) for table, files in self.files.items()}}, fout)
+
+        print("Indexed {} users and {} items".format(len(users['id']), len(items['id'])))
+        return self
+
+    def __getitem__(self, table):
+        return self.tables[table]
+
+    def iter_records(self, table, rows=None):
+        """
+        Seek to & parse the records of the given rows (all if None), yielded in the order of rows
+
+        The offsets of compressed files (.gz, ..) refer to the decompressed stream, i.e. they can't be seeked
+        cheaply. Their records are read in a single forward pass in offset order instead. Rows of such a file
+        that are not in file order (see select_users) are buffered until the pass is complete
+        """
+        index = self.tables[table]
+        rows = np.arange(len(index['id'])) if rows is None else np.asarray(rows, dtype='int64')
+        loads = get_json_decoder(self.json_decoder)
+
+        # group consecutive rows of the same file to avoid re-opening files
+        file_ids = index['file'][rows]
+        boundaries = np.flatnonzero(np.diff(file_ids)) + 1
+        for block in np.split(rows, boundaries):
+            if len(block) == 0:
+                continue
+            file = self.files[table][int(index['file'][block[0]])]
+            offsets, lengths = index['offset'][block], index['length'][block]
+            with smart_open.open(str(file), 'rb') as fin:
+                if is_splittable(file):
+                    for offset, length in zip(offsets.tolist(), lengths.tolist()):
+                        yield loads(read_line_at(fin, offset, length))
+                    continue
+
+                order = np.argsort(offsets, kind='stable')
+                lines = read_lines_forward(fin, offsets[order].tolist(), lengths[order].tolist())
+                if (order == np.arange(len(order))).all():
+                    for line in lines:
+                        yield loads(line)
+                else:
+                    buffered = [None] * len(order)
+                    for pos, line in zip(order.tolist(), lines):
+                        buffered[pos] = line
+                    for line in buffered:
+                        yield loads(line)
+
+    def get_item_counts(self):
+        # {art_id: number of user interactions} of all read articles, equivalent of count_article_interactions
+        reads = self.tables['reads']
+        return dict(zip(reads['id'].tolist(), reads['n_interactions'].tolist()))
+
+    def select_users(self, min_hist_len=1, max_hist_len=None, test_time_thresh=None, min_test_len=1):
+        """
+        Rows of users that can satisfy the sampling criteria, based on their raw interaction stats
+        With a time threshold, users need interactions before (and after) it
+        """
+        users = self.tables['users']
+        mask = users['n_interactions'] >= min_hist_len
+        if max_hist_len is not None:
+            mask &= users['n_interactions'] <= max_hist_len
+        if test_time_thresh is not None:
+            mask &= users['first_ts'] < test_time_thresh
+            if min_test_len > 0:
+                mask &= users['last_ts'] >= test_time_thresh
+        rows = np.flatnonzero(mask)
+        # file order, i.e. same order as a sequential scan
+        return rows[np.lexsort((users['offset'][rows], users['file'][rows]))]
+
+    def select_items(self, item_ids):
+        # rows of the given item ids, in file order
+        items = self.tables['items']
+        mask = np.isin(items['id'], np.array(list(item_ids)))
+        rows = np.flatnonzero(mask)
+        return rows[np.lexsort((items['offset'][rows], items['file'][rows]))]
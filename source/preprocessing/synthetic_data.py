@@ -0,0 +1,235 @@
+import argparse
+import gzip
+import json
+import pickle
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from source.preprocessing.get_dpg_data_sample import prep_user_record, get_text_snippet, get_n_words
+
+# interactions are spread over this period: 01-11-2019 - 01-01-2020 (UNIX time stamps)
+DEFAULT_TIME_RANGE = (1572566400, 1577836800)
+
+HIST_LEN_DISTRIBUTIONS = ['lognormal', 'geometric', 'uniform']
+
+# raw file names of the MovieLens datasets, see ML1MDatasetML & ML20MDatasetML
+ML_FORMATS = {
+    'ml-1m': {'ratings': 'ratings.dat', 'movies': 'movies.dat', 'other': ['README', 'users.dat']},
+    'ml-20m': {'ratings': 'ratings.csv', 'movies': 'movies.csv',
+               'other': ['genome-scores.csv', 'genome-tags.csv', 'links.csv', 'README.txt', 'tags.csv']},
+}
+
+
+def sample_hist_lens(rng, n_users, mean_len=20, dist='lognormal', min_len=1, max_len=None):
+    """
+    Length of each user history
+
+    dist: 'lognormal' (heavy tail like real click logs), 'geometric' or 'uniform' in [min_len, 2 * mean_len - min_len]
+    """
+    if 'lognormal' == dist:
+        sigma = 1.0
+        lens = rng.lognormal(np.log(mean_len) - sigma ** 2 / 2, sigma, size=n_users)
+    elif 'geometric' == dist:
+        lens = rng.geometric(1 / mean_len, size=n_users)
+    elif 'uniform' == dist:
+        lens = rng.integers(min_len, max(2 * mean_len - min_len, min_len) + 1, size=n_users)
+    else:
+        raise NotImplementedError("Unknown history length distribution '{}'".format(dist))
+
+    lens = np.maximum(np.round(lens), min_len)
+    if max_len is not None:
+        lens = np.minimum(lens, max_len)
+    return lens.astype('int64')
+
+
+def sample_interactions(rng, n_users, n_items, hist_lens, zipf_a=1.0, time_range=DEFAULT_TIME_RANGE):
+    """
+    Flat (user, item, time stamp) arrays sorted by user and time
+    Item popularity follows a Zipf law with exponent zipf_a (0: uniform)
+    """
+    popularity = 1 / np.arange(1, n_items + 1) ** zipf_a
+    # popular items get random ids, i.e. they are not clustered at the start of the id range
+    popularity = rng.permutation(popularity / popularity.sum())
+
+    users = np.repeat(np.arange(n_users), hist_lens)
+    items = rng.choice(n_items, size=len(users), p=popularity)
+    time_stamps = rng.integers(time_range[0], time_range[1], size=len(users))
+
+    order = np.lexsort((time_stamps, users))
+    return users[order], items[order], time_stamps[order]
+
+
+def sample_texts(rng, n_texts, mean_len=200, vocab_size=5000, zipf_a=1.1):
+    # random texts with Zipf distributed words 'w0', 'w1', ..
+    words = np.array(['w{}'.format(i) for i in range(vocab_size)])
+    text_lens = sample_hist_lens(rng, n_texts, mean_len, dist='lognormal', min_len=1)
+    freqs = 1 / np.arange(1, vocab_size + 1) ** zipf_a
+    word_ids = rng.choice(vocab_size, size=int(text_lens.sum()), p=freqs / freqs.sum())
+    bounds = np.concatenate([[0], np.cumsum(text_lens)])
+    return [" ".join(words[word_ids[bounds[i]:bounds[i + 1]]]) for i in range(n_texts)]
+
+
+def write_ml_ratings(folder, n_users, n_items, mean_hist_len=100, hist_len_dist='lognormal', fmt='ml-1m',
+                     min_hist_len=1, zipf_a=1.0, seed=42):
+    """
+    Raw MovieLens files with the schema of ml-1m ('uid::sid::rating::timestamp') or ml-20m
+    (CSV with header). Ids start at 1 and every user rates an item at most once
+    """
+    rng = np.random.default_rng(seed)
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    file_names = ML_FORMATS[fmt]
+
+    hist_lens = sample_hist_lens(rng, n_users, mean_hist_len, hist_len_dist, min_len=min_hist_len, max_len=n_items)
+    users, items, time_stamps = sample_interactions(rng, n_users, n_items, hist_lens, zipf_a)
+    # drop repeated ratings of the same item
+    _, first = np.unique(users * n_items + items, return_index=True)
+    first.sort()
+    users, items, time_stamps = users[first] + 1, items[first] + 1, time_stamps[first]
+
+    if 'ml-1m' == fmt:
+        ratings = rng.integers(1, 6, size=len(users))
+        np.savetxt(folder.joinpath(file_names['ratings']), np.stack([users, items, ratings, time_stamps], axis=1),
+                   fmt='%d::%d::%d::%d')
+        movies = ['{0}::Movie {0} (2000)::Drama'.format(i) for i in range(1, n_items + 1)]
+    else:
+        ratings = rng.integers(1, 11, size=len(users)) / 2
+        with folder.joinpath(file_names['ratings']).open('w') as fout:
+            fout.write('userId,movieId,rating,timestamp\n')
+            np.savetxt(fout, np.stack([users, items, ratings, time_stamps], axis=1), fmt='%d,%d,%.1f,%d')
+        movies = ['movieId,title,genres'] + ['{0},Movie {0} (2000),Drama'.format(i) for i in range(1, n_items + 1)]
+
+    folder.joinpath(file_names['movies']).write_text('\n'.join(movies) + '\n')
+    for name in file_names['other']:
+        folder.joinpath(name).touch()
+
+    print("Wrote {} ratings of {} users on {} items to {}".format(len(users), n_users, n_items, folder))
+    return len(users)
+
+
+def generate_dpg_records(n_users, n_items, mean_hist_len=30, hist_len_dist='lognormal', mean_text_len=200,
+                         vocab_size=5000, min_hist_len=1, max_hist_len=None, zipf_a=1.0, frac_no_text=0.01,
+                         time_range=DEFAULT_TIME_RANGE, seed=42):
+    """
+    Raw DPG user & item records with the schema of the dump read by get_dpg_data_sample
+
+    users: {'user_id', 'articles_read': [[newspaper, short_id, UNIX time stamp], ...], 'opened_pushes', 'articles_pushed'}
+    items: {'short_id', 'text', 'pub_date', 'first_pub_date', 'author', 'url'}, a fraction of items has no text
+    """
+    rng = np.random.default_rng(seed)
+    hist_lens = sample_hist_lens(rng, n_users, mean_hist_len, hist_len_dist, min_len=min_hist_len, max_len=max_hist_len)
+    users, items, time_stamps = sample_interactions(rng, n_users, n_items, hist_lens, zipf_a, time_range)
+
+    art_ids = ['a{}'.format(i) for i in range(n_items)]
+    bounds = np.concatenate([[0], np.cumsum(hist_lens)])
+    user_records = []
+    for u in range(n_users):
+        start, end = bounds[u], bounds[u + 1]
+        user_records.append({'user_id': 'u{}'.format(u),
+                             'articles_read': [['dpg', art_ids[i], t] for i, t
+                                               in zip(items[start:end].tolist(), time_stamps[start:end].tolist())],
+                             'opened_pushes': [], 'articles_pushed': []})
+
+    texts = sample_texts(rng, n_items, mean_text_len, vocab_size)
+    no_text = rng.random(n_items) < frac_no_text
+    pub_dates = rng.integers(time_range[0] - 7 * 24 * 3600, time_range[1], size=n_items).astype('datetime64[s]')
+    item_records = [{'short_id': art_ids[i], 'text': None if no_text[i] else texts[i],
+                     'pub_date': str(pub_dates[i]), 'first_pub_date': str(pub_dates[i]),
+                     'author': 'author{}'.format(i % 100), 'url': 'https://example.com/{}'.format(art_ids[i])}
+                    for i in range(n_items)]
+    return user_records, item_records
+
+
+def write_jsonl(folder, records, n_files=1, compress=False):
+    # spread records over n_files part files like the raw dump, e.g. 'part-00000.json(.gz)'
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    bounds = np.linspace(0, len(records), n_files + 1).astype('int64')
+    for k in range(n_files):
+        path = folder.joinpath('part-{:05d}.json'.format(k) + ('.gz' if compress else ''))
+        with (gzip.open(str(path), 'wt') if compress else path.open('w')) as fout:
+            for record in records[bounds[k]:bounds[k + 1]]:
+                fout.write(json.dumps(record) + '\n')
+
+
+def write_dpg_raw(data_dir, user_records, item_records, n_files=4, compress=False):
+    # raw dump with directories 'users' & 'items' as expected by get_dpg_data_sample and RawDataIndex
+    data_dir = Path(data_dir)
+    write_jsonl(data_dir.joinpath('users'), user_records, n_files, compress)
+    write_jsonl(data_dir.joinpath('items'), item_records, n_files, compress)
+    print("Wrote {} users and {} items to {}".format(len(user_records), len(item_records), data_dir))
+
+
+def write_dpg_sample(folder, user_records, item_records, test_time_thresh, news_len=30, min_hist_len=1,
+                     max_hist_len=None, min_test_len=1):
+    """
+    user_data.pkl & news_data.pkl of a sampled DPG dataset (as written by get_dpg_data_sample)
+    All valid users are kept. Users are filtered & split with the same code as the sampling
+    """
+    valid_item_ids = set(item['short_id'] for item in item_records if item['text'] is not None)
+
+    user_data = OrderedDict()
+    news_data = {'train': set(), 'test': set()}
+    for user in user_records:
+        user = prep_user_record(dict(user), valid_item_ids, min_hist_len, max_hist_len or 1000, min_test_len,
+                                test_time_thresh=test_time_thresh)
+        if user is None:
+            continue
+        news_data['train'].update(art_id for art_id, _ in user['articles_train'])
+        news_data['test'].update(art_id for art_id, _ in user['articles_test'])
+        user_data[user['user_id']] = {key: val for key, val in user.items() if key != 'user_id'}
+
+    relevant = news_data['train'] | news_data['test']
+    news_data['all'] = {}
+    for item in item_records:
+        if item['short_id'] in relevant:
+            article = {key: val for key, val in item.items() if key not in ['short_id', 'url']}
+            article['snippet'] = get_text_snippet(item['text'], news_len)
+            article['n_words'] = get_n_words(item['text'])
+            news_data['all'][item['short_id']] = article
+
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    with folder.joinpath('news_data.pkl').open('wb') as fout:
+        pickle.dump(news_data, fout)
+    with folder.joinpath('user_data.pkl').open('wb') as fout:
+        pickle.dump(user_data, fout)
+
+    print("Wrote sample of {} users and {} articles to {}".format(len(user_data), len(news_data['all']), folder))
+    return user_data, news_data
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Write synthetic raw data with the schemas of MovieLens & DPG')
+
+    parser.add_argument('--dataset', type=str, default='ml-1m', choices=['ml-1m', 'ml-20m', 'dpg_raw', 'dpg_sample'])
+    parser.add_argument('--save_path', type=str, required=True, help='folder of the raw files, e.g. Data/ml-1m')
+    parser.add_argument('--n_users', type=int, default=1000)
+    parser.add_argument('--n_items', type=int, default=500)
+    parser.add_argument('--mean_hist_len', type=int, default=30, help='mean number of interactions per user')
+    parser.add_argument('--hist_len_dist', type=str, default='lognormal', choices=HIST_LEN_DISTRIBUTIONS)
+    parser.add_argument('--min_hist_len', type=int, default=1)
+    parser.add_argument('--zipf_a', type=float, default=1.0, help='exponent of the item popularity distribution')
+    parser.add_argument('--mean_text_len', type=int, default=200, help='mean number of words per article (DPG)')
+    parser.add_argument('--n_files', type=int, default=4, help='number of part files per directory (dpg_raw)')
+    parser.add_argument('--compress', action='store_true', help='gzip the part files (dpg_raw)')
+    parser.add_argument('--time_threshold', type=int, default=1574553599, help='UNIX time stamp to split train/test (dpg_sample)')
+    parser.add_argument('--seed', type=int, default=42)
+
+    config = parser.parse_args()
+
+    if config.dataset in ML_FORMATS:
+        write_ml_ratings(config.save_path, config.n_users, config.n_items, config.mean_hist_len, config.hist_len_dist,
+                         fmt=config.dataset, min_hist_len=config.min_hist_len, zipf_a=config.zipf_a, seed=config.seed)
+    else:
+        user_records, item_records = generate_dpg_records(config.n_users, config.n_items, config.mean_hist_len,
+                                                          config.hist_len_dist, config.mean_text_len,
+                                                          min_hist_len=config.min_hist_len, zipf_a=config.zipf_a,
+                                                          seed=config.seed)
+        if 'dpg_raw' == config.dataset:
+            write_dpg_raw(config.save_path, user_records, item_records, config.n_files, config.compress)
+        else:
+            write_dpg_sample(config.save_path, user_records, item_records, config.time_threshold)
@@ -387,14 +387,7 @@ def preprocess_dpg_news_file(news_file, language, min_counts_for_vocab=2, max_ar
     else:
         raise NotImplementedError()
 
-    # determine language
-    if isinstance(language, str):
-        language = language.lower()
-    elif language is None:
-        print("No language specified. Assuming 'dutch'")
-        language = "dutch"
-    else:
-        raise ValueError()
+    language = get_news_language(language)
 
     article_ids = news_data['all']
 
@@ -403,13 +396,7 @@ def preprocess_dpg_news_file(news_file, language, min_counts_for_vocab=2, max_ar
     vocab_raw = Counter({'PAD': 999999})
 
     for art_id in article_ids:
-        if "snippet" in article_ids[art_id]:
-            text = article_ids[art_id]["snippet"]
-        else:
-            text = article_ids[art_id]['text'][:max_article_len+10]
-
-        tokens = word_tokenize(text.lower(), language=language) if lower_case \
-            else word_tokenize(text, language=language)
+        tokens = tokenize_article(article_ids[art_id], language, max_article_len, lower_case)
 
         vocab_raw.update(tokens)
         article_ids[art_id]['tokens'] = tokens
@@ -430,19 +417,8 @@ def preprocess_dpg_news_file(news_file, language, min_counts_for_vocab=2, max_ar
     art_id2idx = {}  # {'0': 0}
 
     for art_id in article_ids:
-        word_ids = []
-
         art_id2idx[art_id] = len(art_id2idx) # map article id to index
-
-        # get word_ids from news title
-        for word in article_ids[art_id]['tokens']:
-            # if word occurs in vocabulary, add the id
-            # unknown words are omitted
-            if word in vocab:
-                word_ids.append(vocab[word])
-
-        # pad & truncate sequence
-        news_as_word_ids[art_id] = pad_sequence(word_ids, max_article_len)
+        news_as_word_ids[art_id] = encode_tokens_as_word_ids(article_ids[art_id]['tokens'], vocab, max_article_len)
         #news_as_word_ids.append(pad_sequence(word_ids, max_article_len))
 
     # reformat as array
@@ -451,6 +427,44 @@ def preprocess_dpg_news_file(news_file, language, min_counts_for_vocab=2, max_ar
 
     return vocab, news_as_word_ids, art_id2idx
 
+def encode_dpg_news_with_vocab(news_data, vocab, language, max_article_len=30, lower_case=False):
+    # encode (new) articles as word ids with an existing vocabulary, e.g. when extending a preprocessed dataset
+    language = get_news_language(language)
+
+    news_as_word_ids = {}
+    for art_id, article in news_data['all'].items():
+        tokens = tokenize_article(article, language, max_article_len, lower_case)
+        news_as_word_ids[art_id] = encode_tokens_as_word_ids(tokens, vocab, max_article_len)
+
+    return news_as_word_ids
+
+def get_news_language(language):
+    # determine language
+    if isinstance(language, str):
+        return language.lower()
+    elif language is None:
+        print("No language specified. Assuming 'dutch'")
+        return "dutch"
+    else:
+        raise ValueError()
+
+def tokenize_article(article, language, max_article_len, lower_case=False):
+    if "snippet" in article:
+        text = article["snippet"]
+    else:
+        text = article['text'][:max_article_len+10]
+
+    return word_tokenize(text.lower(), language=language) if lower_case \
+        else word_tokenize(text, language=language)
+
+def encode_tokens_as_word_ids(tokens, vocab, max_article_len):
+    # if word occurs in vocabulary, add the id
+    # unknown words are omitted
+    word_ids = [vocab[word] for word in tokens if word in vocab]
+
+    # pad & truncate sequence
+    return pad_sequence(word_ids, max_article_len)
+
 def get_word_embs_from_pretrained_ft(vocab, emb_path, emb_dim=300):
     if emb_path is None:
         print("No path to pretrained word embeddings given")
@@ -613,6 +627,18 @@ def precompute_dpg_art_emb(news_data: dict, news_encoder_code: str, max_article_
                 bert_embeddings = pickle.load(fin)
 
             print("Found pre-computed embeddings and will use these!")
+
+            # only encode articles that are not covered yet, e.g. newly added ones
+            missing = {art_id: art for art_id, art in all_articles.items() if art_id not in bert_embeddings}
+            if len(missing) > 0:
+                print("encode {} missing news articles ...".format(len(missing)))
+                bert_feat_extractor = BertFeatureExtractor(path_to_pt_model, lower_case)
+                bert_embeddings.update(bert_feat_extractor.encode_text_to_features_batches(
+                                            missing, [feature_method], 10, max_article_len)[0])
+
+                with bert_export_path.joinpath(file_name + ".pkl").open('wb') as fout:
+                    pickle.dump(bert_embeddings, fout)
+
             art_id2idx, art_emb_matrix = select_rel_embs_and_stack(all_articles, bert_embeddings)
 
             return art_id2idx, art_emb_matrix
@@ -24,6 +24,20 @@ def set_random_seeds(rnd_seed):
     cudnn.deterministic = True
     cudnn.benchmark = False
 
+# fields that can be extracted from UNIX time stamps. 'year' is stored relative to 2000
+TIME_VECTOR_FIELDS = ('year', 'month', 'day', 'weekday', 'hour', 'minute', 'second')
+
+
+def time_vector_fields(ts_len=4):
+    """
+    Fields of the time vector with length ts_len, e.g.
+    4: [weekday, hour, minute, second]
+    7: [day, month, year, weekday, hour, minute, second]
+    """
+    if ts_len < 4 or ts_len > 7:
+        raise ValueError("Length of time vector must be between 4 and 7, got {}".format(ts_len))
+    return ('day', 'month', 'year')[:ts_len - 4] + ('weekday', 'hour', 'minute', 'second')
+
 def map_time_stamp_to_vector(ts, ts_len=4):
     """
     input:
@@ -32,27 +46,50 @@ def map_time_stamp_to_vector(ts, ts_len=4):
     output:
         ts_vector (list): vector representation of the datetime
     """
-    ts = arrow.get(ts)
-
-    ts_vector = [
-        ts.weekday(),
-        ts.hour,
-        ts.minute,
-        ts.second
-    ]
-    to_add = None
-    if ts_len == 4:
-        return ts_vector
-    if ts_len > 4:
-        to_add = [ts.day] # 1 - 7
-    if ts > 5:
-        to_add.append(ts.month) # 1 - 12
-    if ts > 6:
-        to_add.append(ts.year - 2000)
-    if ts > 7:
-        raise ValueError()
-
-    return to_add + ts_vector
+    return timestamps_to_vectors(np.array([ts]), fields=time_vector_fields(ts_len))[0].tolist()
+
+def timestamps_to_vectors(time_stamps, fields=('weekday', 'hour', 'minute', 'second'), utc_offset=0):
+    """
+    Batched conversion of UNIX time stamps into time vectors using numpy datetime64
+
+    input:
+        time_stamps (np.ndarray): UNIX time stamps in seconds
+        fields (tuple): subset of TIME_VECTOR_FIELDS in the desired order
+        utc_offset (int or np.ndarray): offset to UTC in seconds, either global or per time stamp
+
+    output:
+        (np.ndarray): (N x len(fields)) matrix, uint8 or int16 if 'year' is included
+    """
+    unknown = set(fields) - set(TIME_VECTOR_FIELDS)
+    if unknown:
+        raise ValueError("Unknown time vector fields: {}".format(sorted(unknown)))
+
+    t = (np.asarray(time_stamps, dtype='int64') + np.asarray(utc_offset, dtype='int64')).astype('datetime64[s]')
+    days = t.astype('datetime64[D]')
+    sec_of_day = (t - days).astype('int64')
+
+    columns = {}
+    if 'hour' in fields:
+        columns['hour'] = sec_of_day // 3600
+    if 'minute' in fields:
+        columns['minute'] = (sec_of_day % 3600) // 60
+    if 'second' in fields:
+        columns['second'] = sec_of_day % 60
+    if 'weekday' in fields:
+        # 1970-01-01 was a Thursday, i.e. weekday 3 with Monday as 0
+        columns['weekday'] = (days.astype('int64') + 3) % 7
+    if {'year', 'month', 'day'} & set(fields):
+        months = days.astype('datetime64[M]')
+        years = months.astype('datetime64[Y]')
+        columns['day'] = (days - months).astype('int64') + 1
+        columns['month'] = (months - years).astype('int64') + 1
+        columns['year'] = years.astype('int64') + 1970 - 2000
+
+    dtype = 'int16' if 'year' in fields else 'uint8'
+    out = np.empty((len(t), len(fields)), dtype=dtype)
+    for i, field in enumerate(fields):
+        out[:, i] = columns[field]
+    return out
 
 def init_weights(m):
     if isinstance(m, nn.Linear):
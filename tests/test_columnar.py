@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from datasets.columnar import ColumnarSplit
+from source.preprocessing.synthetic_data import sample_hist_lens, sample_interactions
+
+
+def synthetic_u2seq(rng, users, w_time_stamps):
+    # {user: [item, ...]} or {user: [(item, time vector), ...]}, some users w/o events
+    hist_lens = sample_hist_lens(rng, len(users), mean_len=5, min_len=0)
+    uids, sids, time_stamps = sample_interactions(rng, len(users), 50, hist_lens)
+    u2seq = {user: [] for user in users}
+    for uid, sid, ts in zip(uids.tolist(), sids.tolist(), time_stamps.tolist()):
+        u2seq[users[uid]].append((sid + 1, [ts % 7, ts % 24, ts % 60, ts % 59]) if w_time_stamps else sid + 1)
+    return u2seq
+
+
+def assert_splits_equal(split, expected):
+    for attr in ['users', 'offsets', 'items', 'time_stamps']:
+        if getattr(expected, attr) is None:
+            assert getattr(split, attr) is None
+        else:
+            np.testing.assert_array_equal(getattr(split, attr), getattr(expected, attr))
+
+
+@pytest.mark.parametrize('w_time_stamps', [True, False])
+def test_update_matches_merged_dict(tmp_path, w_time_stamps):
+    rng = np.random.default_rng(0)
+    u2seq = synthetic_u2seq(rng, list(range(100)), w_time_stamps)
+    # replaced & new users
+    changed = synthetic_u2seq(rng, list(range(50, 150, 3)), w_time_stamps)
+    drop = [0, 7, 49, 97, 200]
+
+    merged = dict(u2seq)
+    merged.update(changed)
+    for user in drop:
+        merged.pop(user, None)
+    expected = ColumnarSplit.from_dict(merged)
+
+    ColumnarSplit.from_dict(u2seq).save(tmp_path, 'train')
+    split = ColumnarSplit.load(tmp_path, 'train')
+    assert_splits_equal(split.update(changed, drop=drop), expected)
+    assert_splits_equal(split.update(ColumnarSplit.from_dict(changed), drop=drop), expected)
+
+
+def test_update_adds_time_stamps_to_empty_split():
+    changed = synthetic_u2seq(np.random.default_rng(0), list(range(20)), True)
+    split = ColumnarSplit.from_dict({}).update(changed)
+    assert_splits_equal(split, ColumnarSplit.from_dict(changed))
@@ -0,0 +1,63 @@
+import pickle
+from argparse import Namespace
+
+import numpy as np
+import pytest
+
+from datasets.dpg import DPG_Nov19Dataset
+from source.preprocessing.get_dpg_data_sample import time_stamp2unix
+from source.preprocessing.synthetic_data import generate_dpg_records, write_dpg_sample
+
+TIME_THRESHOLD = "23-11-2019 23:59:59"
+
+
+def make_dataset(sample_folder, engine, incl_time_stamp=True):
+    args = Namespace(split='time_threshold', min_hist_len=5, use_article_content=False, pt_news_encoder=None,
+                     incl_time_stamp=incl_time_stamp, len_time_vec=4, dataloader_random_seed=0.0,
+                     train_method='masked_item', time_threshold=TIME_THRESHOLD, normalise_time_stamps='standard',
+                     validation_portion=0.1, dpg_increment_path=None, dpg_prep_engine=engine)
+    dataset = DPG_Nov19Dataset(args)
+    dataset.sampledata_folder_path = str(sample_folder)
+    return dataset
+
+
+def as_dict(split):
+    return {user: split[user] for user in split}
+
+
+@pytest.fixture
+def sample(tmp_path):
+    user_records, item_records = generate_dpg_records(200, 300, mean_hist_len=20, mean_text_len=20, min_hist_len=5)
+    user_data, news_data = write_dpg_sample(tmp_path, user_records, item_records,
+                                            time_stamp2unix(TIME_THRESHOLD, 'DD-MM-YYYY HH:mm:ss'), min_hist_len=5)
+    return tmp_path, user_data, news_data
+
+
+def prep_users(sample_folder, news_data, engine, incl_time_stamp=True):
+    art_id2idx = {art_id: idx for idx, art_id in enumerate(news_data['all'], start=1)}
+    dataset = make_dataset(sample_folder, engine, incl_time_stamp)
+    train, val, test, u_id2idx = dataset.prep_dpg_user_data(None, art_id2idx)
+    return [as_dict(split) for split in (train, val, test)], u_id2idx
+
+
+@pytest.mark.parametrize('incl_time_stamp', [True, False])
+def test_columnar_engine_matches_loop(sample, incl_time_stamp):
+    folder, _, news_data = sample
+    columnar = prep_users(folder, news_data, 'columnar', incl_time_stamp)
+    loop = prep_users(folder, news_data, 'loop', incl_time_stamp)
+    assert len(columnar[1]) > 0
+    assert columnar == loop
+
+
+def test_columnar_engine_matches_loop_without_test_reads(sample):
+    folder, user_data, news_data = sample
+    # a record w/o 'articles_test' is prepared like an empty test period
+    u_id = next(iter(user_data))
+    del user_data[u_id]['articles_test']
+    with folder.joinpath('user_data.pkl').open('wb') as fout:
+        pickle.dump(user_data, fout)
+
+    columnar = prep_users(folder, news_data, 'columnar')
+    loop = prep_users(folder, news_data, 'loop')
+    assert u_id not in columnar[1]
+    assert columnar == loop
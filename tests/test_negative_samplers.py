@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from dataloaders.negative_samplers import NEGATIVE_SAMPLERS
+from dataloaders.negative_samplers.parallel import sample_in_parallel, user_rng
+from datasets.utils import leave_one_out_split
+from source.preprocessing.synthetic_data import sample_hist_lens, sample_interactions
+
+N_USERS, N_ITEMS, SAMPLE_SIZE = 200, 60, 10
+
+
+def as_dict(negative_samples):
+    return {user: negative_samples[user] for user in negative_samples}
+
+
+@pytest.fixture
+def splits():
+    rng = np.random.default_rng(0)
+    hist_lens = sample_hist_lens(rng, N_USERS, mean_len=10, min_len=3)
+    uids, sids, timestamps = sample_interactions(rng, N_USERS, N_ITEMS, hist_lens)
+    return leave_one_out_split(uids, sids + 1, timestamps)
+
+
+def make_sampler(code, splits, save_folder, seq_lengths=None, **kwargs):
+    train, val, test = splits
+    return NEGATIVE_SAMPLERS[code]('test', train, val, test, N_USERS, list(range(1, N_ITEMS + 1)), SAMPLE_SIZE, 7,
+                                   seq_lengths, str(save_folder), **kwargs)
+
+
+def test_popular_engines_match(splits, tmp_path):
+    # user 0 has seen all but 5 items, i.e. gets fewer samples
+    train, val, test = splits
+    splits = train.update({0: list(range(1, N_ITEMS - 4))}), val, test
+
+    python = make_sampler('popular', splits, tmp_path, engine='python').generate_negative_samples()
+    numpy = make_sampler('popular', splits, tmp_path, engine='numpy').generate_negative_samples_numpy(batch_size=16)
+    assert len(python[0]) < SAMPLE_SIZE
+    assert as_dict(numpy) == as_dict(python)
+
+
+@pytest.mark.parametrize('code', ['random', 'popular_proportional'])
+@pytest.mark.parametrize('per_position', [False, True])
+def test_parallel_sampling_independent_of_n_workers(splits, tmp_path, code, per_position):
+    train = splits[0]
+    seq_lengths = dict(zip(train.users.tolist(), train.lengths().tolist())) if per_position else None
+    sampler = make_sampler(code, splits, tmp_path, seq_lengths, engine='numpy')
+
+    # 0 workers: every user drawn in this process from its own generator
+    sampler.prepare_sampling()
+    expected = {}
+    for user in sampler.get_users():
+        samples = sampler.sample_user(user_rng(sampler.seed, user), user)
+        expected[user] = samples.tolist() if per_position else samples[0].tolist()
+
+    for n_workers in [1, 3]:
+        negative_samples = sample_in_parallel(sampler, tmp_path, 'negatives{}'.format(n_workers), n_workers,
+                                              users_per_task=16)
+        assert as_dict(negative_samples) == expected
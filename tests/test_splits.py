@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from datasets.utils import holdout_split, leave_one_out_split
+from source.preprocessing.synthetic_data import sample_hist_lens, sample_interactions
+
+N_USERS = 300
+
+
+def as_dict(split):
+    return {user: split[user] for user in split}
+
+
+@pytest.fixture
+def interactions():
+    # synthetic ratings in random row order, with many ties in the time stamps
+    rng = np.random.default_rng(0)
+    hist_lens = sample_hist_lens(rng, N_USERS, mean_len=10)
+    uids, sids, timestamps = sample_interactions(rng, N_USERS, 100, hist_lens, time_range=(0, 50))
+    order = rng.permutation(len(uids))
+    return uids[order], sids[order] + 1, timestamps[order]
+
+
+def test_leave_one_out_split_matches_loop(interactions):
+    uids, sids, timestamps = interactions
+    train, val, test = {}, {}, {}
+    for user in np.unique(uids).tolist():
+        rows = np.flatnonzero(uids == user)
+        items = sids[rows[np.argsort(timestamps[rows], kind='stable')]].tolist()
+        train[user], val[user], test[user] = items[:-2], items[-2:-1], items[-1:]
+
+    splits = leave_one_out_split(uids, sids, timestamps)
+    assert [as_dict(split) for split in splits] == [train, val, test]
+
+
+def test_holdout_split_matches_loop(interactions):
+    uids, sids, _ = interactions
+    permuted_index = np.random.default_rng(1).permutation(N_USERS)
+    split_user_indices = [permuted_index[:-100], permuted_index[-100:-50], permuted_index[-50:]]
+    expected = [{user: sids[uids == user].tolist() for user in np.unique(uids[np.isin(uids, user_index)]).tolist()}
+                for user_index in split_user_indices]
+
+    splits = holdout_split(uids, sids, split_user_indices)
+    assert [as_dict(split) for split in splits] == expected